@@ -1,18 +1,25 @@
 import asyncio
-import importlib
+import heapq
 import json
 import os
 from pathlib import Path
 import re
-import shutil
 import sys
 import time
 
 from argparse import Namespace
 from typing import Any, AsyncGenerator, Coroutine, List, Union
 from loguru import logger
-from nonebot import on_command, on_shell_command, get_driver, on_message, get_bot
+from nonebot import (
+    on_command,
+    on_shell_command,
+    get_adapter,
+    get_driver,
+    on_message,
+    get_bot,
+)
 from nonebot.adapters.onebot.v11 import (
+    Adapter,
     Bot,
     MessageEvent,
     MessageSegment,
@@ -20,6 +27,7 @@ from nonebot.adapters.onebot.v11 import (
     PrivateMessageEvent,
 )
 from nonebot.matcher import Matcher
+from nonebot.message import event_preprocessor
 from nonebot.plugin import PluginMetadata, inherit_supported_adapters
 from nonebot.adapters.onebot.v11.helpers import HandleCancellation
 from nonebot.params import CommandArg, ShellCommandArgs, Depends
@@ -36,6 +44,42 @@ from .config import config, Config
 from .types import Channel, Session, ToolCallConfig, ToolCallResponse, ToolCallRequest
 from .settings import settings
 from .function import tools_func
+from .cache import ResponseCache
+from .memory import MemoryStore
+from .cassette import Cassette
+from .channel import ChannelStates
+from .pools import HTTPPool, Timeouts
+from .prober import ChannelProber
+from .router import ModelRouter
+from .dedup import DEDUP_STATE_KEY, EventDeduplicator
+from .workers import WorkerConnection, WorkerPool
+from .state import StateError, shared_state
+from .tracing import tracer
+from .logs import event_log
+from .profiling import MemoryProfiler
+from .watcher import FileWatcher
+from .status import (
+    cache_status,
+    channel_status,
+    format_bytes,
+    router_status,
+    session_status,
+    sessions_overview,
+)
+from .watchdog import setup_watchdog
+from .metrics import (
+    BREAKER_VALUES,
+    CACHE_HIT_RATE,
+    CACHE_REQUESTS,
+    CACHE_SIZE,
+    CHANNEL_BREAKER,
+    CHANNEL_IN_FLIGHT,
+    RETAINED_BYTES,
+    SESSIONS,
+    TURNS_IN_FLIGHT,
+    registry,
+    setup_exporter,
+)
 
 
 __plugin_meta__ = PluginMetadata(
@@ -57,58 +101,355 @@ openai_client = OpenAIClient(
     channels=settings.channels,
     tool_func=tools_func,
     default_model=config.openai_default_model,
+    response_cache=ResponseCache(
+        max_size=config.openai_response_cache_size,
+        ttl=config.openai_response_cache_ttl,
+        similarity=config.openai_response_cache_similarity,
+    )
+    if config.openai_response_cache
+    else None,
+    memory=MemoryStore(
+        path=Path(config.openai_data_path) / "memory",
+        embedding_model=config.openai_memory_embedding_model,
+        top_k=config.openai_memory_top_k,
+        min_score=config.openai_memory_min_score,
+    )
+    if config.openai_memory
+    else None,
+    cassette=Cassette(
+        path=Path(
+            config.openai_cassette_path
+            or os.path.join(config.openai_data_path, "cassette.jsonl")
+        ),
+        mode=config.openai_cassette_mode,
+        speed=config.openai_cassette_speed,
+    )
+    if config.openai_cassette_mode
+    else None,
+    channel_states=ChannelStates(
+        failure_threshold=config.openai_breaker_failures,
+        cooldown=config.openai_breaker_cooldown,
+    ),
+    llm_pool=HTTPPool(
+        "llm",
+        max_connections=config.openai_llm_pool_max_connections,
+        max_keepalive=config.openai_llm_pool_max_keepalive,
+        keepalive_expiry=config.openai_llm_pool_keepalive_expiry,
+        http2=config.openai_llm_pool_http2,
+    ),
+    tool_pool=HTTPPool(
+        "tool",
+        max_connections=config.openai_tool_pool_max_connections,
+        max_keepalive=config.openai_tool_pool_max_keepalive,
+        keepalive_expiry=config.openai_tool_pool_keepalive_expiry,
+        http2=config.openai_tool_pool_http2,
+    ),
+    timeouts=Timeouts(
+        connect=config.openai_timeout_connect,
+        chat=config.openai_timeout_chat,
+        tts=config.openai_timeout_tts,
+        image=config.openai_timeout_image,
+        tool=config.openai_timeout_tool,
+    ),
+)
+router = (
+    ModelRouter(
+        fast_model=config.openai_router_fast_model,
+        strong_model=config.openai_router_strong_model,
+        vision_model=config.openai_router_vision_model,
+        long_chars=config.openai_router_long_chars,
+        keywords=config.openai_router_keywords,
+        tool_keywords=config.openai_router_tool_keywords,
+        sticky=config.openai_router_sticky,
+    )
+    if config.openai_router
+    else None
+)
+deduplicator = EventDeduplicator(
+    window=config.openai_dedup_window, max_size=config.openai_dedup_size
 )
 driver = get_driver()
+# 多进程模式下主进程只把消息事件转发给 worker，不加载会话和工具
+front = config.openai_workers > 0 and config.openai_worker_index < 0
+
+
+def worker_file(path: str) -> str:
+    """worker 进程使用带序号的文件名，避免多个进程写同一个文件"""
+    if config.openai_worker_index < 0 or not path:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.worker{config.openai_worker_index}{ext}"
+
+
+# 工具文件复制到的包，worker 进程各自使用独立的包目录，避免同时写入和导入同一个文件
+CACHE_FUNC = (
+    f"cache_func_worker{config.openai_worker_index}"
+    if config.openai_worker_index >= 0
+    else "cache_func"
+)
+CACHE_FUNC_DIR = os.path.join(Path(__file__).parent, CACHE_FUNC)
+
+
+@driver.on_shutdown
+async def close_http_clients():
+    await openai_client.aclose()
+
+
+@driver.on_shutdown
+async def close_shared_state():
+    # 等待排队中的写入完成
+    await shared_state.close()
+
+
+@registry.collector
+def collect_metrics():
+    for state in openai_client.channel_states.values():
+        yield CHANNEL_BREAKER, {"channel": state.name}, BREAKER_VALUES[state.breaker]
+        yield CHANNEL_IN_FLIGHT, {"channel": state.name}, state.in_flight
+    yield SESSIONS, {}, len(settings.sessions)
+    yield TURNS_IN_FLIGHT, {}, sum(
+        1 for session in settings.sessions.values() if session.running
+    )
+    if openai_client.response_cache:
+        stats = openai_client.response_cache.stats()
+        for result in ("hits", "near_hits", "misses"):
+            yield CACHE_REQUESTS, {"cache": "response", "result": result}, stats[result]
+        yield CACHE_HIT_RATE, {"cache": "response"}, stats["hit_rate"]
+        yield CACHE_SIZE, {"cache": "response"}, stats["size"]
+
+
+profiler = MemoryProfiler(
+    path=Path(config.openai_data_path) / "memprof",
+    module_prefix=f"{__name__}.{CACHE_FUNC}",
+    interval=config.openai_memprof_interval,
+)
+
+
+@profiler.component("presets")
+def _():
+    yield from settings.presets.items()
+    if settings.default_preset:
+        yield settings.default_preset.name, settings.default_preset
+
+
+@profiler.component("sessions")
+def _():
+    # 按预设汇总会话的占用
+    for session in settings.sessions.values():
+        yield session.preset.name if session.preset else "", session
+
+
+@profiler.component("caches")
+def _():
+    yield "response", openai_client.response_cache
+    yield "request_body", openai_client.body_builder
+    yield "memory_index", openai_client.memory and openai_client.memory.indexes
+    yield "tool_schemas", tools_func.tools
+    yield "trigger", settings._trigger
+    yield "traces", tracer.recent
+    yield "channel_states", openai_client.channel_states
+
+
+@profiler.component("tool_modules")
+def _():
+    for name, module in list(sys.modules.items()):
+        if name.startswith(profiler.module_prefix + ".") and module:
+            yield name.rsplit(".", 1)[-1], module
+
+
+@registry.collector
+def collect_memory():
+    # 只读取缓存的结果，过期时在线程中重新统计，下一次导出时生效
+    profiler.refresh()
+    for (component, name), size in profiler.sizes.items():
+        yield RETAINED_BYTES, {"component": component, "name": name}, size
+
+
+setup_exporter(
+    path=config.openai_metrics_path,
+    file=worker_file(config.openai_metrics_file),
+    interval=config.openai_metrics_interval,
+)
+if config.openai_trace:
+    tracer.setup(
+        path=Path(
+            worker_file(
+                config.openai_trace_path
+                or os.path.join(config.openai_data_path, "traces.jsonl")
+            )
+        ),
+        max_bytes=config.openai_trace_max_bytes,
+        backups=config.openai_trace_backups,
+        recent=config.openai_trace_recent,
+    )
+if config.openai_watchdog:
+    setup_watchdog(
+        interval=config.openai_watchdog_interval,
+        threshold=config.openai_watchdog_threshold,
+        log_interval=config.openai_watchdog_log_interval,
+        cache_dir=CACHE_FUNC_DIR,
+    )
+
+
+CACHE_FUNC_INIT = (
+    "from ..types import ToolCallResponse, ToolCallConfig, FuncContext\n"
+    "from ..function import tools_func"
+)
 
 
 @driver.on_startup
-async def load_func():
-    from importlib import reload
+async def load_config():
+    if front:
+        return
+    # 会话较多时解析 settings.json 比较耗时，推迟到启动时进行，不拖慢插件的导入
+    await reload_settings()
+    await reload_tool_config()
+
+
+async def reload_settings():
+    settings.reload()
+    if shared_state.remote:
+        await shared_state.pull_settings(settings)
+
 
+async def reload_tool_config():
+    tools_func.reload()
+    if shared_state.remote:
+        await shared_state.pull_tool_config(tools_func)
+
+
+@driver.on_startup
+async def load_func():
+    if front:
+        return
+    reset = False
     for session in settings.sessions.values():
+        reset = reset or session.running
         session.running = False
+    await load_tools()
+    if reset:
+        settings.save()
+
+
+async def load_tools():
+    registered = set(tools_func.tool_config)
+    tools_func.apply_config()
     tools_func.register(openai_client.tts, ToolCallConfig(name="TTS"))
     tools_func.register(openai_client.gen_image, ToolCallConfig(name="DALL-E"))
     tools_func.register(openai_client.vision, ToolCallConfig(name="Vision"))
-    # 从config.openai_data_path配置的文件夹中的func文件夹中读取出所有开头为func的文件名
+    # 从config.openai_data_path配置的文件夹中的func文件夹中读取出所有开头为func的文件
     func_dir = os.path.join(config.openai_data_path, "func")
     if not os.path.exists(func_dir):
         os.makedirs(func_dir)
-    func_files = [
-        f for f in os.listdir(func_dir) if f.startswith("func") and f.endswith(".py")
-    ]
 
-    # 将func文件夹中的所有文件复制进入cache_func目录
-    cache_dir = os.path.join(Path(__file__).parent, "cache_func")
+    # 只复制和重新导入内容发生变化的文件
+    cache_dir = CACHE_FUNC_DIR
     if not os.path.exists(cache_dir):
         os.makedirs(cache_dir)
-    with open(os.path.join(cache_dir, "__init__.py"), "w") as f:
-        f.write(
-            "from ..types import ToolCallResponse, ToolCallConfig, FuncContext\nfrom ..function import tools_func"
+    init_file = Path(cache_dir) / "__init__.py"
+    if not init_file.is_file() or init_file.read_text() != CACHE_FUNC_INIT:
+        init_file.write_text(CACHE_FUNC_INIT)
+    changed = tools_func.load_modules(
+        func_dir, cache_dir, f"{__package__}.{CACHE_FUNC}"
+    )
+    if changed or set(tools_func.tool_config) != registered:
+        tools_func.save()
+
+
+if config.openai_watch and not front:
+    watcher = FileWatcher(
+        interval=config.openai_watch_interval, debounce=config.openai_watch_debounce
+    )
+
+    @driver.on_startup
+    async def _():
+        func_dir = Path(config.openai_data_path) / "func"
+        func_dir.mkdir(parents=True, exist_ok=True)
+
+        async def on_func_change(files):
+            logger.info(f"[Watcher] 工具文件变化: {', '.join(f.name for f in files)}")
+            await load_tools()
+
+        def on_settings_change(files):
+            if settings.apply_file():
+                logger.info("[Watcher] 已应用 settings.json 中渠道和预设的修改")
+                if shared_state.remote:
+                    settings.save()
+
+        def on_tool_config_change(files):
+            if tools_func.apply_file():
+                logger.info("[Watcher] 已应用 tool_config.json 的修改")
+                if shared_state.remote:
+                    tools_func.save()
+
+        watcher.watch(func_dir, on_func_change, pattern="func*.py")
+        watcher.watch(
+            settings.file_path,
+            on_settings_change,
+            ignore=lambda file, signature: settings.is_written(signature),
         )
-    for func_file in func_files:
-        shutil.copy(os.path.join(func_dir, func_file), cache_dir)
-
-    # 从当前文件夹cache_func文件夹中
-    for func_file in func_files:
-        module_name, _ = os.path.splitext(func_file)  # remove .py extension
-        module = f"{__package__}.cache_func.{module_name}"
-        if sys.modules.get(module):
-            reload(sys.modules[module])
-        else:
-            importlib.import_module(module)
-    tools_func.save()
-    settings.save()
+        watcher.watch(
+            tools_func.file_path,
+            on_tool_config_change,
+            ignore=lambda file, signature: tools_func.is_written(signature),
+        )
+        watcher.start()
+
+    @driver.on_shutdown
+    async def _():
+        watcher.stop()
+
+
+if not front and not config.openai_cassette_mode and (
+    config.openai_warmup_connections > 0 or config.openai_probe_interval > 0
+):
+    prober = ChannelProber(
+        openai_client,
+        interval=config.openai_probe_interval,
+        timeout=config.openai_probe_timeout,
+        connections=config.openai_warmup_connections,
+    )
+
+    @driver.on_startup
+    async def _():
+        # 在加载渠道之后后台预热，不阻塞启动
+        prober.start()
+
+    @driver.on_shutdown
+    async def _():
+        prober.stop()
+
+
+@event_preprocessor
+async def check_duplicate(bot: Bot, event: MessageEvent, state: T_State):
+    # 每个事件只判断一次，结果存入事件的 state，每个事件响应器得到它的副本，不影响其他插件
+    state[DEDUP_STATE_KEY] = deduplicator.check(bot.self_id, event)
+
+
+async def not_duplicate(state: T_State) -> bool:
+    """重复投递的消息不触发任何事件响应器，避免重复请求上游"""
+    return state.get(DEDUP_STATE_KEY, True)
 
 
 def single_run_locker() -> Any:
     async def check_running(
         matcher: Matcher, event: MessageEvent
     ) -> AsyncGenerator[None, None]:
-        session = settings.get_session(event)
-        if session.running:
+        session_id = event.get_session_id()
+        try:
+            lease = await shared_state.lock(session_id)
+        except StateError as e:
+            logger.error(f"[State] 获取会话锁失败: {e}")
+            await matcher.finish("共享状态暂时不可用，请稍后再试", reply_message=True)
+        if lease is None:
             await matcher.finish("我知道你很急，但你先别急", reply_message=True)
-        yield
+        try:
+            if shared_state.remote:
+                # 会话可能刚在其他实例上更新过
+                await shared_state.pull_session(settings, session_id)
+            yield
+        finally:
+            await shared_state.unlock(session_id, lease)
 
     return Depends(check_running)
 
@@ -124,10 +465,13 @@ openai_parser.add_argument("--set-default", help="配置默认预设")
 openai_parser.add_argument("--reload", help="重载配置文件")
 openai_parser.add_argument("--func", help="函数状态管理")
 openai_parser.add_argument("-v", "--view", help="查看状态")
+openai_parser.add_argument("--debug", choices=["on", "off"], help="当前会话的完整日志")
 openai_parser.add_argument(
-    "-m", "--model", help="自定义模型", default=config.openai_default_model
+    "-m", "--model", help="自定义模型，不指定时使用默认模型或自动选择", default=""
+)
+openai = on_shell_command(
+    "openai", aliases=set(["op"]), parser=openai_parser, rule=not_duplicate
 )
-openai = on_shell_command("openai", aliases=set(["op"]), parser=openai_parser)
 
 
 @openai.handle(parameterless=[single_run_locker()])
@@ -154,48 +498,74 @@ async def handle_chat(
     image_url: str = "",
     results: List[Union[ChatCompletionMessage, ToolCallResponse, Exception]] = [],
 ):
-    try:
-        session.running = True
-        if not results:
-            results = await openai_client.chat(
-                session, prompt=text, model=model, image_url=image_url
-            )
-        tasks = []
-        for result in results:
-            if isinstance(result, ToolCallRequest):
-                await matcher.send(f"[Function] 开始调用 {result.config.name} ...")
-                tasks.append(result.func)
-        asyncio.ensure_future(send_msg(bot, event, matcher, results))
-        results.extend(await asyncio.gather(*tasks, return_exceptions=True))
-        asyncio.ensure_future(send_msg(bot, event, matcher, results))
-        for result in results:
-            if isinstance(result, ToolCallResponse) and result.data:
-                results = await openai_client.chat(session=session, model=model)
-                await send_msg(bot, event, matcher, results)
-                break
-        else:
-            results = []
-        if results:
-            await handle_chat(
-                bot, event, matcher, session, model=model, results=results
-            )
-    except Exception as e:
-        logger.opt(exception=e).error(e)
-        await openai.send(f"发生了一些错误: {e}")
-    finally:
-        session.running = False
-        settings.save()
+    with tracer.turn(
+        session.id, event.message_id, queue_s=max(0, int(time.time()) - event.time)
+    ):
+        try:
+            session.running = True
+            if not results:
+                decision = None
+                if not model and router:
+                    decision = router.route(session, text, image_url)
+                    model = decision.model
+                    event_log.event(
+                        "route",
+                        session,
+                        level="DEBUG",
+                        tier=decision.tier,
+                        model=model,
+                        reason=decision.reason,
+                    )
+                start = time.perf_counter()
+                results = await openai_client.chat(
+                    session, prompt=text, model=model, image_url=image_url
+                )
+                if decision:
+                    usage = next(
+                        (r for r in results if isinstance(r, CompletionUsage)), None
+                    )
+                    router.record(decision, time.perf_counter() - start, usage)
+            tasks = []
+            for result in results:
+                if isinstance(result, ToolCallRequest):
+                    await matcher.send(f"[Function] 开始调用 {result.config.name} ...")
+                    tasks.append(result.func)
+            asyncio.ensure_future(send_msg(bot, event, matcher, results))
+            results.extend(await asyncio.gather(*tasks, return_exceptions=True))
+            asyncio.ensure_future(send_msg(bot, event, matcher, results))
+            for result in results:
+                if isinstance(result, ToolCallResponse) and result.data:
+                    results = await openai_client.chat(session=session, model=model)
+                    await send_msg(bot, event, matcher, results)
+                    break
+            else:
+                results = []
+            if results:
+                await handle_chat(
+                    bot, event, matcher, session, model=model, results=results
+                )
+        except Exception as e:
+            logger.opt(exception=e).error(e)
+            await openai.send(f"发生了一些错误: {e}")
+        finally:
+            session.running = False
+            with tracer.span("settings.save"):
+                settings.save(session)
 
 
 async def handle_command(bot: Bot, event: MessageEvent, args: Namespace):
     if args.clear:
         settings.clear_messages(event)
-        settings.save()
+        if openai_client.memory:
+            openai_client.memory.clear(event.get_session_id())
+        settings.save(settings.find_session(event))
         if not args.text:
             await openai.finish("已清空上下文。")
     if args.set:
         session = settings.get_session(event)
         session.preset = settings.get_preset(args.set)
+        settings.refresh_trigger()
+        settings.save(session)
         if session.preset:
             await openai.finish(f"已配置预设 {session.preset.name}")
         else:
@@ -206,10 +576,16 @@ async def handle_command(bot: Bot, event: MessageEvent, args: Namespace):
             preset = settings.get_preset(name)
             if preset:
                 settings.default_preset = preset
+                settings.refresh_trigger()
                 settings.save()
                 await openai.finish(f"已配置默认预设 {preset.name}")
             else:
                 await openai.finish(f"预设 {args.set} 不存在.")
+        if args.debug:
+            event_log.set_debug(event.get_session_id(), args.debug == "on")
+            await openai.finish(
+                f"已{'开启' if args.debug == 'on' else '关闭'}当前会话的完整日志。"
+            )
         if args.func:
             command = args.func
             if args.text:
@@ -245,14 +621,14 @@ async def handle_command(bot: Bot, event: MessageEvent, args: Namespace):
                     await openai.finish("指令错误。")
         if args.reload:
             if args.reload == "all":
-                settings.reload()
-                tools_func.reload()
+                await reload_settings()
+                await reload_tool_config()
                 await load_func()
             elif args.reload == "func":
-                tools_func.reload()
+                await reload_tool_config()
                 await load_func()
             elif args.reload == "config":
-                settings.reload()
+                await reload_settings()
             else:
                 await openai.finish("参数错误。")
             await openai.finish("已重载配置文件。")
@@ -263,9 +639,11 @@ async def handle_command(bot: Bot, event: MessageEvent, args: Namespace):
             name = args_parts[0]
             content = " ".join(args_parts[1:])
             settings.add_preset(name, content)
+            settings.save()
             await openai.finish(f"已编辑预设 {name} 。")
         if args.delete:
             settings.del_preset(args.delete)
+            settings.save()
             await openai.finish(f"已删除预设 {args.delete} 。")
         if args.view:
             if args.view == "preset":
@@ -279,9 +657,95 @@ async def handle_command(bot: Bot, event: MessageEvent, args: Namespace):
                     preset_names = [preset for preset in settings.presets]
                     await openai.finish("预设列表：\n" + "\n".join(preset_names))
             elif args.view == "session":
-                pass
+                if args.text:
+                    session = settings.sessions.get(args.text[0])
+                    if not session:
+                        await openai.finish(f"会话 {args.text[0]} 不存在。")
+                else:
+                    # 只查看状态，不为没有对话过的用户创建会话
+                    session = settings.find_session(event)
+                    if not session:
+                        await openai.finish("当前会话不存在。")
+                await openai.finish(
+                    session_status(session, openai_client.memory)
+                    + "\n\n"
+                    + sessions_overview(settings.sessions)
+                )
             elif args.view == "channel":
-                pass
+                await openai.finish(
+                    channel_status(openai_client.channel_states.values())
+                    + "\n\n"
+                    + cache_status(openai_client.response_cache)
+                )
+            elif args.view == "router":
+                await openai.finish(router_status(router))
+            elif args.view == "memory":
+                command = args.text[0] if args.text else ""
+                if command == "snapshot":
+                    path = profiler.snapshot()
+                    await openai.finish(
+                        f"已保存快照 {path}，之后使用 -v memory diff 对比。"
+                    )
+                elif command == "diff":
+                    try:
+                        path, lines = profiler.diff()
+                    except RuntimeError as e:
+                        await openai.finish(f"{e}，请先使用 -v memory snapshot。")
+                    await openai.finish(
+                        f"增长最多的内存分配（完整结果见 {path}）：\n" + "\n".join(lines)
+                    )
+                sizes = profiler.measure()
+                msg = "内存占用（估算）："
+                for component in profiler.components:
+                    items = sorted(
+                        (
+                            (size, name)
+                            for (key, name), size in sizes.items()
+                            if key == component
+                        ),
+                        reverse=True,
+                    )
+                    total = sum(size for size, _ in items)
+                    msg += f"\n{component}: {format_bytes(total)}"
+                    msg += "".join(
+                        f"\n    {name or '无'}: {format_bytes(size)}"
+                        for size, name in items[:5]
+                    )
+                largest = heapq.nlargest(
+                    5,
+                    profiler.session_sizes(
+                        settings.sessions.values(),
+                        exclude=list(settings.presets.values())
+                        + [settings.default_preset],
+                    ),
+                    key=lambda item: item[0],
+                )
+                if largest:
+                    msg += "\n最大的会话："
+                    msg += "".join(
+                        f"\n    {session.id}: {format_bytes(size)}"
+                        for size, session in largest
+                    )
+                await openai.finish(msg)
+            elif args.view == "trace":
+                if args.text and not str(args.text[0]).isdigit():
+                    await openai.finish("参数错误。")
+                traces = tracer.slowest(int(args.text[0]) if args.text else 5)
+                if not traces:
+                    await openai.finish("没有追踪记录，请确认已开启 openai_trace。")
+                msg = "最慢的对话："
+                for trace in traces:
+                    stages = sorted(
+                        trace.stages().items(), key=lambda item: item[1], reverse=True
+                    )
+                    msg += (
+                        f"\n{trace.duration:.2f}s {trace.session_id} "
+                        f"#{trace.message_id} ({trace.trace_id})"
+                    )
+                    msg += "".join(
+                        f"\n    {name}: {duration:.2f}s" for name, duration in stages
+                    )
+                await openai.finish(msg)
             else:
                 await openai.finish("参数错误。")
 
@@ -291,6 +755,16 @@ async def send_msg(
     event: MessageEvent,
     matcher: Matcher,
     results: List[Union[ChatCompletionMessage, ToolCallResponse, Exception]],
+):
+    with tracer.span("send_msg", results=len(results)):
+        return await _send_msg(bot, event, matcher, results)
+
+
+async def _send_msg(
+    bot: Bot,
+    event: MessageEvent,
+    matcher: Matcher,
+    results: List[Union[ChatCompletionMessage, ToolCallResponse, Exception]],
 ):
     forward_messages = []
     text_messages = []
@@ -332,7 +806,13 @@ async def send_msg(
         elif isinstance(result, Exception):
             await matcher.send(f"发生了一些错误：{result}", reply_message=True)
         elif isinstance(result, CompletionUsage):
-            logger.info(f"花费: {result}")
+            event_log.event(
+                "usage",
+                event.get_session_id(),
+                prompt_tokens=result.prompt_tokens,
+                completion_tokens=result.completion_tokens,
+                total_tokens=result.total_tokens,
+            )
             if text_messages:
                 text_messages.append(f"total_tokens: {result.total_tokens}")
         else:
@@ -354,15 +834,14 @@ async def send_msg(
         return await matcher.send("\n".join(text_messages), reply_message=True)
 
 
-message = on_message(priority=5, block=False)
+message = on_message(rule=not_duplicate, priority=5, block=False)
 
 
 @message.handle()
 async def pre_check(bot: Bot, matcher: Matcher, event: MessageEvent, state: T_State):
-    session = settings.get_session(event)
-    preset = session.preset
     text = event.get_plaintext().strip()
-    if preset and preset.name in text:
+    # 先用触发词索引过滤，只有真正触发时才创建会话
+    if settings.match_trigger(event, text):
         state["text"] = text
         matcher.stop_propagation()
         return True
@@ -393,7 +872,9 @@ tts_parser.add_argument(
     "-m", "--model", default="tts-1", choices=["tts-1", "tts-1-hd"], help="选择模型"
 )
 tts_parser.add_argument("-s", "--speed", type=float, default=1.0, help="设定语速")
-tts = on_shell_command("tts", priority=5, block=True, parser=tts_parser)
+tts = on_shell_command(
+    "tts", rule=not_duplicate, priority=5, block=True, parser=tts_parser
+)
 
 
 @tts.handle()
@@ -434,7 +915,9 @@ dalle_parser.add_argument(
 dalle_parser.add_argument(
     "-s", "--style", default="vivid", choices=["vivid", "natural"], help="选择风格"
 )
-dalle = on_shell_command("dalle", priority=5, block=True, parser=dalle_parser)
+dalle = on_shell_command(
+    "dalle", rule=not_duplicate, priority=5, block=True, parser=dalle_parser
+)
 
 
 @dalle.handle()
@@ -452,3 +935,50 @@ async def generate_image(
         " ".join(args.prompt), size=size, quality=quality, style=style
     )
     await send_msg(bot, event, dalle, [result])
+
+
+if front:
+    worker_pool = WorkerPool(
+        workers=config.openai_workers,
+        plugin=__name__,
+        config=dict(
+            {
+                key: value
+                for key, value in driver.config.dict().items()
+                if key not in ("host", "port")
+            },
+            driver="~none",
+        ),
+    )
+    # 插件的命令和对话都在 worker 中处理
+    for matcher in (openai, message, tts, dalle):
+        matcher.destroy()
+    # 在主进程中去重，重复投递的消息不会转发给 worker
+    forward = on_message(rule=not_duplicate, priority=1, block=False)
+
+    @forward.handle()
+    async def _(bot: Bot, event: MessageEvent):
+        worker_pool.dispatch(bot, event)
+
+    @driver.on_startup
+    async def _():
+        await worker_pool.start()
+
+    @driver.on_shutdown
+    async def _():
+        await worker_pool.stop()
+
+elif config.openai_worker_index >= 0:
+
+    @driver.on_startup
+    async def _():
+        connection = await WorkerConnection.connect(
+            get_adapter(Adapter), config.openai_worker_index
+        )
+
+        async def serve():
+            await connection.serve()
+            logger.warning("[Worker] 与主进程的连接已断开，退出")
+            driver.exit()
+
+        asyncio.ensure_future(serve())
@@ -2,8 +2,10 @@ import asyncio
 from io import BytesIO
 import json
 import random
+import time
 
-from typing import List, Literal, Dict, Union
+from collections import OrderedDict
+from typing import Any, List, Literal, Dict, Optional, Tuple, Union
 from openai import AsyncOpenAI
 from openai.types.chat import (
     ChatCompletionMessageToolCall,
@@ -15,14 +17,18 @@ from openai.types.chat import (
     ChatCompletionMessage,
     ChatCompletion,
 )
+from openai.types.completion_usage import CompletionUsage
 from openai._exceptions import APIStatusError
-from httpx import AsyncClient
+from httpx import AsyncClient, Response
 from pydantic import BaseModel
 from loguru import logger
 
 from .types import (
     Channel,
+    ChatMessage,
+    Preset,
     Session,
+    memory_message,
     ToolCall,
     ToolCallConfig,
     ToolCallResponse,
@@ -30,6 +36,133 @@ from .types import (
     FuncContext,
 )
 from .function import ToolsFunction
+from .cache import ResponseCache
+from .memory import MemoryStore
+from .tracing import tracer
+from .logs import event_log
+from .cassette import Cassette
+from .channel import ChannelStates
+from .pools import HTTPPool, Timeouts
+from .capability import OUTPUT_RESERVE, CapabilityRegistry, fit_window
+from .utils import estimate_tokens
+from .metrics import TOKENS, UPSTREAM_LATENCY, UPSTREAM_RETRIES
+
+# 直接发送请求体时需要用到 SDK 的两个内部函数，按 openai 1.3.x 的实现使用，
+# 不存在时退回到公开的接口：错误的类型只区分状态码，回复经过完整的校验
+try:
+    from openai._models import construct_type
+except ImportError:  # pragma: no cover
+    construct_type = None
+
+
+def status_error(client: AsyncOpenAI, response: Response) -> APIStatusError:
+    """把错误的响应转换为 SDK 的异常，与 SDK 自己抛出的异常类型一致"""
+    make_error = getattr(client, "_make_status_error_from_response", None)
+    if make_error is not None:
+        return make_error(response)
+    try:
+        body = response.json()
+    except ValueError:
+        body = response.text
+    return APIStatusError(
+        f"Error code: {response.status_code} - {body}", response=response, body=body
+    )
+
+
+def parse_chat_completion(data: Dict[str, Any]) -> ChatCompletion:
+    """不校验地构造 ChatCompletion，与 SDK 解析响应的方式一致"""
+    if construct_type is not None:
+        return construct_type(type_=ChatCompletion, value=data)
+    return ChatCompletion(**data)
+
+
+class ChatBodyBuilder:
+    """
+    ChatBodyBuilder 用于增量拼接 chat/completions 的请求体。
+
+    历史消息序列化后的 JSON 缓存在 ChatMessage 上，预设的 system 消息按提示词缓存，
+    工具列表在未变更时复用上一次的序列化结果，因此每轮只需要序列化新增的消息。
+
+    Attributes:
+        max_presets (int): 最多缓存的预设 system 消息数，超出后淘汰最久未使用的。
+    """
+
+    def __init__(self, max_presets: int = 128):
+        self.max_presets = max_presets
+        self.preset_fragments: "OrderedDict[str, str]" = OrderedDict()
+        self._tools: List[dict] = []
+        self._tools_key: Optional[Tuple[int, ...]] = None
+        self._tools_fragment: str = ""
+        self._tools_tokens: int = 0
+
+    @staticmethod
+    def dumps(obj: Any) -> str:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+    def preset_fragment(self, preset: Preset) -> str:
+        # 使用同一预设的会话共享缓存，数量只与不同的提示词有关
+        fragment = self.preset_fragments.get(preset.prompt)
+        if fragment is not None:
+            self.preset_fragments.move_to_end(preset.prompt)
+            return fragment
+        fragment = self.dumps({"content": preset.prompt, "role": "system"})
+        self.preset_fragments[preset.prompt] = fragment
+        if len(self.preset_fragments) > self.max_presets:
+            self.preset_fragments.popitem(last=False)
+        return fragment
+
+    def tools_fragment(self, tools: List[dict]) -> str:
+        key = tuple(id(tool) for tool in tools)
+        if key != self._tools_key:
+            self._tools_fragment = self.dumps(tools)
+            # 持有引用，避免 id 被新的工具信息复用
+            self._tools = tools
+            self._tools_key = key
+            self._tools_tokens = estimate_tokens(self._tools_fragment)
+        return self._tools_fragment
+
+    def tools_tokens(self, tools: List[dict]) -> int:
+        """工具列表估算的 token 数，与序列化结果一起缓存"""
+        self.tools_fragment(tools)
+        return self._tools_tokens
+
+    def build(
+        self,
+        session: Session,
+        messages: List[ChatMessage],
+        preset: Optional[Preset] = None,
+        memories: Optional[List[str]] = None,
+        tools: Optional[List[dict]] = None,
+        **params: Any,
+    ) -> bytes:
+        """
+        拼接请求体。
+
+        参数:
+            session (Session): 当前的会话对象。
+            messages (List[ChatMessage]): 需要发送的历史消息。
+            preset (Optional[Preset]): 作为 system 消息的预设。
+            memories (Optional[List[str]]): 注入的长期记忆。
+            tools (Optional[List[dict]]): 工具列表。
+            **params: 其他请求参数，值为 None 的参数会被忽略。
+
+        返回:
+            bytes: JSON 格式的请求体。
+        """
+        fragments = [message.serialized for message in messages]
+        if memories:
+            fragments.insert(0, self.dumps(memory_message(memories)))
+        if preset:
+            fragments.insert(0, self.preset_fragment(preset))
+        body = ['{"messages":[', ",".join(fragments), "]"]
+        if tools:
+            body.append(',"tools":')
+            body.append(self.tools_fragment(tools))
+        for key, value in params.items():
+            if value is not None:
+                body.append(f",{self.dumps(key)}:{self.dumps(value)}")
+        body.append("}")
+        return "".join(body).encode("utf-8")
 
 
 class OpenAIClient:
@@ -39,21 +172,157 @@ class OpenAIClient:
         channels: List[Channel],
         tool_func: ToolsFunction,
         default_model: str = "gpt-3.5-turbo",
+        response_cache: Optional[ResponseCache] = None,
+        memory: Optional[MemoryStore] = None,
+        cassette: Optional[Cassette] = None,
+        channel_states: Optional[ChannelStates] = None,
+        llm_pool: Optional[HTTPPool] = None,
+        tool_pool: Optional[HTTPPool] = None,
+        timeouts: Optional[Timeouts] = None,
+        capabilities: Optional[CapabilityRegistry] = None,
     ):
+        self.base_url = base_url
         self.channels = channels
-        self.http_client = AsyncClient(base_url=base_url, follow_redirects=True)
+        self.channel_states = channel_states or ChannelStates()
+        self.cassette = cassette
+        self.llm_pool = llm_pool or HTTPPool("llm")
+        self.tool_pool = tool_pool or HTTPPool(
+            "tool", max_connections=20, max_keepalive=10
+        )
+        self.timeouts = timeouts or Timeouts()
+        self.capabilities = capabilities or CapabilityRegistry()
+        self._http_client: Optional[AsyncClient] = None
+        self._tool_http_client: Optional[AsyncClient] = None
+        self._openai_clients: Dict[
+            Tuple[str, Optional[str], Optional[str]], AsyncOpenAI
+        ] = {}
         self.tool_func = tool_func
+        self.tool_func.use_cassette(cassette)
         self.default_model = default_model
+        self.body_builder = ChatBodyBuilder()
+        self.response_cache = response_cache
+        self.memory = memory
 
-    def init_client(self, channel: Channel):
-        client = AsyncOpenAI(**channel.dict(), http_client=self.http_client)
+    @property
+    def http_client(self) -> AsyncClient:
+        """上游 LLM 请求使用的连接池，首次使用时才创建，导入插件时不需要加载 httpcore"""
+        if self._http_client is None:
+            self._http_client = self.llm_pool.client(
+                self.timeouts.get("chat"),
+                base_url=self.base_url,
+                wrap=self.cassette.transport if self.cassette else None,
+            )
+        return self._http_client
+
+    @http_client.setter
+    def http_client(self, http_client: AsyncClient) -> None:
+        self._http_client = http_client
+        self._openai_clients.clear()
+
+    @property
+    def tool_http_client(self) -> AsyncClient:
+        """通过 FuncContext 提供给工具的连接池，与上游请求的连接互不占用"""
+        if self._tool_http_client is None:
+            self._tool_http_client = self.tool_pool.client(self.timeouts.get("tool"))
+        return self._tool_http_client
+
+    @tool_http_client.setter
+    def tool_http_client(self, http_client: AsyncClient) -> None:
+        self._tool_http_client = http_client
+
+    async def aclose(self) -> None:
+        for client in (self._http_client, self._tool_http_client):
+            if client is not None:
+                await client.aclose()
+        self._http_client = self._tool_http_client = None
+        self._openai_clients.clear()
+
+    def init_client(self, channel: Channel) -> AsyncOpenAI:
+        """按渠道复用 AsyncOpenAI，渠道的密钥或地址修改后会创建新的客户端"""
+        key = (channel.api_key, channel.base_url, channel.organization)
+        client = self._openai_clients.get(key)
+        if client is None:
+            if len(self._openai_clients) >= max(len(self.channels) * 2, 8):
+                self._openai_clients.clear()
+            client = self._openai_clients[key] = AsyncOpenAI(
+                **channel.dict(include={"api_key", "base_url", "organization"}),
+                http_client=self.http_client,
+                timeout=self.timeouts.get("chat"),
+            )
         return client
 
+    async def list_models(self, channel: Channel, timeout: float) -> Response:
+        """请求渠道的 /models，用于预热连接和探测渠道状态"""
+        client = self.init_client(channel)
+        return await self.http_client.get(
+            f"{str(client.base_url).rstrip('/')}/models",
+            headers=self.request_headers(client),
+            timeout=timeout,
+        )
+
+    def serving_channels(self, model: str = "") -> List[Channel]:
+        if not model:
+            return self.channels
+        return [
+            channel
+            for channel in self.channels
+            if self.capabilities.serves(channel, model)
+        ]
+
+    def pick_channel(self, model: str = "") -> Optional[Channel]:
+        """
+        从提供 model 的渠道中随机选择一个未熔断的渠道，全部熔断时从这些渠道中选择。
+
+        没有渠道提供 model 时返回 None，model 为空时从所有渠道中选择。
+        """
+        serving = self.serving_channels(model)
+        if not serving:
+            return None
+        channels = [
+            channel
+            for channel in serving
+            if self.channel_states.get(channel, self.channels).available
+        ]
+        return random.choice(channels or serving)
+
     @property
     def client(self):
-        channel = random.choice(self.channels)
+        channel = self.pick_channel()
         return self.init_client(channel)
 
+    def client_for(self, model: str) -> Optional[AsyncOpenAI]:
+        """提供 model 的渠道的客户端，没有时返回 None"""
+        channel = self.pick_channel(model)
+        return self.init_client(channel) if channel else None
+
+    @staticmethod
+    def request_headers(client: AsyncOpenAI) -> Dict[str, str]:
+        """渠道请求需要的头，包括鉴权，SDK 中表示省略的值会被去掉"""
+        return {
+            key: value
+            for key, value in client.default_headers.items()
+            if isinstance(value, str)
+        }
+
+    async def create_chat_completion(
+        self, client: AsyncOpenAI, body: bytes
+    ) -> ChatCompletion:
+        """
+        使用预先拼接好的请求体调用 chat/completions，跳过 SDK 对整个请求的重新序列化。
+
+        不经过 SDK 的请求流程，也就没有 SDK 内置的重试和退避，失败后由 chat_completions 换渠道重试。
+        """
+        response = await self.http_client.post(
+            f"{str(client.base_url).rstrip('/')}/chat/completions",
+            content=body,
+            headers=self.request_headers(client),
+            timeout=self.timeouts.get("chat"),
+        )
+        if response.is_error:
+            await response.aread()
+            raise status_error(client, response)
+        return parse_chat_completion(response.json())
+
     async def chat(
         self,
         session: Session,
@@ -65,17 +334,57 @@ class OpenAIClient:
         if not model:
             model = self.default_model
         if prompt:
-            session.messages.append(
+            session.add_message(
                 ChatCompletionUserMessageParam(
                     role="user",
                     content=(prompt + f"\n![img]({image_url})") if image_url else prompt,
                 )
             )
-        results = await self.chat_completions(
-            session=session, model=model, tool_choice=tool_choice
-        )
+        cacheable = bool(self.response_cache and prompt and not image_url)
+        if cacheable:
+            preset = session.preset.name if session.preset else ""
+            with tracer.span("cache.lookup", model=model) as span:
+                content = self.response_cache.get(preset, model, prompt)
+                if span:
+                    span.attrs["hit"] = content is not None
+            if content is not None:
+                message = ChatCompletionMessage(role="assistant", content=content)
+                session.add_message(message)
+                return [message]
+        with tracer.span("chat_completions", model=model):
+            results = await self.chat_completions(
+                session=session, model=model, tool_choice=tool_choice
+            )
+        if cacheable:
+            self.cache_results(session, model, prompt, results)
         return results
 
+    def cache_results(
+        self,
+        session: Session,
+        model: str,
+        prompt: str,
+        results: List[Union[ToolCallRequest, ChatCompletionMessage]],
+    ):
+        # 只缓存成功且不含工具调用的回复，请求出错时结果中没有 CompletionUsage
+        if not any(isinstance(result, CompletionUsage) for result in results):
+            return
+        if any(isinstance(result, ToolCallRequest) for result in results):
+            return
+        content = "".join(
+            result.content
+            for result in results
+            if isinstance(result, ChatCompletionMessage) and result.content
+        )
+        preset = session.preset
+        self.response_cache.put(
+            preset.name if preset else "",
+            model,
+            prompt,
+            content,
+            ttl=preset.cache_ttl if preset else None,
+        )
+
     async def chat_completions(
         self,
         session: Session,
@@ -94,28 +403,78 @@ class OpenAIClient:
         results (list): 包含完成内容的列表。
 
         """
-        # 检查模型名称中是否包含"vision"
-        vision = model.count("vision") > 0
-        messages = session.get_messages()
+        serving = self.serving_channels(model)
+        if not serving:
+            logger.error(f"没有渠道提供模型 {model}")
+            return [
+                ChatCompletionMessage(
+                    role="assistant", content=f"请求聊天出错: 没有渠道提供模型 {model}"
+                )
+            ]
+        capability = self.capabilities.resolve_all(serving, model)
+        # 只支持图片识别、不支持工具的模型只发送最后一条消息
+        vision = capability.vision and not capability.tools
+        memories = []
+        if self.memory and not vision:
+            with tracer.span("memory.recall"):
+                memories = await self.memory.recall(session, self.client)
+        messages = session.get_window()
+        preset = session.preset
         if vision:
             messages = [messages[-1]]
+            preset = None
             session.messages.pop()
+        tools = (
+            None
+            if not capability.tools or tool_choice == "none"  # 省 Tokens
+            else self.tool_func.tools_info()
+        )
+        # 按模型的上下文长度裁剪窗口，为系统消息、记忆、工具和回复预留空间
+        budget = capability.max_context - (capability.max_output or OUTPUT_RESERVE)
+        if preset:
+            budget -= estimate_tokens(preset.prompt)
+        if memories:
+            budget -= sum(estimate_tokens(memory) for memory in memories)
+        if tools:
+            budget -= self.body_builder.tools_tokens(tools)
+        messages = fit_window(messages, budget)
+        body = self.body_builder.build(
+            session,
+            messages,
+            preset=preset,
+            memories=memories,
+            tools=tools,
+            model=model,
+            tool_choice=tool_choice if tools else None,
+            user=session.user or None,
+            max_tokens=capability.max_output,
+        )
         max_retry = 3
         for i in range(max_retry):
+            channel = self.pick_channel(model)
+            state = self.channel_states.get(channel, self.channels)
+            if i:
+                UPSTREAM_RETRIES.inc(channel=state.name, model=model)
+            state.in_flight += 1
+            start = time.perf_counter()
             try:
                 # 创建聊天完成内容
-                chat_completion = await self.client.chat.completions.create(
-                    messages=messages,
-                    model=model,
-                    tool_choice=None if vision or tool_choice == "none" else tool_choice,
-                    tools=None
-                    if vision or tool_choice == "none"  # 省 Tokens
-                    else self.tool_func.tools_info(),
-                    user=session.user,
-                    max_tokens=1024 if vision else None,
+                with tracer.span("upstream", channel=state.name, attempt=i):
+                    chat_completion = await self.create_chat_completion(
+                        self.init_client(channel), body
+                    )
+                latency = time.perf_counter() - start
+                state.record_success(latency)
+                UPSTREAM_LATENCY.observe(
+                    latency, channel=state.name, model=model, status="ok"
                 )
                 break
             except APIStatusError as e:
+                latency = time.perf_counter() - start
+                state.record_failure(latency)
+                UPSTREAM_LATENCY.observe(
+                    latency, channel=state.name, model=model, status=str(e.status_code)
+                )
                 logger.error(f"请求聊天出错: {e}")
                 if i == max_retry - 1:
                     return [
@@ -125,7 +484,14 @@ class OpenAIClient:
                         )
                     ]
             except Exception as e:
+                latency = time.perf_counter() - start
+                state.record_failure(latency)
+                UPSTREAM_LATENCY.observe(
+                    latency, channel=state.name, model=model, status="error"
+                )
                 logger.error(f"请求聊天出错: {e}")
+            finally:
+                state.in_flight -= 1
         else:
             return [
                 ChatCompletionMessage(
@@ -133,14 +499,33 @@ class OpenAIClient:
                     content="请求聊天出错",
                 )
             ]
+        if chat_completion.usage:
+            TOKENS.inc(chat_completion.usage.prompt_tokens, model=model, kind="prompt")
+            TOKENS.inc(
+                chat_completion.usage.completion_tokens, model=model, kind="completion"
+            )
         return self.make_chat_completion_results(session, chat_completion)
 
     def make_chat_completion_results(
         self, session: Session, chat_completion: ChatCompletion
     ):
-        logger.info(f"chat_comletion: {chat_completion}")
         results = []
         choices = chat_completion.choices
+        event_log.event(
+            "chat_completion",
+            session,
+            id=chat_completion.id,
+            model=chat_completion.model,
+            finish_reason=lambda: [choice.finish_reason for choice in choices],
+            content=lambda: [choice.message.content for choice in choices],
+            tool_calls=lambda: [
+                tool_call.function.name
+                for choice in choices
+                for tool_call in choice.message.tool_calls or []
+            ],
+            usage=lambda: chat_completion.usage and chat_completion.usage.dict(),
+        )
+        event_log.dump("chat_completion", session, lambda: chat_completion)
         for choice in choices:
             if choice.message.role == "":
                 choice.message.role = "assistant"
@@ -176,7 +561,7 @@ class OpenAIClient:
                 )
 
             # 将选择的消息添加到会话的消息列表中
-            session.messages.append(choice.message)
+            session.add_message(choice.message)
         results.append(chat_completion.usage)
         return results
 
@@ -189,7 +574,7 @@ class OpenAIClient:
             ctx=FuncContext[type(config)](
                 session=session,
                 openai_client=self.client,
-                http_client=self.http_client,
+                http_client=self.tool_http_client,
                 config=config,
             ),
         )
@@ -224,7 +609,14 @@ class OpenAIClient:
           speed: The speed of the generated audio. Select a value from `0.25` to `4.0`. `1.0` is
               the default.
         """
-        logger.info(f"tts: {input} {model} {voice} {speed}")
+        event_log.event(
+            "tts",
+            ctx.session if ctx else None,
+            input=input,
+            model=model,
+            voice=voice,
+            speed=speed,
+        )
         resp = ToolCallResponse(
             name="tts",
             content_type="audio",
@@ -233,9 +625,17 @@ class OpenAIClient:
         )
         if isinstance(speed, str):
             speed = float(speed)
+        client = self.client_for(model)
+        if not client:
+            resp.data = f"failed to generate audio, no channel provides {model}"
+            return resp
         try:
-            record = await self.client.audio.speech.create(
-                input=input, model=model, voice=voice, speed=speed
+            record = await client.audio.speech.create(
+                input=input,
+                model=model,
+                voice=voice,
+                speed=speed,
+                timeout=self.timeouts.get("tts"),
             )
         except APIStatusError as e:
             logger.error(f"TTS: {e}")
@@ -279,15 +679,27 @@ class OpenAIClient:
               Natural causes the model to produce more natural, less hyper-real looking
               images. This param is only supported for `dall-e-3`.
         """
-        logger.info(f"gen_image: {prompt} {model} {quality} {size} {style}")
+        event_log.event(
+            "gen_image",
+            ctx.session if ctx else None,
+            prompt=prompt,
+            model=model,
+            quality=quality,
+            size=size,
+            style=style,
+        )
         resp = ToolCallResponse(
             name="gen_image",
             content_type="openai_image",
             content=None,
             data="failed to generate image",
         )
+        client = self.client_for(model)
+        if not client:
+            resp.data = f"failed to generate image, no channel provides {model}"
+            return resp
         try:
-            image_resp = await self.client.images.generate(
+            image_resp = await client.images.generate(
                 prompt=prompt,
                 n=1,
                 response_format="url",
@@ -295,6 +707,7 @@ class OpenAIClient:
                 quality=quality,
                 size=size,
                 style=style,
+                timeout=self.timeouts.get("image"),
             )
         except APIStatusError as e:
             logger.error(f"DALL-E: {e}")
@@ -330,15 +743,23 @@ class OpenAIClient:
             APIStatusError: If there is an error with the API status.
             Exception: If there is a general error.
         """
-        logger.info(f"Vision: {text} {url}")
+        event_log.event("vision", ctx.session if ctx else None, text=text, url=url)
         resp = ToolCallResponse(
             name="vision",
             content_type="str",
             content=None,
             data="failed to analyze image",
         )
+        model = "gpt-4-vision-preview"
+        serving = self.serving_channels(model)
+        if not serving:
+            resp.data = f"failed to analyze image, no channel provides {model}"
+            return resp
+        capability = self.capabilities.resolve_all(serving, model)
         try:
-            analyze_resp = await self.client.chat.completions.create(
+            analyze_resp = await self.init_client(
+                self.pick_channel(model)
+            ).chat.completions.create(
                 messages=[
                     ChatCompletionUserMessageParam(
                         role="user",
@@ -356,8 +777,9 @@ class OpenAIClient:
                         ],
                     ),
                 ],
-                model="gpt-4-vision-preview",
-                max_tokens=1024,
+                model=model,
+                max_tokens=capability.max_output or OUTPUT_RESERVE,
+                timeout=self.timeouts.get("chat"),
             )
         except APIStatusError as e:
             logger.error(f"Vision: {e}")
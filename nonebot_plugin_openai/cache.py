@@ -0,0 +1,143 @@
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from loguru import logger
+
+from .embedding import HashEmbedder, VectorIndex, numpy_available
+
+
+class CacheEntry:
+    __slots__ = ("content", "expire_at")
+
+    def __init__(self, content: str, expire_at: float):
+        self.content = content
+        self.expire_at = expire_at
+
+
+class ResponseCache:
+    """
+    ResponseCache 是不含工具调用的对话回复缓存，键为 (预设, 模型, 归一化后的提问)。
+
+    开启 similarity 后，精确匹配失败时会在同一预设、同一模型下用本地向量索引查找近似重复的提问。
+
+    Attributes:
+        max_size (int): 最多缓存的回复数量，超出后淘汰最久未使用的条目。
+
+        ttl (int): 默认过期时间（秒），预设的 cache_ttl 优先。
+
+        similarity (float): 近似匹配的最低余弦相似度，为 0 时只做精确匹配。
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1024,
+        ttl: int = 3600,
+        similarity: float = 0.0,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.similarity = similarity if similarity and numpy_available() else 0.0
+        self.entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self.embedder = HashEmbedder() if self.similarity else None
+        self.indexes: Dict[Tuple[str, str], VectorIndex] = {}
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(prompt: str) -> str:
+        """忽略大小写和首尾空白，连续的空白视为一个空格，标点会改变含义，需要保留"""
+        return re.sub(r"\s+", " ", prompt.lower()).strip()
+
+    @staticmethod
+    def make_key(preset: str, model: str, prompt: str) -> str:
+        return f"{preset}\0{model}\0{prompt}"
+
+    def get(self, preset: str, model: str, prompt: str) -> Optional[str]:
+        """
+        查找缓存的回复。
+
+        参数:
+            preset (str): 预设名称。
+            model (str): 模型名称。
+            prompt (str): 用户的提问。
+
+        返回:
+            Optional[str]: 缓存的回复，未命中时为 None。
+        """
+        prompt = self.normalize(prompt)
+        if not prompt:
+            return None
+        key = self.make_key(preset, model, prompt)
+        entry = self._get_entry(key)
+        if entry:
+            self.hits += 1
+            return entry.content
+        index = self.indexes.get((preset, model))
+        if self.embedder and index:
+            for near_key, score in index.search(
+                self.embedder.embed(prompt), min_score=self.similarity
+            ):
+                entry = self._get_entry(near_key)
+                if entry:
+                    logger.debug(f"[Cache] 近似命中 {score:.3f}: {prompt}")
+                    self.near_hits += 1
+                    return entry.content
+        self.misses += 1
+        return None
+
+    def put(
+        self,
+        preset: str,
+        model: str,
+        prompt: str,
+        content: str,
+        ttl: Optional[int] = None,
+    ) -> None:
+        prompt = self.normalize(prompt)
+        ttl = self.ttl if ttl is None else ttl
+        if not prompt or not content or ttl <= 0:
+            return
+        key = self.make_key(preset, model, prompt)
+        self.entries[key] = CacheEntry(content, time.time() + ttl)
+        self.entries.move_to_end(key)
+        if self.embedder:
+            index = self.indexes.setdefault(
+                (preset, model), VectorIndex(self.embedder.dim)
+            )
+            index.add(key, self.embedder.embed(prompt))
+        while len(self.entries) > self.max_size:
+            self._remove(next(iter(self.entries)))
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.indexes.clear()
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.near_hits + self.misses
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.near_hits) / total if total else 0.0,
+        }
+
+    def _get_entry(self, key: str) -> Optional[CacheEntry]:
+        entry = self.entries.get(key)
+        if not entry:
+            return None
+        if entry.expire_at < time.time():
+            self._remove(key)
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def _remove(self, key: str) -> None:
+        self.entries.pop(key, None)
+        preset, model, _ = key.split("\0", 2)
+        index = self.indexes.get((preset, model))
+        if index:
+            index.remove(key)
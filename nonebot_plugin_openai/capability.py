@@ -0,0 +1,130 @@
+from typing import Dict, Iterable, List, Optional
+
+from .types import Channel, ChatMessage, ModelCapability
+from .utils import message_tokens
+
+# 未知模型使用的能力，max_output 为 None 时不传 max_tokens，使用上游的默认值
+DEFAULT_CAPABILITY = ModelCapability(
+    tools=True, vision=False, max_context=8192, max_output=None, stream=True
+)
+
+# vision-preview 不支持工具，上游默认的输出长度很短，需要显式指定 max_tokens
+VISION_CAPABILITY = ModelCapability(
+    tools=False, vision=True, max_context=128000, max_output=1024
+)
+
+# 内置的模型能力，先精确匹配，模型名包含 vision 时使用 VISION_CAPABILITY，其余按最长前缀匹配，
+# 渠道中的声明会覆盖这里的值
+BUILTIN_CAPABILITIES: Dict[str, ModelCapability] = {
+    "gpt-3.5-turbo": ModelCapability(max_context=16385),
+    "gpt-3.5-turbo-0301": ModelCapability(max_context=4096),
+    "gpt-3.5-turbo-0613": ModelCapability(max_context=4096),
+    "gpt-4": ModelCapability(max_context=8192),
+    "gpt-4-32k": ModelCapability(max_context=32768),
+    "gpt-4-1106-preview": ModelCapability(max_context=128000),
+    "gpt-4-0125-preview": ModelCapability(max_context=128000),
+    "gpt-4-turbo": ModelCapability(vision=True, max_context=128000),
+    "gpt-4-vision-preview": VISION_CAPABILITY,
+    "gpt-4o": ModelCapability(vision=True, max_context=128000),
+}
+
+# 没有声明 max_output 时为回复预留的 token 数
+OUTPUT_RESERVE = 1024
+
+
+def merge(*capabilities: Optional[ModelCapability]) -> ModelCapability:
+    """按顺序合并，前面的非 None 字段优先"""
+    values = {}
+    for capability in capabilities:
+        if capability is None:
+            continue
+        for key, value in capability.dict().items():
+            if values.get(key) is None:
+                values[key] = value
+    return ModelCapability(**values)
+
+
+class CapabilityRegistry:
+    """
+    CapabilityRegistry 根据渠道的声明和内置的模型信息判断渠道是否提供某个模型，以及模型的能力。
+
+    声明了 models 的渠道只提供声明的模型，没有声明的渠道视为提供所有模型。
+    解析结果按 (渠道的 models, 模型) 缓存，渠道重载后声明不变时继续复用。
+
+    Attributes:
+        builtin (Dict[str, ModelCapability]): 内置的模型能力。
+    """
+
+    def __init__(self, builtin: Optional[Dict[str, ModelCapability]] = None):
+        self.builtin = BUILTIN_CAPABILITIES if builtin is None else builtin
+        self._prefixes = sorted(self.builtin, key=len, reverse=True)
+        self._cache: Dict[tuple, ModelCapability] = {}
+
+    def builtin_for(self, model: str) -> Optional[ModelCapability]:
+        capability = self.builtin.get(model)
+        if capability is not None:
+            return capability
+        # 与早期版本一致，未知的 vision 模型（例如中转站的模型）按 vision-preview 处理，避免被前缀匹配为支持工具的模型
+        if "vision" in model:
+            return VISION_CAPABILITY
+        for prefix in self._prefixes:
+            if model.startswith(prefix):
+                return self.builtin[prefix]
+        return None
+
+    @staticmethod
+    def serves(channel: Channel, model: str) -> bool:
+        return not channel.models or model in channel.models
+
+    def resolve(self, channel: Channel, model: str) -> ModelCapability:
+        declared = channel.models.get(model)
+        key = (model, declared and declared.json())
+        capability = self._cache.get(key)
+        if capability is None:
+            if len(self._cache) > 1024:
+                self._cache.clear()
+            capability = self._cache[key] = merge(
+                declared, self.builtin_for(model), DEFAULT_CAPABILITY
+            )
+        return capability
+
+    def resolve_all(self, channels: Iterable[Channel], model: str) -> ModelCapability:
+        """多个渠道提供同一模型时取最保守的能力，重试时换渠道也不需要重新拼接请求"""
+        resolved = [self.resolve(channel, model) for channel in channels]
+        if not resolved:
+            return merge(self.builtin_for(model), DEFAULT_CAPABILITY)
+        outputs = [item.max_output for item in resolved if item.max_output]
+        return ModelCapability(
+            tools=all(item.tools for item in resolved),
+            vision=all(item.vision for item in resolved),
+            max_context=min(item.max_context for item in resolved),
+            max_output=min(outputs) if outputs else None,
+            stream=all(item.stream for item in resolved),
+        )
+
+
+def fit_window(messages: List[ChatMessage], budget: int) -> List[ChatMessage]:
+    """
+    从最早的消息开始丢弃，直到估算的 token 数不超过 budget。
+
+    至少保留最后一条消息，丢弃后不会以工具调用结果开头。
+
+    参数:
+        messages (List[ChatMessage]): 窗口中的消息。
+        budget (int): 允许的 token 数。
+
+    返回:
+        List[ChatMessage]: 裁剪后的消息。
+    """
+    # 估算的 token 数不会超过序列化后的字符数，大多数情况下不需要逐条估算
+    if sum(len(message.serialized) + 4 for message in messages) <= budget:
+        return messages
+    tokens = [message_tokens(message) for message in messages]
+    total = sum(tokens)
+    start = 0
+    while start < len(messages) - 1 and (
+        total > budget or messages[start].role == "tool"
+    ):
+        total -= tokens[start]
+        start += 1
+    return messages[start:]
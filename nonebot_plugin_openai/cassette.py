@@ -0,0 +1,232 @@
+import asyncio
+import base64
+import hashlib
+import json
+import time
+from collections import defaultdict, deque
+from pathlib import Path
+from typing import Any, Deque, Dict, Literal, Optional, Tuple
+
+import httpx
+from loguru import logger
+
+from .types import ToolCallResponse
+
+# 录制时会被替换的字段，包括请求体、查询参数中的密钥和用户标识
+REDACT_KEYS = {"api_key", "key", "cx", "authorization", "user", "organization"}
+REDACTED = "[redacted]"
+
+
+def redact(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {
+            key: REDACTED if key.lower() in REDACT_KEYS else redact(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [redact(item) for item in value]
+    return value
+
+
+def encode_body(content: bytes) -> Dict[str, Any]:
+    if not content:
+        return {}
+    try:
+        return {"json": redact(json.loads(content))}
+    except ValueError:
+        return {"b64": base64.b64encode(content).decode()}
+
+
+def decode_body(body: Dict[str, Any]) -> bytes:
+    if "json" in body:
+        return json.dumps(body["json"], ensure_ascii=False).encode("utf-8")
+    if "b64" in body:
+        return base64.b64decode(body["b64"])
+    return b""
+
+
+class Cassette:
+    """
+    Cassette 用于录制和回放与上游的真实对话，便于离线做性能和回归测试。
+
+    录制模式下，经过插件 http_client 的请求和工具调用结果会脱敏后逐条写入 JSON Lines 文件，
+    回放模式下由本地 transport 按原始耗时（除以 speed）返回录制的响应，工具调用也直接返回录制的结果。
+
+    Attributes:
+        path (Path): cassette 文件路径。
+
+        mode (Literal["record", "replay"]): 录制或回放。
+
+        speed (float): 回放倍速，为 0 时不等待。
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        mode: Literal["record", "replay"] = "record",
+        speed: float = 1.0,
+    ):
+        self.path = path
+        self.mode = mode
+        self.speed = speed
+        self.started = time.perf_counter()
+        self.http: Dict[Tuple[str, str], Deque[Dict[str, Any]]] = defaultdict(deque)
+        self.tools: Dict[str, Deque[Dict[str, Any]]] = defaultdict(deque)
+        if mode == "replay":
+            self.load()
+        else:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def fingerprint(body: Dict[str, Any]) -> str:
+        return hashlib.sha1(
+            json.dumps(body, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        ).hexdigest()[:16]
+
+    def load(self) -> None:
+        if not self.path.is_file():
+            logger.warning(f"[Cassette] 文件 {self.path} 不存在，回放时所有请求都会失败")
+            return
+        count = 0
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if entry["kind"] == "http":
+                    self.http[(entry["method"], entry["path"])].append(entry)
+                elif entry["kind"] == "tool":
+                    self.tools[entry["name"]].append(entry)
+                count += 1
+        logger.info(f"[Cassette] 已读取 {count} 条录制记录")
+
+    def write(self, entry: Dict[str, Any]) -> None:
+        entry["offset"] = round(time.perf_counter() - self.started, 4)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")))
+            f.write("\n")
+
+    async def wait(self, elapsed: float) -> None:
+        if self.speed > 0 and elapsed > 0:
+            await asyncio.sleep(elapsed / self.speed)
+
+    def transport(
+        self, transport: Optional[httpx.AsyncBaseTransport] = None
+    ) -> httpx.AsyncBaseTransport:
+        """录制时包装 transport（默认新建一个），回放时不使用真实连接"""
+        if self.mode == "replay":
+            return ReplayTransport(self)
+        return RecordingTransport(self, transport or httpx.AsyncHTTPTransport())
+
+    def record_tool(
+        self, name: str, arguments: str, result: ToolCallResponse, elapsed: float
+    ) -> None:
+        self.write(
+            {
+                "kind": "tool",
+                "name": name,
+                "arguments": encode_body(arguments.encode("utf-8")),
+                "content_type": result.content_type,
+                "content": result.content if isinstance(result.content, str) else None,
+                "data": result.data,
+                "elapsed": round(elapsed, 4),
+            }
+        )
+
+    async def replay_tool(self, name: str) -> Optional[ToolCallResponse]:
+        """按录制顺序返回工具调用结果，没有可用记录时返回 None"""
+        entries = self.tools.get(name)
+        if not entries:
+            return None
+        entry = entries.popleft()
+        await self.wait(entry["elapsed"])
+        content_type = entry["content_type"] if entry["content"] is not None else "str"
+        return ToolCallResponse(
+            name=name,
+            content_type=content_type,
+            content=entry["content"],
+            data=entry["data"],
+        )
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    def __init__(self, cassette: Cassette, transport: httpx.AsyncBaseTransport):
+        self.cassette = cassette
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        content = await request.aread()
+        start = time.perf_counter()
+        response = await self.transport.handle_async_request(request)
+        body = await response.aread()
+        await response.aclose()
+        elapsed = time.perf_counter() - start
+        try:
+            self.cassette.write(
+                {
+                    "kind": "http",
+                    "method": request.method,
+                    "path": request.url.path,
+                    "query": redact(dict(request.url.params)),
+                    "request": encode_body(content),
+                    "status": response.status_code,
+                    "content_type": response.headers.get("content-type", ""),
+                    "response": encode_body(body),
+                    "elapsed": round(elapsed, 4),
+                }
+            )
+        except Exception as e:
+            logger.warning(f"[Cassette] 录制失败: {e}")
+        # body 已经解压，去掉与原始编码相关的头
+        headers = [
+            (key, value)
+            for key, value in response.headers.items()
+            if key.lower()
+            not in ("content-encoding", "content-length", "transfer-encoding")
+        ]
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=headers,
+            content=body,
+            request=request,
+        )
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """优先返回请求体完全一致的记录，否则按顺序返回同一路径的下一条记录"""
+
+    def __init__(self, cassette: Cassette):
+        self.cassette = cassette
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        content = await request.aread()
+        entries = self.cassette.http.get((request.method, request.url.path))
+        if not entries:
+            return httpx.Response(
+                599,
+                json={"error": {"message": f"cassette 中没有 {request.url.path} 的记录"}},
+                request=request,
+            )
+        fingerprint = Cassette.fingerprint(encode_body(content))
+        entry = next(
+            (
+                item
+                for item in entries
+                if Cassette.fingerprint(item["request"]) == fingerprint
+            ),
+            entries[0],
+        )
+        entries.remove(entry)
+        await self.cassette.wait(entry["elapsed"])
+        headers = {}
+        if entry.get("content_type"):
+            headers["content-type"] = entry["content_type"]
+        return httpx.Response(
+            status_code=entry["status"],
+            headers=headers,
+            content=decode_body(entry["response"]),
+            request=request,
+        )
@@ -0,0 +1,140 @@
+import time
+from collections import deque
+from typing import Deque, Dict, List, Literal, Optional
+from urllib.parse import urlparse
+
+from .types import Channel
+
+
+def channel_label(channel: Channel, index: int = 0) -> str:
+    """渠道在日志和指标中的名称，不包含密钥"""
+    if channel.name:
+        return channel.name
+    host = urlparse(channel.base_url).netloc if channel.base_url else "default"
+    return f"{host}#{index}"
+
+
+class ChannelState:
+    """
+    ChannelState 记录单个渠道的运行状态，并实现简单的熔断器。
+
+    连续失败 failure_threshold 次后熔断 cooldown 秒，期间不会再选择该渠道；
+    冷却结束后进入半开状态，下一次请求成功则恢复，失败则重新熔断。
+
+    Attributes:
+        name (str): 渠道名称。
+
+        in_flight (int): 正在进行的请求数。
+
+        requests (int): 请求总数。
+
+        errors (int): 失败总数。
+
+        latencies (Deque[float]): 最近请求的耗时（秒）。
+
+        outcomes (Deque[bool]): 最近请求是否成功，用于计算错误率。
+
+        probe_ok (Optional[bool]): 最近一次探测是否成功，未探测过时为 None。
+
+        probe_latency (float): 最近一次探测的耗时（秒）。
+
+        probe_error (str): 最近一次探测失败的原因。
+
+        probed_at (float): 最近一次探测的时间戳。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        cooldown: float = 30.0,
+        window: int = 256,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.outcomes: Deque[bool] = deque(maxlen=window)
+        self.probe_ok: Optional[bool] = None
+        self.probe_latency = 0.0
+        self.probe_error = ""
+        self.probed_at = 0.0
+
+    @property
+    def breaker(self) -> Literal["closed", "open", "half_open"]:
+        if self.consecutive_failures < self.failure_threshold:
+            return "closed"
+        if time.monotonic() < self.open_until:
+            return "open"
+        return "half_open"
+
+    @property
+    def available(self) -> bool:
+        return self.breaker != "open"
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def percentile(self, q: float) -> float:
+        if not self.latencies:
+            return 0.0
+        values = sorted(self.latencies)
+        return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+    def record_success(self, latency: float) -> None:
+        self.requests += 1
+        self.consecutive_failures = 0
+        self.latencies.append(latency)
+        self.outcomes.append(True)
+
+    def record_failure(self, latency: Optional[float] = None) -> None:
+        self.requests += 1
+        self.errors += 1
+        self.consecutive_failures += 1
+        if latency is not None:
+            self.latencies.append(latency)
+        self.outcomes.append(False)
+        if self.consecutive_failures >= self.failure_threshold:
+            self.open_until = time.monotonic() + self.cooldown
+
+    def record_probe(self, ok: bool, latency: float, error: str = "") -> None:
+        """探测结果只影响熔断状态，不计入请求数、错误率和延迟"""
+        self.probe_ok = ok
+        self.probe_latency = latency
+        self.probe_error = error
+        self.probed_at = time.time()
+        if ok:
+            self.consecutive_failures = 0
+            return
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= self.failure_threshold:
+            self.open_until = time.monotonic() + self.cooldown
+
+
+class ChannelStates:
+    """按渠道名称保存 ChannelState，渠道列表重载后名称不变的渠道会保留状态"""
+
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.states: Dict[str, ChannelState] = {}
+
+    def get(self, channel: Channel, channels: List[Channel]) -> ChannelState:
+        index = next((i for i, item in enumerate(channels) if item is channel), 0)
+        name = channel_label(channel, index)
+        if name not in self.states:
+            self.states[name] = ChannelState(
+                name, failure_threshold=self.failure_threshold, cooldown=self.cooldown
+            )
+        return self.states[name]
+
+    def values(self) -> List[ChannelState]:
+        return list(self.states.values())
@@ -10,6 +10,114 @@ class Config(BaseModel, extra=Extra.ignore):
     openai_data_path: str = "data/nonebot_plugin_openai/"
     openai_default_model: str = "gpt-3.5-turbo-1106"
     openai_chat_max_length: int = 8
+    # 回复缓存，只缓存不含工具调用的回复，similarity 为 0 时只做精确匹配（近似匹配需要 numpy）
+    openai_response_cache: bool = False
+    openai_response_cache_size: int = 1024
+    openai_response_cache_ttl: int = 3600
+    openai_response_cache_similarity: float = 0.0
+    # 长期记忆，embedding_model 为空时使用本地向量化（需要 numpy）
+    openai_memory: bool = False
+    openai_memory_embedding_model: str = ""
+    openai_memory_top_k: int = 3
+    openai_memory_min_score: float = 0.3
+    # 录制或回放与上游的对话，path 为空时使用 openai_data_path 下的 cassette.jsonl，speed 为 0 时回放不等待
+    openai_cassette_mode: Literal["", "record", "replay"] = ""
+    openai_cassette_path: str = ""
+    openai_cassette_speed: float = 1.0
+    # 渠道连续失败 failures 次后熔断 cooldown 秒
+    openai_breaker_failures: int = 5
+    openai_breaker_cooldown: float = 30.0
+    # 指标导出，path 为驱动 HTTP 服务上的路径，file 为定时写入的文件，为空时不导出
+    openai_metrics_path: str = ""
+    openai_metrics_file: str = ""
+    openai_metrics_interval: float = 15.0
+    # 对话追踪，path 为空时使用 openai_data_path 下的 traces.jsonl，文件超过 max_bytes 后滚动，recent 为保留在内存中的记录数
+    openai_trace: bool = False
+    openai_trace_path: str = ""
+    openai_trace_max_bytes: int = 10 * 1024 * 1024
+    openai_trace_backups: int = 3
+    openai_trace_recent: int = 200
+    # 事件循环阻塞检测，延迟超过 threshold 秒时记录阻塞代码的调用栈，同一来源 log_interval 秒内只输出一次日志
+    openai_watchdog: bool = False
+    openai_watchdog_interval: float = 0.1
+    openai_watchdog_threshold: float = 0.5
+    openai_watchdog_log_interval: float = 60.0
+    # 对话日志的采样率和单个字段的最大长度，可以用 --debug on 为单个会话开启完整日志
+    openai_log_sample_rate: float = 1.0
+    openai_log_max_chars: int = 200
+    # 内存占用统计的缓存时间（秒），过期后导出指标时在线程中重新统计，为 0 时只在 -v memory 时统计，tracemalloc 快照保存在 openai_data_path 下的 memprof 文件夹
+    openai_memprof_interval: float = 300.0
+    # 监听 func 文件夹、settings.json 和 tool_config.json 的修改并自动加载，debounce 秒内没有新的修改才会加载
+    openai_watch: bool = False
+    openai_watch_interval: float = 1.0
+    openai_watch_debounce: float = 0.5
+    # 上游 LLM 请求和工具请求使用独立的连接池，keepalive 为保持的空闲连接数，expiry 为空闲连接保留的秒数，http2 需要安装 h2
+    openai_llm_pool_max_connections: int = 100
+    openai_llm_pool_max_keepalive: int = 20
+    openai_llm_pool_keepalive_expiry: float = 30.0
+    openai_llm_pool_http2: bool = False
+    openai_tool_pool_max_connections: int = 20
+    openai_tool_pool_max_keepalive: int = 10
+    openai_tool_pool_keepalive_expiry: float = 15.0
+    openai_tool_pool_http2: bool = False
+    # 各类请求的超时（秒），connect 同时用于建立连接和等待连接池中的空闲连接
+    openai_timeout_connect: float = 10.0
+    openai_timeout_chat: float = 120.0
+    openai_timeout_tts: float = 60.0
+    openai_timeout_image: float = 120.0
+    openai_timeout_tool: float = 30.0
+    # 启动时预先建立到每个渠道的 warmup_connections 个连接（预热失败不影响熔断状态），probe_interval 大于 0 时定时探测渠道（GET /models）并更新熔断状态
+    # 录制或回放对话时不预热也不探测
+    openai_warmup_connections: int = 0
+    openai_probe_interval: float = 0.0
+    openai_probe_timeout: float = 10.0
+    # 自动选择模型，没有用 -m 指定模型时，简单的对话使用 fast 模型，图片、长消息、代码、关键词和可能调用工具的对话使用 strong 模型
+    # vision_model 为空时含图片的消息使用 strong 模型，升级后 sticky 秒内的后续对话继续使用 strong 模型
+    openai_router: bool = False
+    openai_router_fast_model: str = "gpt-3.5-turbo-1106"
+    openai_router_strong_model: str = "gpt-4-1106-preview"
+    openai_router_vision_model: str = ""
+    openai_router_long_chars: int = 200
+    openai_router_keywords: List[str] = [
+        "代码",
+        "证明",
+        "推导",
+        "分析",
+        "为什么",
+        "翻译",
+        "总结",
+        "计算",
+        "code",
+        "explain",
+        "prove",
+        "translate",
+    ]
+    openai_router_tool_keywords: List[str] = [
+        "画",
+        "图片",
+        "搜索",
+        "查一下",
+        "语音",
+        "draw",
+        "search",
+    ]
+    openai_router_sticky: float = 300.0
+    # 多进程模式，workers 大于 0 时主进程只转发消息事件，会话按 ID 分给 workers 个 worker 进程处理
+    # 每个 worker 的状态保存在 settings.worker{序号}.json，第一次启动时从 settings.json 中取出属于自己的会话
+    # 函数配置保存在 tool_config.worker{序号}.json，工具文件复制到各自的 cache_func_worker{序号}，指令修改的预设和函数配置只对处理指令的 worker 生效
+    # 需要所有 worker 一致时使用 redis 共享状态
+    # worker_index 由主进程传给 worker，不需要手动配置
+    openai_workers: int = 0
+    openai_worker_index: int = -1
+    # 共享状态，state_backend 为 redis 时会话、预设、渠道和函数配置保存在 redis_url 指向的 Redis 中，多个实例可以共同服务
+    # 每个会话同时只有一个实例在处理，会话锁的租约为 lock_ttl 秒，持有期间自动续期，实例崩溃后锁在租约到期后释放
+    openai_state_backend: Literal["local", "redis"] = "local"
+    openai_redis_url: str = "redis://127.0.0.1:6379/0"
+    openai_state_prefix: str = "nonebot_openai"
+    openai_lock_ttl: float = 60.0
+    # 丢弃 dedup_window 秒内重复投递的消息事件（按机器人和消息 ID 判断，例如重连后补发的事件），最多记录 dedup_size 条，为 0 时关闭
+    openai_dedup_window: float = 300.0
+    openai_dedup_size: int = 4096
 
 
 config = Config.parse_obj(get_driver().config)
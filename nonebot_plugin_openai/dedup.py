@@ -0,0 +1,66 @@
+import time
+from collections import OrderedDict
+from typing import Any, Tuple
+
+from loguru import logger
+
+from .metrics import DUPLICATE_EVENTS
+
+# 事件 state 中保存去重结果的键
+DEDUP_STATE_KEY = "_openai_not_duplicate"
+
+
+class EventDeduplicator:
+    """
+    EventDeduplicator 记录最近处理过的消息，识别 OneBot 实现端重复投递的同一条消息。
+
+    键为 (机器人 ID, 消息 ID)，只保存过期时间，不持有事件对象。每个事件在事件预处理时由 check
+    判断一次，结果存入事件的 state，同一事件经过多个事件响应器时结果一致，事件处理结束后随 state 一起释放。
+    第一次投递的事件仍会正常处理并回复，重复的直接丢弃，不会再次请求上游。
+
+    Attributes:
+        window (float): 记录保留的时间（秒），为 0 时不去重。
+
+        max_size (int): 最多记录的消息数，超出后淘汰最早的记录。
+
+        duplicates (int): 已丢弃的重复事件数。
+    """
+
+    def __init__(self, window: float = 300.0, max_size: int = 4096):
+        self.window = window
+        self.max_size = max_size
+        self.entries: "OrderedDict[Tuple[str, int], float]" = OrderedDict()
+        self.duplicates = 0
+
+    def check(self, self_id: str, event: Any) -> bool:
+        """
+        判断事件是否需要处理，并记录这条消息。
+
+        参数:
+            self_id (str): 收到事件的机器人。
+            event (MessageEvent): 消息事件。
+
+        返回:
+            bool: 第一次收到时为 True，重复投递时为 False。
+        """
+        if self.window <= 0:
+            return True
+        now = time.monotonic()
+        # 记录的保留时间相同，按插入顺序过期
+        while self.entries:
+            expire_at = next(iter(self.entries.values()))
+            if expire_at > now:
+                break
+            self.entries.popitem(last=False)
+        key = (self_id, event.message_id)
+        if key not in self.entries:
+            self.entries[key] = now + self.window
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+            return True
+        self.duplicates += 1
+        DUPLICATE_EVENTS.inc()
+        logger.info(
+            f"[Dedup] 丢弃重复投递的消息 self_id={self_id} message_id={event.message_id}"
+        )
+        return False
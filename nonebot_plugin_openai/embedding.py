@@ -0,0 +1,177 @@
+import zlib
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+# numpy 为可选依赖，并且只在启用向量功能时才导入，避免拖慢插件的导入
+np = None
+
+
+def numpy_available() -> bool:
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            logger.warning(
+                "[Embedding] 未安装 numpy，向量检索功能不可用，请执行 pip install numpy"
+            )
+            return False
+        np = numpy
+    return True
+
+
+def normalize(vectors: List[List[float]]) -> "np.ndarray":
+    """把接口返回的向量转换为按行归一化的矩阵"""
+    array = np.array(vectors, dtype=np.float32)
+    norms = np.linalg.norm(array, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return array / norms
+
+
+class HashEmbedder:
+    """
+    HashEmbedder 是离线可用的本地向量化工具，把字符 n-gram 哈希到固定维度后归一化。
+
+    不需要下载模型，也不会请求接口，适合作为近似重复问题检测和记忆检索的默认实现。
+    使用 crc32 而不是 hash()，保证不同进程得到的向量一致，可以持久化。
+
+    Attributes:
+        dim (int): 向量维度。
+
+        ngrams (Tuple[int, ...]): 使用的 n-gram 长度。
+    """
+
+    def __init__(self, dim: int = 256, ngrams: Tuple[int, ...] = (1, 2, 3)):
+        self.dim = dim
+        self.ngrams = ngrams
+
+    def embed(self, text: str) -> "np.ndarray":
+        vector = np.zeros(self.dim, dtype=np.float32)
+        text = text.lower()
+        for n in self.ngrams:
+            for i in range(len(text) - n + 1):
+                gram = text[i : i + n].encode("utf-8")
+                vector[zlib.crc32(gram) % self.dim] += 1.0
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        return vector
+
+    def embed_many(self, texts: Iterable[str]) -> "np.ndarray":
+        vectors = [self.embed(text) for text in texts]
+        if not vectors:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.stack(vectors)
+
+
+class VectorIndex:
+    """
+    VectorIndex 是基于 NumPy 的暴力检索向量索引，向量需要预先归一化，相似度为余弦相似度。
+
+    Attributes:
+        dim (int): 向量维度。
+
+        keys (List[str]): 与每一行向量对应的键。
+
+        vectors (np.ndarray): 形状为 (n, dim) 的向量矩阵。
+    """
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.keys: List[str] = []
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def add(self, key: str, vector: "np.ndarray") -> None:
+        self.add_many([key], vector[None, :])
+
+    def add_many(self, keys: List[str], vectors: "np.ndarray") -> None:
+        """
+        批量添加向量，整批只复制一次矩阵，已存在的键会被替换。
+
+        参数:
+            keys (List[str]): 每一行向量对应的键。
+            vectors (np.ndarray): 形状为 (len(keys), dim) 的向量矩阵。
+        """
+        if not keys:
+            return
+        if not self.keys and vectors.shape[1] != self.dim:
+            # 空索引可以切换维度，例如更换了向量化模型
+            self.dim = vectors.shape[1]
+            self.vectors = np.zeros((0, self.dim), dtype=np.float32)
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"向量维度不一致: {vectors.shape[1]} != {self.dim}")
+        # 同一批中重复的键只保留最后一个
+        latest = {key: i for i, key in enumerate(keys)}
+        rows = sorted(latest.values())
+        replaced = set(latest).intersection(self.keys)
+        if replaced:
+            kept = [i for i, key in enumerate(self.keys) if key not in replaced]
+            self.keys = [self.keys[i] for i in kept]
+            self.vectors = self.vectors[kept]
+        self.keys.extend(keys[i] for i in rows)
+        self.vectors = np.vstack([self.vectors, vectors[rows].astype(np.float32)])
+
+    def remove(self, key: str) -> None:
+        if key not in self.keys:
+            return
+        index = self.keys.index(key)
+        del self.keys[index]
+        self.vectors = np.delete(self.vectors, index, axis=0)
+
+    def search(
+        self, vector: "np.ndarray", top_k: int = 1, min_score: float = 0.0
+    ) -> List[Tuple[str, float]]:
+        """
+        检索最相似的向量。
+
+        参数:
+            vector (np.ndarray): 归一化后的查询向量。
+            top_k (int): 最多返回的数量。
+            min_score (float): 最低相似度。
+
+        返回:
+            List[Tuple[str, float]]: 按相似度降序排列的 (键, 相似度)。
+        """
+        if not self.keys:
+            return []
+        scores = self.vectors @ vector
+        top_k = min(top_k, len(self.keys))
+        indexes = np.argpartition(-scores, top_k - 1)[:top_k]
+        indexes = indexes[np.argsort(-scores[indexes])]
+        return [
+            (self.keys[i], float(scores[i])) for i in indexes if scores[i] >= min_score
+        ]
+
+    def save(self, path: Path) -> None:
+        self.write(path, list(self.keys), self.vectors)
+
+    @staticmethod
+    def write(path: Path, keys: List[str], vectors: "np.ndarray") -> None:
+        """写入索引文件，不访问索引对象，可以在线程中对 keys 和 vectors 的快照调用"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            np.savez(f, keys=np.array(keys, dtype=str), vectors=vectors)
+
+    @classmethod
+    def load(cls, path: Path, dim: Optional[int] = None) -> "VectorIndex":
+        """读取索引，dim 为 None 时使用文件中的维度，读取失败时返回空索引"""
+        index = cls(dim or 0)
+        if not path.is_file():
+            return index
+        try:
+            data = np.load(path)
+            vectors = data["vectors"].astype(np.float32)
+            if vectors.ndim != 2 or (dim and vectors.shape[1] != dim):
+                logger.warning(f"[Embedding] 向量维度不一致，忽略索引 {path}")
+                return index
+            index.keys = [str(key) for key in data["keys"]]
+            index.vectors = vectors
+            index.dim = vectors.shape[1]
+        except Exception as e:
+            logger.warning(f"[Embedding] 读取索引 {path} 失败: {e}")
+        return index
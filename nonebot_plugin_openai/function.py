@@ -1,10 +1,13 @@
+import hashlib
 import importlib
 import json
 import os
 import shutil
+import sys
+import time
 
 from pathlib import Path
-from typing import Dict, Callable, Optional, Union, Coroutine, Any
+from typing import Dict, Callable, List, Optional, Tuple, Union, Coroutine, Any
 from loguru import logger
 from openai.types.chat import (
     ChatCompletionMessageToolCall,
@@ -14,37 +17,104 @@ from openai.types.chat import (
     ChatCompletionContentPartTextParam,
     ChatCompletionFunctionMessageParam,
 )
-from pydantic import BaseModel, parse_file_as, root_validator
+from pydantic import BaseModel, PrivateAttr, parse_file_as
 
 from .utils import function_to_json_schema, reload
 from .config import config
 from .types import Session, ToolCall, ToolCallConfig, ToolCallResponse, FuncContext
+from .cassette import Cassette
+from .metrics import PERSISTENCE_FLUSH, TOOL_DURATION, TOOL_FAILURES
+from .tracing import tracer
+from .logs import event_log
+from .state import shared_state
 
 
 class ToolsFunction(BaseModel):
     __tools = {}
     tool_config: Dict[str, Union[Dict, ToolCallConfig]] = {}
+    _cassette: Optional[Cassette] = PrivateAttr(None)
+    # 最近一次写入后文件的 (mtime_ns, size)，用于区分外部修改
+    _written: Optional[Tuple[int, int]] = PrivateAttr(None)
+    # 已加载的工具模块及其文件内容的哈希
+    _module_hashes: Dict[str, str] = PrivateAttr(default_factory=dict)
 
     __file_path = Path(os.path.join(config.openai_data_path, "tool_config.json"))
+    if config.openai_worker_index >= 0:
+        __worker_file_path = Path(
+            os.path.join(
+                config.openai_data_path,
+                f"tool_config.worker{config.openai_worker_index}.json",
+            )
+        )
+    else:
+        __worker_file_path = None
 
     @property
     def file_path(self) -> Path:
-        return self.__class__.__file_path
+        return self.__class__.__worker_file_path or self.__class__.__file_path
 
     def save(self) -> None:
-        if not self.file_path.is_file():
-            os.makedirs(self.file_path.parent, exist_ok=True)
-        self.file_path.write_text(self.json(indent=4, exclude_none=True), encoding="utf-8")
+        if shared_state.remote:
+            shared_state.push_tool_config(self)
+            return
+        with PERSISTENCE_FLUSH.time(file="tool_config"):
+            if not self.file_path.is_file():
+                os.makedirs(self.file_path.parent, exist_ok=True)
+            self.file_path.write_text(
+                self.json(indent=4, exclude_none=True), encoding="utf-8"
+            )
+            stat = self.file_path.stat()
+            self._written = (stat.st_mtime_ns, stat.st_size)
+
+    def is_written(self, signature: Tuple[int, int]) -> bool:
+        """文件的 (mtime_ns, size) 是否就是插件自己最近一次写入的结果"""
+        return self._written == signature
+
+    def apply_file(self) -> bool:
+        """
+        应用外部对 tool_config.json 的修改，只替换内容变化的函数配置。
+
+        返回:
+            bool: 是否有变化。
+        """
+        return self.apply_data(json.loads(self.file_path.read_text("utf-8")))
+
+    def apply_data(self, data: Dict[str, Any]) -> bool:
+        """
+        应用 tool_config.json 格式的数据，只替换内容变化的函数配置。
 
-    @root_validator(pre=True)
-    def init(cls, values: Dict[str, Any]) -> Dict[str, Any]:
-        if cls.__file_path.is_file():
-            return json.loads(cls.__file_path.read_text("utf-8"))
-        return values
+        参数:
+            data (Dict[str, Any]): 函数配置数据。
+
+        返回:
+            bool: 是否有变化。
+        """
+        changed = False
+        for name, value in data.get("tool_config", {}).items():
+            tool = self.tools.get(name)
+            if not tool:
+                if self.tool_config.get(name) != value:
+                    self.tool_config[name] = value
+                    changed = True
+                continue
+            new_config = tool.config.parse_obj(value)
+            if new_config != tool.config:
+                # 整体替换配置对象，进行中的调用仍使用旧的配置
+                tool.config = new_config
+                self.tool_config[name] = new_config
+                changed = True
+        return changed
 
     def reload(self):
+        base = self.__class__.__file_path
+        if not self.file_path.is_file() and base.is_file():
+            # worker 第一次启动时沿用 tool_config.json 中的配置
+            shutil.copy(base, self.file_path)
         reload(self)
 
+    def use_cassette(self, cassette: Optional[Cassette]) -> None:
+        self._cassette = cassette
+
     @property
     def tools(self) -> Dict[str, ToolCall]:
         return self.__tools
@@ -56,7 +126,12 @@ class ToolsFunction(BaseModel):
         ],
         config: ToolCallConfig = ToolCallConfig(name="Unknown"),
     ):
-        tool_info = function_to_json_schema(func)
+        existing = self.tools.get(func.__name__)
+        if existing and existing.func == func:
+            # 同一个函数重复注册时复用已经生成的 schema
+            tool_info = existing.func_info
+        else:
+            tool_info = function_to_json_schema(func)
         func_name = tool_info["function"]["name"]
         if func_name in self.tool_config:
             config = config.parse_obj(self.tool_config[func_name])
@@ -69,6 +144,79 @@ class ToolsFunction(BaseModel):
         )
         logger.info(f"[Function] 注册 {config.name} 函数 {func_name} 成功.")
 
+    def unregister(self, func_name: str) -> None:
+        """注销函数，保留 tool_config 中的配置，重新注册时沿用"""
+        tool = self.tools.pop(func_name, None)
+        if tool:
+            logger.info(f"[Function] 注销 {tool.config.name} 函数 {func_name}.")
+
+    def unregister_module(self, module: str) -> None:
+        for name, tool in list(self.tools.items()):
+            if getattr(tool.func, "__module__", None) == module:
+                self.unregister(name)
+
+    def apply_config(self) -> None:
+        """重载 tool_config 后，把配置应用到已注册的函数上"""
+        for name, tool in self.tools.items():
+            if isinstance(self.tool_config.get(name), dict):
+                tool.config = tool.config.parse_obj(self.tool_config[name])
+                self.tool_config[name] = tool.config
+
+    def load_modules(self, func_dir: str, cache_dir: str, package: str) -> bool:
+        """
+        加载 func_dir 中以 func 开头的工具文件。
+
+        按文件内容的哈希判断是否变化，只复制并重新导入变化的文件，
+        未变化的模块和它们已经生成的 schema 保持不变，被删除的文件会注销对应的函数。
+
+        参数:
+            func_dir (str): 工具文件所在的文件夹。
+            cache_dir (str): 复制到的包目录。
+            package (str): cache_dir 对应的包名。
+
+        返回:
+            bool: 是否有模块发生变化。
+        """
+        hashes = {}
+        for file_name in os.listdir(func_dir):
+            if file_name.startswith("func") and file_name.endswith(".py"):
+                with open(os.path.join(func_dir, file_name), "rb") as f:
+                    hashes[file_name[:-3]] = hashlib.sha256(f.read()).hexdigest()
+
+        changed = False
+        for name in list(self._module_hashes):
+            if name in hashes:
+                continue
+            module = f"{package}.{name}"
+            self.unregister_module(module)
+            sys.modules.pop(module, None)
+            cache_file = os.path.join(cache_dir, f"{name}.py")
+            if os.path.isfile(cache_file):
+                os.remove(cache_file)
+            del self._module_hashes[name]
+            changed = True
+            logger.info(f"[Function] 已移除模块 {name}")
+
+        for name, digest in hashes.items():
+            module = f"{package}.{name}"
+            if self._module_hashes.get(name) == digest and module in sys.modules:
+                continue
+            shutil.copy(os.path.join(func_dir, f"{name}.py"), cache_dir)
+            self.unregister_module(module)
+            importlib.invalidate_caches()
+            try:
+                if sys.modules.get(module):
+                    importlib.reload(sys.modules[module])
+                else:
+                    importlib.import_module(module)
+            except Exception as e:
+                logger.opt(exception=e).error(f"[Function] 加载模块 {name} 失败: {e}")
+                self._module_hashes.pop(name, None)
+                continue
+            self._module_hashes[name] = digest
+            changed = True
+        return changed
+
     def tool_names(self):
         tool_names = list(self.tools.keys())
         tool_names.extend(
@@ -137,11 +285,17 @@ class ToolsFunction(BaseModel):
         ctx: FuncContext[ToolCallConfig],
     ):
         tool = self.tools.get(function_call.name)
+        event_log.event(
+            "function_call",
+            session,
+            tool=function_call.name,
+            arguments=function_call.arguments,
+        )
         if tool:
             kwargs = json.loads(function_call.arguments)
             kwargs["ctx"] = ctx
             result = await tool.func(**kwargs)
-            session.messages.append(
+            session.add_message(
                 ChatCompletionFunctionMessageParam(
                     role="function",
                     name=function_call.name,
@@ -162,19 +316,54 @@ class ToolsFunction(BaseModel):
         ctx: FuncContext[ToolCallConfig],
     ):
         tool = self.tools.get(tool_call.function.name)
+        event_log.event(
+            "tool_call",
+            ctx.session,
+            tool=tool_call.function.name,
+            arguments=tool_call.function.arguments,
+        )
         if tool:
-            kwargs = json.loads(tool_call.function.arguments)
-            kwargs["ctx"] = ctx
-            result = await tool.func(**kwargs)
-            ctx.session.messages.append(
-                ChatCompletionToolMessageParam(
-                    tool_call_id=tool_call.id,
-                    role="tool",
-                    name=tool_call.function.name,
-                    content=result.data,
+            with tracer.span(f"tool:{tool.name}"):
+                if self._cassette and self._cassette.mode == "replay":
+                    result = await self._cassette.replay_tool(tool_call.function.name)
+                    if result is None:
+                        result = ToolCallResponse(
+                            name=tool_call.function.name,
+                            content_type="str",
+                            content=None,
+                            data=f"failed, tool({tool_call.function.name}) has no recorded result",
+                        )
+                else:
+                    kwargs = json.loads(tool_call.function.arguments)
+                    kwargs["ctx"] = ctx
+                    start = time.perf_counter()
+                    try:
+                        result = await tool.func(**kwargs)
+                    except Exception:
+                        TOOL_DURATION.observe(
+                            time.perf_counter() - start, tool=tool.name, status="error"
+                        )
+                        TOOL_FAILURES.inc(tool=tool.name)
+                        raise
+                    TOOL_DURATION.observe(
+                        time.perf_counter() - start, tool=tool.name, status="ok"
+                    )
+                    if self._cassette:
+                        self._cassette.record_tool(
+                            tool_call.function.name,
+                            tool_call.function.arguments,
+                            result,
+                            time.perf_counter() - start,
+                        )
+                ctx.session.add_message(
+                    ChatCompletionToolMessageParam(
+                        tool_call_id=tool_call.id,
+                        role="tool",
+                        name=tool_call.function.name,
+                        content=result.data,
+                    )
                 )
-            )
-            return result
+                return result
         return ToolCallResponse(
             name=tool_call.function.name,
             content_type="str",
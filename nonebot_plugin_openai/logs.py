@@ -0,0 +1,116 @@
+import json
+import random
+from typing import Any, Callable, Dict, Optional, Set, Union
+
+from loguru import logger
+
+from .config import config
+from .types import Session
+
+SAMPLED_LEVELS = {"TRACE", "DEBUG", "INFO"}
+
+
+class EventLogger:
+    """
+    EventLogger 用于热点路径上的结构化日志。
+
+    日志内容只在 loguru 确认需要输出时才格式化，字段值可以是无参函数，同样延迟求值；
+    INFO 及以下级别的事件按 sample_rate 采样，超过 max_chars 的字段会被截断。
+    开启调试的会话不采样、不截断，并且可以输出完整的对象。
+
+    Attributes:
+        sample_rate (float): INFO 及以下级别事件的采样率。
+
+        max_chars (int): 单个字段的最大字符数，为 0 时不截断。
+
+        debug_sessions (Set[str]): 开启调试的会话 ID。
+    """
+
+    def __init__(self, sample_rate: float = 1.0, max_chars: int = 200):
+        self.sample_rate = sample_rate
+        self.max_chars = max_chars
+        self.debug_sessions: Set[str] = set()
+
+    @staticmethod
+    def session_id(session: Union[Session, str, None]) -> Optional[str]:
+        if isinstance(session, Session):
+            return session.id
+        return session
+
+    def is_debug(self, session: Union[Session, str, None]) -> bool:
+        return self.session_id(session) in self.debug_sessions
+
+    def set_debug(self, session_id: str, enabled: bool) -> None:
+        if enabled:
+            self.debug_sessions.add(session_id)
+        else:
+            self.debug_sessions.discard(session_id)
+
+    def truncate(self, value: Any) -> Any:
+        if isinstance(value, str) and self.max_chars and len(value) > self.max_chars:
+            return f"{value[: self.max_chars]}...(+{len(value) - self.max_chars})"
+        if isinstance(value, (list, tuple)):
+            return [self.truncate(item) for item in value]
+        if isinstance(value, dict):
+            return {key: self.truncate(item) for key, item in value.items()}
+        return value
+
+    def render(self, fields: Dict[str, Any], full: bool) -> str:
+        parts = []
+        for key, value in fields.items():
+            if callable(value):
+                value = value()
+            if not full:
+                value = self.truncate(value)
+            parts.append(
+                f"{key}={json.dumps(value, ensure_ascii=False, default=str)}"
+            )
+        return " ".join(parts)
+
+    def event(
+        self,
+        name: str,
+        session: Union[Session, str, None] = None,
+        level: str = "INFO",
+        **fields: Any,
+    ) -> None:
+        """
+        输出一条结构化事件。
+
+        参数:
+            name (str): 事件名称。
+            session (Union[Session, str, None]): 事件所属的会话，用于调试开关。
+            level (str): 日志级别。
+            **fields: 事件字段，值为无参函数时在输出前才求值。
+        """
+        session_id = self.session_id(session)
+        full = session_id in self.debug_sessions
+        if (
+            not full
+            and level in SAMPLED_LEVELS
+            and self.sample_rate < 1
+            and random.random() >= self.sample_rate
+        ):
+            return
+        logger.opt(lazy=True, depth=1).log(
+            level,
+            "[{}] session={} {}",
+            lambda: name,
+            lambda: session_id,
+            lambda: self.render(fields, full),
+        )
+
+    def dump(
+        self, name: str, session: Union[Session, str, None], obj: Callable[[], Any]
+    ) -> None:
+        """只在会话开启调试时输出完整对象，obj 为返回对象的无参函数"""
+        if not self.is_debug(session):
+            return
+        logger.opt(lazy=True, depth=1).info(
+            "[{}] {} {}", lambda: name, lambda: self.session_id(session), obj
+        )
+
+
+event_log = EventLogger(
+    sample_rate=config.openai_log_sample_rate, max_chars=config.openai_log_max_chars
+)
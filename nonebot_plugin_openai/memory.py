@@ -0,0 +1,208 @@
+import asyncio
+import re
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+from weakref import WeakSet
+
+from loguru import logger
+from openai import AsyncOpenAI
+
+from .embedding import HashEmbedder, VectorIndex, normalize, numpy_available
+from .types import ChatMessage, Session
+
+
+class MemoryStore:
+    """
+    MemoryStore 是按会话划分的长期记忆，把滑出上下文窗口的消息向量化后存入本地索引。
+
+    每轮对话前只检索与最新提问最相关的 top_k 条记忆注入提示词，
+    窗口可以保持较小，旧的对话内容也不会被完全遗忘。
+
+    Attributes:
+        path (Path): 索引文件所在的文件夹，每个会话一个 .npz 文件。
+
+        embedding_model (str): 使用渠道的向量化模型，为空时使用本地的 HashEmbedder。
+
+        top_k (int): 每轮最多注入的记忆条数。
+
+        min_score (float): 注入记忆的最低相似度。
+
+        max_chars (int): 单条记忆保存的最大字符数。
+
+        max_indexes (int): 内存中最多保留的索引数，超出后淘汰最久未使用的，再次使用时从文件读取。
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        embedding_model: str = "",
+        top_k: int = 3,
+        min_score: float = 0.3,
+        max_chars: int = 500,
+        max_indexes: int = 128,
+    ):
+        self.path = path
+        self.embedding_model = embedding_model
+        self.top_k = top_k
+        self.min_score = min_score
+        self.max_chars = max_chars
+        self.max_indexes = max_indexes
+        self.enabled = numpy_available()
+        self.embedder = HashEmbedder() if self.enabled else None
+        self.indexes: "OrderedDict[str, VectorIndex]" = OrderedDict()
+        # 正在后台写入文件的索引，被淘汰后写入完成前再次使用时直接取回，不读取旧文件
+        self.saving: Dict[str, VectorIndex] = {}
+        # 已清除的索引，清除前开始的写入完成后需要再删除一次文件
+        self.cleared: "WeakSet[VectorIndex]" = WeakSet()
+
+    def file_path(self, session_id: str) -> Path:
+        name = re.sub(r"[^\w-]", "_", session_id)
+        return self.path / f"{name}.npz"
+
+    def get_index(self, session_id: str) -> VectorIndex:
+        index = self.indexes.get(session_id)
+        if index is not None:
+            self.indexes.move_to_end(session_id)
+            return index
+        # VectorIndex 为空时也是假值，不能用 or
+        index = self.saving.get(session_id)
+        if index is None:
+            index = VectorIndex.load(self.file_path(session_id))
+        self.cache_index(session_id, index)
+        return index
+
+    def cache_index(self, session_id: str, index: VectorIndex) -> None:
+        self.indexes[session_id] = index
+        self.indexes.move_to_end(session_id)
+        if len(self.indexes) > self.max_indexes:
+            self.indexes.popitem(last=False)
+
+    async def save_index(self, session_id: str, index: VectorIndex) -> None:
+        """在线程中写入索引文件，避免阻塞事件循环"""
+        self.saving[session_id] = index
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                None,
+                VectorIndex.write,
+                self.file_path(session_id),
+                list(index.keys),
+                index.vectors,
+            )
+        finally:
+            if self.saving.get(session_id) is index:
+                del self.saving[session_id]
+            if index in self.cleared and not (
+                session_id in self.indexes or session_id in self.saving
+            ):
+                self.file_path(session_id).unlink(missing_ok=True)
+
+    async def embed(
+        self, texts: List[str], client: Optional[AsyncOpenAI] = None
+    ) -> "np.ndarray":
+        if self.embedding_model and client:
+            try:
+                resp = await client.embeddings.create(
+                    model=self.embedding_model, input=texts
+                )
+                return normalize([item.embedding for item in resp.data])
+            except Exception as e:
+                logger.warning(f"[Memory] 向量化失败，使用本地向量化: {e}")
+        return self.embedder.embed_many(texts)
+
+    def to_text(self, message: ChatMessage) -> str:
+        if message.role not in ("user", "assistant"):
+            return ""
+        if not isinstance(message.content, str) or not message.content:
+            return ""
+        return f"{message.role}: {message.content[: self.max_chars]}"
+
+    async def archive(
+        self, session: Session, client: Optional[AsyncOpenAI] = None
+    ) -> None:
+        """把滑出窗口、尚未归档的消息写入会话的记忆索引"""
+        if not self.enabled:
+            return
+        cutoff = len(session.messages) - len(session.get_window())
+        if session.archived > cutoff:
+            session.archived = cutoff
+        if session.archived == cutoff:
+            return
+        texts = [
+            text
+            for text in (
+                self.to_text(ChatMessage.parse(message))
+                for message in session.messages[session.archived : cutoff]
+            )
+            if text
+        ]
+        session.archived = cutoff
+        if not texts:
+            return
+        vectors = await self.embed(texts, client)
+        index = self.get_index(session.id)
+        try:
+            index.add_many(texts, vectors)
+        except ValueError as e:
+            logger.warning(f"[Memory] 会话 {session.id} 的记忆已重置: {e}")
+            index = VectorIndex(vectors.shape[1])
+            index.add_many(texts, vectors)
+            self.cache_index(session.id, index)
+        await self.save_index(session.id, index)
+
+    async def recall(
+        self, session: Session, client: Optional[AsyncOpenAI] = None
+    ) -> List[str]:
+        """
+        归档旧消息并检索与最新提问相关的记忆。
+
+        参数:
+            session (Session): 当前的会话对象。
+            client (Optional[AsyncOpenAI]): 使用渠道向量化时的客户端。
+
+        返回:
+            List[str]: 相关的记忆，按相似度降序排列。
+        """
+        if not self.enabled or not session.messages:
+            return []
+        await self.archive(session, client)
+        query = ChatMessage.parse(session.messages[-1])
+        if query.role != "user" or not isinstance(query.content, str):
+            return []
+        index = self.get_index(session.id)
+        if not len(index):
+            return []
+        vector = (await self.embed([query.content], client))[0]
+        if vector.shape[0] != index.dim:
+            return []
+        return [
+            text
+            for text, _ in index.search(
+                vector, top_k=self.top_k, min_score=self.min_score
+            )
+        ]
+
+    def stats(self, session_id: str) -> Dict[str, int]:
+        """会话记忆的条数和占用的字节数，索引未加载时只统计文件大小"""
+        index = self.indexes.get(session_id, self.saving.get(session_id))
+        if index is not None:
+            return {
+                "entries": len(index),
+                "bytes": index.vectors.nbytes + sum(len(key) for key in index.keys),
+            }
+        file_path = self.file_path(session_id)
+        return {
+            "entries": -1,
+            "bytes": file_path.stat().st_size if file_path.is_file() else 0,
+        }
+
+    def clear(self, session_id: str) -> None:
+        for index in (
+            self.indexes.pop(session_id, None),
+            self.saving.pop(session_id, None),
+        ):
+            if index is not None:
+                self.cleared.add(index)
+        file_path = self.file_path(session_id)
+        if file_path.is_file():
+            file_path.unlink()
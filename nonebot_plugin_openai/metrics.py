@@ -0,0 +1,304 @@
+import asyncio
+import math
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from loguru import logger
+
+LabelValues = Tuple[str, ...]
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_sample(name: str, labels: Dict[str, str], value: float) -> str:
+    if labels:
+        label_text = ",".join(f'{key}="{escape(val)}"' for key, val in labels.items())
+        name = f"{name}{{{label_text}}}"
+    if math.isinf(value):
+        text = "+Inf" if value > 0 else "-Inf"
+    elif value == int(value):
+        text = str(int(value))
+    else:
+        text = repr(value)
+    return f"{name} {text}"
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.values: Dict[LabelValues, float] = {}
+
+    def key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def samples(self) -> Iterable[Sample]:
+        for key, value in list(self.values.items()):
+            yield self.name, dict(zip(self.label_names, key)), value
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, value: float = 1.0, **labels: str) -> None:
+        key = self.key(labels)
+        self.values[key] = self.values.get(key, 0.0) + value
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        self.values[self.key(labels)] = value
+
+    def inc(self, value: float = 1.0, **labels: str) -> None:
+        key = self.key(labels)
+        self.values[key] = self.values.get(key, 0.0) + value
+
+    def dec(self, value: float = 1.0, **labels: str) -> None:
+        self.inc(-value, **labels)
+
+
+class Histogram(Metric):
+    type = "histogram"
+    DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self.counts: Dict[LabelValues, List[int]] = {}
+        self.sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self.key(labels)
+        counts = self.counts.setdefault(key, [0] * len(self.buckets))
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        self.sums[key] = self.sums.get(key, 0.0) + value
+
+    @contextmanager
+    def time(self, **labels: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> Iterable[Sample]:
+        for key, counts in list(self.counts.items()):
+            labels = dict(zip(self.label_names, key))
+            total = 0
+            for bound, count in zip(self.buckets, counts):
+                total += count
+                le = "+Inf" if math.isinf(bound) else repr(float(bound))
+                yield f"{self.name}_bucket", {**labels, "le": le}, total
+            yield f"{self.name}_sum", labels, self.sums[key]
+            yield f"{self.name}_count", labels, total
+
+
+class Registry:
+    """
+    Registry 是轻量的指标注册表，按 Prometheus 文本格式导出。
+
+    除了直接注册的指标外，还可以注册 collector，在导出时读取队列长度、缓存命中率等即时状态。
+    """
+
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+        self.collectors: List[Callable[[], Iterable[Tuple[Metric, Dict[str, str], float]]]] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.setdefault(metric.name, metric)
+        return self.metrics[metric.name]
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labels))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = Histogram.DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def collector(self, func: Callable[[], Iterable[Tuple[Metric, Dict[str, str], float]]]):
+        """注册 collector，返回 (指标, 标签, 值)，导出时调用"""
+        self.collectors.append(func)
+        return func
+
+    def render(self) -> str:
+        collected: Dict[str, List[Sample]] = {}
+        for collector in self.collectors:
+            try:
+                for metric, labels, value in collector():
+                    collected.setdefault(metric.name, []).append(
+                        (metric.name, labels, value)
+                    )
+            except Exception as e:
+                logger.warning(f"[Metrics] collector {collector.__name__} 出错: {e}")
+        lines = []
+        for metric in self.metrics.values():
+            samples = list(metric.samples()) + collected.get(metric.name, [])
+            if not samples:
+                continue
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(format_sample(*sample) for sample in samples)
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+UPSTREAM_LATENCY = registry.histogram(
+    "openai_upstream_latency_seconds",
+    "上游请求耗时",
+    ["channel", "model", "status"],
+)
+UPSTREAM_RETRIES = registry.counter(
+    "openai_upstream_retries_total", "上游请求重试次数", ["channel", "model"]
+)
+TOKENS = registry.counter("openai_tokens_total", "消耗的 token 数", ["model", "kind"])
+CHANNEL_BREAKER = registry.gauge(
+    "openai_channel_breaker_state", "渠道熔断状态，0 关闭、1 半开、2 熔断", ["channel"]
+)
+CHANNEL_IN_FLIGHT = registry.gauge(
+    "openai_channel_in_flight", "渠道正在进行的请求数", ["channel"]
+)
+CHANNEL_PROBES = registry.counter(
+    "openai_channel_probes_total", "渠道探测次数", ["channel", "status"]
+)
+ROUTER_TURNS = registry.counter(
+    "openai_router_turns_total", "自动选择模型的对话轮数", ["tier", "reason"]
+)
+ROUTER_LATENCY = registry.histogram(
+    "openai_router_latency_seconds", "各档位首次回复的耗时", ["tier"]
+)
+TOOL_DURATION = registry.histogram(
+    "openai_tool_duration_seconds", "工具调用耗时", ["tool", "status"]
+)
+TOOL_FAILURES = registry.counter(
+    "openai_tool_failures_total", "工具调用失败次数", ["tool"]
+)
+DUPLICATE_EVENTS = registry.counter(
+    "openai_duplicate_events_total", "丢弃的重复投递的消息事件数"
+)
+TURNS_IN_FLIGHT = registry.gauge("openai_turns_in_flight", "正在进行的对话轮数")
+SESSIONS = registry.gauge("openai_sessions", "会话数量")
+CACHE_REQUESTS = registry.counter(
+    "openai_cache_requests_total", "缓存查询次数", ["cache", "result"]
+)
+CACHE_HIT_RATE = registry.gauge("openai_cache_hit_rate", "缓存命中率", ["cache"])
+CACHE_SIZE = registry.gauge("openai_cache_entries", "缓存条目数", ["cache"])
+PERSISTENCE_FLUSH = registry.histogram(
+    "openai_persistence_flush_seconds",
+    "配置文件写入耗时",
+    ["file"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+LOOP_LAG = registry.histogram(
+    "openai_event_loop_lag_seconds",
+    "事件循环延迟",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+LOOP_BLOCKS = registry.counter(
+    "openai_event_loop_blocks_total", "事件循环被阻塞的次数", ["source"]
+)
+RETAINED_BYTES = registry.gauge(
+    "openai_retained_bytes", "估算的内存占用", ["component", "name"]
+)
+
+BREAKER_VALUES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+def setup_exporter(path: str = "", file: str = "", interval: float = 15.0) -> None:
+    """
+    导出指标。
+
+    参数:
+        path (str): 在 NoneBot 驱动的 HTTP 服务上暴露的路径，为空时不暴露，驱动不支持时会跳过。
+        file (str): 定时写入的文件，为空时不写入。
+        interval (float): 写入文件的间隔（秒）。
+    """
+    from nonebot import get_driver
+
+    driver = get_driver()
+    if path:
+        try:
+            from nonebot.drivers import (
+                HTTPServerSetup,
+                ReverseDriver,
+                Request,
+                Response,
+                URL,
+            )
+        except ImportError:
+            ReverseDriver = None
+        if ReverseDriver and isinstance(driver, ReverseDriver):
+
+            async def handle(request: "Request") -> "Response":
+                return Response(
+                    200,
+                    headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+                    content=registry.render(),
+                )
+
+            driver.setup_http_server(
+                HTTPServerSetup(
+                    path=URL(path), method="GET", name="openai_metrics", handle_func=handle
+                )
+            )
+            logger.info(f"[Metrics] 指标已暴露在 {path}")
+        else:
+            logger.warning("[Metrics] 当前驱动不支持 HTTP 服务，无法暴露指标接口")
+    if file:
+
+        async def write_loop():
+            file_path = Path(file)
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+            while True:
+                await asyncio.sleep(interval)
+                write_file(file_path)
+
+        task: Optional[asyncio.Task] = None
+
+        @driver.on_startup
+        async def _():
+            nonlocal task
+            task = asyncio.ensure_future(write_loop())
+
+        @driver.on_shutdown
+        async def _():
+            if task:
+                task.cancel()
+            write_file(Path(file))
+
+
+def write_file(file_path: Path) -> None:
+    try:
+        tmp_path = file_path.with_suffix(file_path.suffix + ".tmp")
+        tmp_path.write_text(registry.render(), encoding="utf-8")
+        os.replace(tmp_path, file_path)
+    except Exception as e:
+        logger.warning(f"[Metrics] 写入 {file_path} 失败: {e}")
@@ -0,0 +1,116 @@
+import importlib.util
+from typing import Callable, Optional
+
+import httpx
+from loguru import logger
+
+
+def http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+class HTTPPool:
+    """
+    HTTPPool 描述一个连接池的参数，由它创建的 AsyncClient 使用独立的连接。
+
+    上游 LLM 请求和工具请求分别使用不同的连接池，工具的突发请求不会占满上游请求需要的连接。
+    开启 http2 需要安装 h2，未安装时回退到 HTTP/1.1。
+
+    Attributes:
+        name (str): 连接池名称，用于日志。
+
+        max_connections (int): 最大连接数。
+
+        max_keepalive (int): 保持的空闲连接数。
+
+        keepalive_expiry (float): 空闲连接的保留时间（秒）。
+
+        http2 (bool): 是否使用 HTTP/2。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_connections: int = 100,
+        max_keepalive: int = 20,
+        keepalive_expiry: float = 30.0,
+        http2: bool = False,
+    ):
+        if http2 and not http2_available():
+            logger.warning(f"[HTTP] {name} 连接池开启了 HTTP/2，但没有安装 h2，将使用 HTTP/1.1")
+            http2 = False
+        self.name = name
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.http2 = http2
+
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    def transport(self) -> httpx.AsyncHTTPTransport:
+        return httpx.AsyncHTTPTransport(limits=self.limits(), http2=self.http2)
+
+    def client(
+        self,
+        timeout: httpx.Timeout,
+        base_url: str = "",
+        wrap: Optional[
+            Callable[[httpx.AsyncBaseTransport], httpx.AsyncBaseTransport]
+        ] = None,
+    ) -> httpx.AsyncClient:
+        """
+        创建使用该连接池参数的 AsyncClient。
+
+        参数:
+            timeout (httpx.Timeout): 默认超时。
+            base_url (str): 基础 URL。
+            wrap (Optional[Callable]): 包装底层 transport，例如录制请求。
+        """
+        transport = self.transport()
+        return httpx.AsyncClient(
+            base_url=base_url,
+            follow_redirects=True,
+            timeout=timeout,
+            transport=wrap(transport) if wrap else transport,
+        )
+
+
+class Timeouts:
+    """
+    Timeouts 保存各类请求的超时（秒），connect 同时用作建立连接和等待空闲连接的超时。
+
+    Attributes:
+        connect (float): 建立连接的超时。
+
+        chat (float): 对话（包括图片识别和向量化）的超时。
+
+        tts (float): 语音合成的超时。
+
+        image (float): 图片生成的超时。
+
+        tool (float): 工具通过 FuncContext.http_client 发出的请求的超时。
+    """
+
+    def __init__(
+        self,
+        connect: float = 10.0,
+        chat: float = 120.0,
+        tts: float = 60.0,
+        image: float = 120.0,
+        tool: float = 30.0,
+    ):
+        self.connect = connect
+        self.chat = chat
+        self.tts = tts
+        self.image = image
+        self.tool = tool
+
+    def get(self, operation: str) -> httpx.Timeout:
+        return httpx.Timeout(
+            getattr(self, operation), connect=self.connect, pool=self.connect
+        )
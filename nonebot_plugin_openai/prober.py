@@ -0,0 +1,107 @@
+import asyncio
+import time
+from typing import TYPE_CHECKING, Optional
+
+from loguru import logger
+
+from .metrics import CHANNEL_PROBES
+from .types import Channel
+
+if TYPE_CHECKING:
+    from ._openai import OpenAIClient
+
+
+class ChannelProber:
+    """
+    ChannelProber 在启动时预先建立到各渠道的连接，并定时探测渠道是否可用。
+
+    探测请求为 GET {base_url}/models，定时探测的结果通过 ChannelState.record_probe 更新熔断状态：
+    连续探测失败的渠道会在用户请求之前被熔断，探测成功则恢复。
+    预热只用于建立连接，失败时不计入熔断状态，启动时短暂不可达的渠道不会一开始就被熔断。
+    interval 小于连接池的 keepalive_expiry 时，探测还能让空闲连接保持可用。
+
+    Attributes:
+        client (OpenAIClient): 提供渠道列表和连接池的客户端。
+
+        interval (float): 探测间隔（秒），为 0 时只在启动时预热。
+
+        timeout (float): 单次探测的超时（秒）。
+
+        connections (int): 预热时每个渠道同时建立的连接数。
+    """
+
+    def __init__(
+        self,
+        client: "OpenAIClient",
+        interval: float = 0.0,
+        timeout: float = 10.0,
+        connections: int = 2,
+    ):
+        self.client = client
+        self.interval = interval
+        self.timeout = timeout
+        self.connections = connections
+        self.task: Optional[asyncio.Task] = None
+
+    async def probe(self, channel: Channel, record: bool = True) -> bool:
+        """
+        探测渠道。
+
+        参数:
+            channel (Channel): 需要探测的渠道。
+            record (bool): 是否把结果计入熔断状态，预热时为 False。
+
+        返回:
+            bool: 渠道是否可用。
+        """
+        state = self.client.channel_states.get(channel, self.client.channels)
+        start = time.perf_counter()
+        try:
+            response = await self.client.list_models(channel, self.timeout)
+            # 401/403 说明密钥不可用，其余 4xx（例如不支持 /models）说明渠道本身可达
+            ok = response.status_code < 500 and response.status_code not in (401, 403)
+            error = "" if ok else f"HTTP {response.status_code}"
+        except Exception as e:
+            ok = False
+            error = f"{type(e).__name__}: {e}"
+        if not record:
+            if not ok:
+                logger.info(f"[Probe] 渠道 {state.name} 预热失败: {error}")
+            return ok
+        was_ok = state.probe_ok
+        state.record_probe(ok, time.perf_counter() - start, error)
+        CHANNEL_PROBES.inc(channel=state.name, status="ok" if ok else "error")
+        if not ok and was_ok is not False:
+            logger.warning(f"[Probe] 渠道 {state.name} 探测失败: {error}")
+        elif ok and was_ok is False:
+            logger.info(f"[Probe] 渠道 {state.name} 已恢复")
+        return ok
+
+    async def probe_all(self, connections: int = 1, record: bool = True) -> None:
+        await asyncio.gather(
+            *(
+                self.probe(channel, record)
+                for channel in list(self.client.channels)
+                for _ in range(connections)
+            )
+        )
+
+    async def warm_up(self) -> None:
+        """并发探测每个渠道 connections 次，让连接池预先建立连接，结果不计入熔断状态"""
+        await self.probe_all(self.connections, record=False)
+
+    def start(self) -> None:
+        self.task = asyncio.ensure_future(self.run())
+
+    def stop(self) -> None:
+        if self.task:
+            self.task.cancel()
+
+    async def run(self) -> None:
+        if self.connections > 0:
+            await self.warm_up()
+        if self.interval <= 0:
+            return
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.probe_all()
@@ -0,0 +1,222 @@
+import asyncio
+import sys
+import time
+import tracemalloc
+from collections import deque
+from pathlib import Path
+from types import (
+    BuiltinFunctionType,
+    CodeType,
+    FrameType,
+    FunctionType,
+    MethodType,
+    ModuleType,
+)
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from .types import Session
+
+# 这些对象属于代码而不是数据，遍历时跳过，避免统计到整个模块
+SKIP_TYPES = (
+    type,
+    ModuleType,
+    FunctionType,
+    MethodType,
+    BuiltinFunctionType,
+    CodeType,
+    FrameType,
+)
+
+
+def deep_size(obj: Any, seen: Optional[Set[int]] = None) -> int:
+    """
+    估算对象及其引用的对象占用的内存（字节）。
+
+    已在 seen 中的对象不会重复计算，多个组件共享的对象只计入最先统计的组件。
+
+    参数:
+        obj (Any): 需要统计的对象。
+        seen (Optional[Set[int]]): 已统计过的对象 id。
+
+    返回:
+        int: 估算的字节数。
+    """
+    seen = set() if seen is None else seen
+    size = 0
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen or isinstance(item, SKIP_TYPES):
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item, 0)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset, deque)):
+            stack.extend(item)
+        elif not isinstance(item, (str, bytes, int, float, bool)):
+            if hasattr(item, "__dict__"):
+                stack.append(item.__dict__)
+            for cls in type(item).__mro__:
+                for slot in getattr(cls, "__slots__", ()):
+                    if hasattr(item, slot):
+                        stack.append(getattr(item, slot))
+    return size
+
+
+def module_size(
+    module: ModuleType,
+    seen: Optional[Set[int]] = None,
+    imported: Set[int] = frozenset(),
+) -> int:
+    """统计模块中定义的数据，imported 中的对象（从其他模块导入的全局变量）不计入"""
+    seen = set() if seen is None else seen
+    size = 0
+    for name, value in vars(module).items():
+        if name.startswith("__") or id(value) in imported:
+            continue
+        size += deep_size(value, seen)
+    return size
+
+
+def global_ids(exclude: Iterable[ModuleType]) -> Set[int]:
+    """除 exclude 外所有已加载模块的全局变量的 id"""
+    exclude_ids = {id(module) for module in exclude}
+    ids: Set[int] = set()
+    for module in list(sys.modules.values()):
+        if module is None or id(module) in exclude_ids:
+            continue
+        try:
+            ids.update(id(value) for value in vars(module).values())
+        except TypeError:
+            continue
+    return ids
+
+
+class MemoryProfiler:
+    """
+    MemoryProfiler 按组件估算插件占用的内存，并提供按需的 tracemalloc 快照对比。
+
+    组件通过 component 注册，统计时按注册顺序进行，共享的对象只计入第一个组件；
+    统计会遍历所有会话，指标导出时只读取缓存的结果，结果超过 interval 秒时在线程中重新统计。
+
+    Attributes:
+        path (Path): 快照和对比结果保存的文件夹。
+
+        module_prefix (str): 工具模块的包名前缀，这些模块之间不视为互相导入。
+
+        interval (float): 统计结果的缓存时间（秒）。
+    """
+
+    def __init__(self, path: Path, module_prefix: str, interval: float = 300.0):
+        self.path = path
+        self.module_prefix = module_prefix
+        self.interval = interval
+        self.components: Dict[str, Callable[[], Iterable[Tuple[str, Any]]]] = {}
+        self.sizes: Dict[Tuple[str, str], int] = {}
+        self.measured_at = 0.0
+        self.snapshot_path: Optional[Path] = None
+        self.refreshing = False
+
+    def component(self, name: str):
+        """注册组件，被装饰的函数返回 (名称, 对象) 的列表"""
+
+        def decorator(func: Callable[[], Iterable[Tuple[str, Any]]]):
+            self.components[name] = func
+            return func
+
+        return decorator
+
+    def measure(self, max_age: float = 0.0) -> Dict[Tuple[str, str], int]:
+        if self.sizes and time.monotonic() - self.measured_at < max_age:
+            return self.sizes
+        seen: Set[int] = set()
+        sizes: Dict[Tuple[str, str], int] = {}
+        imported: Optional[Set[int]] = None
+        for component, func in self.components.items():
+            for name, obj in func():
+                if isinstance(obj, ModuleType):
+                    if imported is None:
+                        imported = global_ids(
+                            module
+                            for module in list(sys.modules.values())
+                            if module is not None
+                            and module.__name__.startswith(self.module_prefix)
+                        )
+                    size = module_size(obj, seen, imported)
+                else:
+                    size = deep_size(obj, seen)
+                key = (component, name)
+                sizes[key] = sizes.get(key, 0) + size
+        self.sizes = sizes
+        self.measured_at = time.monotonic()
+        return sizes
+
+    def refresh(self) -> None:
+        """缓存的结果超过 interval 秒时在线程中重新统计，不等待统计完成"""
+        if (
+            self.refreshing
+            or self.interval <= 0
+            or time.monotonic() - self.measured_at < self.interval
+        ):
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self.refreshing = True
+        # 遍历所有会话比较耗时，放到线程中进行，不阻塞事件循环
+        loop.run_in_executor(None, self.measure).add_done_callback(self._refreshed)
+
+    def _refreshed(self, future: "asyncio.Future") -> None:
+        self.refreshing = False
+        if not future.cancelled():
+            # 取出异常，统计期间会话或缓存被修改（RuntimeError）时保留上一次的结果
+            future.exception()
+
+    @staticmethod
+    def session_sizes(
+        sessions: Iterable[Session], exclude: Iterable[Any] = ()
+    ) -> List[Tuple[int, Session]]:
+        """每个会话的大小，exclude 中的对象（例如共享的预设）不计入"""
+        base = {id(obj) for obj in exclude}
+        return [(deep_size(session, set(base)), session) for session in sessions]
+
+    def snapshot(self) -> Path:
+        """保存 tracemalloc 快照，第一次调用时开始追踪，之后的 diff 会与这次快照对比"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+        self.path.mkdir(parents=True, exist_ok=True)
+        path = self.path / f"snapshot-{time.strftime('%Y%m%d-%H%M%S')}.pickle"
+        tracemalloc.take_snapshot().dump(str(path))
+        self.snapshot_path = path
+        return path
+
+    def diff(self, top: int = 10) -> Tuple[Path, List[str]]:
+        """
+        与上一次快照对比，结果写入文本文件。
+
+        返回:
+            Tuple[Path, List[str]]: 结果文件路径和增长最多的 top 条记录。
+        """
+        if not self.snapshot_path or not tracemalloc.is_tracing():
+            raise RuntimeError("还没有保存过快照")
+        old = tracemalloc.Snapshot.load(str(self.snapshot_path))
+        new = tracemalloc.take_snapshot()
+        filters = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ]
+        old = old.filter_traces(filters)
+        new = new.filter_traces(filters)
+        # 摘要按分配所在的行汇总，文件中保留完整的调用栈
+        lines = [str(stat) for stat in new.compare_to(old, "lineno")[:top]]
+        path = self.path / f"diff-{time.strftime('%Y%m%d-%H%M%S')}.txt"
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"对比快照: {self.snapshot_path.name}\n")
+            for stat in new.compare_to(old, "traceback")[:100]:
+                f.write(f"{stat}\n")
+                f.write("\n".join(stat.traceback.format(most_recent_first=True)))
+                f.write("\n\n")
+        return path, lines
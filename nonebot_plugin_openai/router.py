@@ -0,0 +1,176 @@
+import re
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, List, Literal, Optional, Tuple
+
+from openai.types.completion_usage import CompletionUsage
+
+from .metrics import ROUTER_LATENCY, ROUTER_TURNS
+from .types import Session
+
+Tier = Literal["fast", "strong"]
+Rule = Callable[[Session, str, str], bool]
+
+
+class RouteDecision:
+    __slots__ = ("tier", "model", "reason")
+
+    def __init__(self, tier: Tier, model: str, reason: str):
+        self.tier = tier
+        self.model = model
+        self.reason = reason
+
+
+class TierStats:
+    """单个档位的轮数、首次回复耗时和 token 消耗"""
+
+    def __init__(self, window: int = 256):
+        self.turns = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.reasons: Dict[str, int] = {}
+        self.latencies: Deque[float] = deque(maxlen=window)
+
+    def percentile(self, q: float) -> float:
+        if not self.latencies:
+            return 0.0
+        values = sorted(self.latencies)
+        return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+class ModelRouter:
+    """
+    ModelRouter 在没有指定模型时，用本地的简单规则为每轮对话选择模型档位。
+
+    规则按顺序判断，第一条命中的规则把对话升级到 strong 档位，都未命中时使用 fast 档位；
+    预设可以通过 tier 固定档位。会话升级后 sticky 秒内的后续对话继续使用 strong 档位，
+    避免复杂话题的追问被降级。
+
+    Attributes:
+        models (Dict[Tier, str]): 每个档位使用的模型。
+
+        vision_model (str): 消息含图片时使用的模型，为空时使用 strong 档位的模型。
+
+        long_chars (int): 超过该长度的消息视为复杂。
+
+        keywords (List[str]): 出现时视为复杂的关键词。
+
+        tool_keywords (List[str]): 出现时视为需要调用工具的关键词。
+
+        sticky (float): 升级后保持 strong 档位的时间（秒）。
+
+        rules (List[Tuple[str, str, Rule]]): (名称, 说明, 判断函数) 的列表。
+
+        stats (Dict[Tier, TierStats]): 每个档位的统计。
+    """
+
+    def __init__(
+        self,
+        fast_model: str,
+        strong_model: str,
+        vision_model: str = "",
+        long_chars: int = 200,
+        keywords: Iterable[str] = (),
+        tool_keywords: Iterable[str] = (),
+        sticky: float = 300.0,
+    ):
+        self.models: Dict[Tier, str] = {"fast": fast_model, "strong": strong_model}
+        self.vision_model = vision_model
+        self.long_chars = long_chars
+        self.keywords = list(keywords)
+        self.tool_keywords = list(tool_keywords)
+        self.sticky = sticky
+        self._keyword_pattern = self.compile(self.keywords)
+        self._tool_pattern = self.compile(self.tool_keywords)
+        self.escalated_at: Dict[str, float] = {}
+        self.stats: Dict[Tier, TierStats] = {"fast": TierStats(), "strong": TierStats()}
+        self.rules: List[Tuple[str, str, Rule]] = [
+            ("image", "消息包含图片", lambda session, text, image: bool(image)),
+            (
+                "long",
+                f"消息超过 {long_chars} 字",
+                lambda session, text, image: len(text) > self.long_chars,
+            ),
+            (
+                "code",
+                "消息包含代码块",
+                lambda session, text, image: "```" in text,
+            ),
+            (
+                "keyword",
+                "消息包含复杂任务关键词",
+                lambda session, text, image: self.match(self._keyword_pattern, text),
+            ),
+            (
+                "tool",
+                "消息可能需要调用工具",
+                lambda session, text, image: self.match(self._tool_pattern, text),
+            ),
+            (
+                "sticky",
+                f"会话在 {sticky:.0f} 秒内升级过",
+                lambda session, text, image: time.monotonic()
+                - self.escalated_at.get(session.id, float("-inf"))
+                < self.sticky,
+            ),
+        ]
+
+    @staticmethod
+    def compile(keywords: List[str]) -> Optional[re.Pattern]:
+        if not keywords:
+            return None
+        return re.compile("|".join(map(re.escape, keywords)), re.IGNORECASE)
+
+    @staticmethod
+    def match(pattern: Optional[re.Pattern], text: str) -> bool:
+        return bool(pattern and pattern.search(text))
+
+    def route(self, session: Session, text: str, image_url: str = "") -> RouteDecision:
+        """
+        为一轮对话选择模型。
+
+        参数:
+            session (Session): 当前的会话。
+            text (str): 用户的消息。
+            image_url (str): 消息中的图片。
+
+        返回:
+            RouteDecision: 选择的档位、模型和原因。
+        """
+        tier: Optional[Tier] = session.preset.tier if session.preset else None
+        reason = "preset"
+        if tier is None:
+            tier, reason = "fast", "default"
+            for name, _, rule in self.rules:
+                if rule(session, text, image_url):
+                    tier, reason = "strong", name
+                    break
+        model = self.models[tier]
+        if image_url and self.vision_model:
+            model = self.vision_model
+        if tier == "strong" and reason not in ("preset", "sticky"):
+            if len(self.escalated_at) > 4096:
+                cutoff = time.monotonic() - self.sticky
+                self.escalated_at = {
+                    key: value
+                    for key, value in self.escalated_at.items()
+                    if value > cutoff
+                }
+            self.escalated_at[session.id] = time.monotonic()
+        return RouteDecision(tier, model, reason)
+
+    def record(
+        self,
+        decision: RouteDecision,
+        latency: float,
+        usage: Optional[CompletionUsage] = None,
+    ) -> None:
+        stats = self.stats[decision.tier]
+        stats.turns += 1
+        stats.reasons[decision.reason] = stats.reasons.get(decision.reason, 0) + 1
+        stats.latencies.append(latency)
+        ROUTER_TURNS.inc(tier=decision.tier, reason=decision.reason)
+        ROUTER_LATENCY.observe(latency, tier=decision.tier)
+        if usage:
+            stats.prompt_tokens += usage.prompt_tokens
+            stats.completion_tokens += usage.completion_tokens
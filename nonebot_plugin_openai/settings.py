@@ -1,18 +1,21 @@
 import json
 import os
 from pathlib import Path
-from pydantic import BaseModel, parse_file_as, root_validator
+from pydantic import BaseModel, PrivateAttr, parse_file_as, parse_obj_as
 from nonebot.adapters.onebot.v11 import (
     MessageEvent,
     Message,
     GroupMessageEvent,
     MessageSegment,
 )
-from typing import Any, List, Literal, Optional, Union, Dict
+from typing import Any, List, Literal, Optional, Tuple, Union, Dict
 
-from .types import Channel, Session, Preset
+from .types import Channel, ChatMessage, Session, Preset
 from .config import config
 from .utils import reload
+from .trigger import TriggerMatcher
+from .metrics import PERSISTENCE_FLUSH
+from .state import shared_state
 
 
 class Settings(BaseModel):
@@ -20,30 +23,174 @@ class Settings(BaseModel):
     sessions: Dict[str, Session] = {}
     presets: Dict[str, Preset] = {}
     default_preset: Optional[Preset] = None
+    _trigger: Optional[TriggerMatcher] = PrivateAttr(None)
+    # 最近一次写入后文件的 (mtime_ns, size)，用于区分外部修改
+    _written: Optional[Tuple[int, int]] = PrivateAttr(None)
+
+    class Config:
+        json_encoders = {ChatMessage: ChatMessage.dict}
 
     __file_path = Path(os.path.join(config.openai_data_path, "settings.json"))
     # __file_path = Path(os.path.join("", "settings.json"))
+    if config.openai_worker_index >= 0:
+        __worker_file_path = Path(
+            os.path.join(
+                config.openai_data_path,
+                f"settings.worker{config.openai_worker_index}.json",
+            )
+        )
+    else:
+        __worker_file_path = None
 
     @property
     def file_path(self) -> Path:
-        return self.__class__.__file_path
-
-    @root_validator(pre=True)
-    def init(cls, values: Dict[str, Any]) -> Dict[str, Any]:
-        if cls.__file_path.is_file():
-            return json.loads(cls.__file_path.read_text("utf-8"))
-        return values
+        return self.__class__.__worker_file_path or self.__class__.__file_path
 
     def reload(self):
+        """读取配置文件，导入插件时不会读取，由 on_startup 第一次调用"""
+        if not self.file_path.is_file() and self.__class__.__worker_file_path:
+            self.seed_worker()
         reload(self)
+        self.refresh_trigger()
+
+    def seed_worker(self):
+        """worker 第一次启动时，从 settings.json 复制配置，只保留属于自己的会话"""
+        from .workers import shard_of
+
+        base = self.__class__.__file_path
+        if not base.is_file():
+            return
+        data = json.loads(base.read_text("utf-8"))
+        data["sessions"] = {
+            session_id: session
+            for session_id, session in data.get("sessions", {}).items()
+            if shard_of(session_id, config.openai_workers)
+            == config.openai_worker_index
+        }
+        os.makedirs(self.file_path.parent, exist_ok=True)
+        self.file_path.write_text(
+            json.dumps(data, ensure_ascii=False, indent=4), encoding="utf-8"
+        )
 
-    def save(self) -> None:
-        if not self.file_path.is_file():
-            os.makedirs(self.file_path.parent, exist_ok=True)
-        self.file_path.write_text(self.json(indent=4, exclude_none=True), encoding="utf-8")
+    @property
+    def trigger(self) -> TriggerMatcher:
+        if self._trigger is None:
+            names = set(
+                session.preset.name
+                for session in self.sessions.values()
+                if session.preset
+            )
+            if self.default_preset:
+                names.add(self.default_preset.name)
+            self._trigger = TriggerMatcher(names)
+        return self._trigger
+
+    def refresh_trigger(self):
+        """会话预设或默认预设变更后调用，下次匹配时重建触发词索引"""
+        self._trigger = None
+
+    def match_trigger(self, event: MessageEvent, text: str) -> bool:
+        """
+        判断消息是否触发了会话的预设，不会为未触发的消息创建会话。
+
+        参数:
+            event (MessageEvent): 消息事件。
+            text (str): 消息的纯文本。
+
+        返回:
+            bool: 是否触发。
+        """
+        names = self.trigger.search(text)
+        if not names:
+            return False
+        session = self.find_session(event)
+        preset = session.preset if session else self.default_preset
+        return bool(preset and preset.name in names)
+
+    def save(self, session: Optional[Session] = None) -> None:
+        """
+        保存配置，使用共享状态时写回共享状态，不再写入本地文件。
+
+        参数:
+            session (Optional[Session]): 有变化的会话，使用共享状态时只写回这个会话。
+        """
+        if shared_state.remote:
+            shared_state.push_settings(self, session)
+            return
+        with PERSISTENCE_FLUSH.time(file="settings"):
+            if not self.file_path.is_file():
+                os.makedirs(self.file_path.parent, exist_ok=True)
+            self.file_path.write_text(
+                self.json(indent=4, exclude_none=True), encoding="utf-8"
+            )
+            stat = self.file_path.stat()
+            self._written = (stat.st_mtime_ns, stat.st_size)
+
+    def is_written(self, signature: Tuple[int, int]) -> bool:
+        """文件的 (mtime_ns, size) 是否就是插件自己最近一次写入的结果"""
+        return self._written == signature
+
+    def apply_file(self) -> bool:
+        """
+        应用外部对配置文件的修改，只更新渠道和预设，不会替换会话，进行中的对话不受影响。
+
+        返回:
+            bool: 是否有变化。
+        """
+        return self.apply_data(json.loads(self.file_path.read_text("utf-8")))
+
+    def apply_data(self, data: Dict[str, Any]) -> bool:
+        """
+        应用配置数据中的渠道和预设，渠道列表整体替换，内容变化的预设替换为新的对象，使用同名预设的会话一并切换。
+
+        参数:
+            data (Dict[str, Any]): settings.json 格式的数据，sessions 会被忽略。
+
+        返回:
+            bool: 是否有变化。
+        """
+        # 只校验渠道和预设，不解析会话
+        channels = parse_obj_as(List[Channel], data.get("channels", []))
+        new_presets = parse_obj_as(Dict[str, Preset], data.get("presets", {}))
+        new_default = parse_obj_as(Optional[Preset], data.get("default_preset"))
+        changed = False
+        if channels and [channel.dict() for channel in channels] != [
+            channel.dict() for channel in self.channels
+        ]:
+            self.channels[:] = channels
+            changed = True
+        presets = dict(new_presets)
+        if new_default:
+            presets.setdefault(new_default.name, new_default)
+        for name in list(self.presets):
+            if name not in new_presets:
+                del self.presets[name]
+                changed = True
+        for name, preset in presets.items():
+            old = self.presets.get(name)
+            if not old and self.default_preset and self.default_preset.name == name:
+                old = self.default_preset
+            if old and old.dict() == preset.dict():
+                continue
+            if name in new_presets:
+                self.presets[name] = preset
+            for session in self.sessions.values():
+                if session.preset and session.preset.name == name:
+                    session.preset = preset
+            changed = True
+        default = new_default and presets[new_default.name]
+        if (default and default.dict()) != (
+            self.default_preset and self.default_preset.dict()
+        ):
+            self.default_preset = default
+            changed = True
+        if changed:
+            self.refresh_trigger()
+        return changed
 
     def add_preset(self, name: str, prompt: str):
         self.presets[name] = Preset(name=name, prompt=prompt)
+        self.refresh_trigger()
 
     def get_preset(self, name: str):
         if self.presets.get(name):
@@ -53,6 +200,10 @@ class Settings(BaseModel):
     def del_preset(self, name: str):
         if self.presets.get(name):
             del self.presets[name]
+            self.refresh_trigger()
+
+    def find_session(self, event: MessageEvent) -> Optional[Session]:
+        return self.sessions.get(event.get_session_id())
 
     def get_session(self, event: MessageEvent, preset: Optional[Preset] = None) -> Session:
         _id = event.get_session_id()
@@ -67,11 +218,14 @@ class Settings(BaseModel):
         _id = event.get_session_id()
         if self.sessions.get(_id):
             self.sessions.get(_id).messages.clear()
+            self.sessions.get(_id).archived = 0
 
     def del_session(self, event: MessageEvent):
         _id = event.get_session_id()
         if self.sessions.get(_id):
             del self.sessions[_id]
+            if shared_state.remote:
+                shared_state.delete_session(_id)
 
 
 settings = Settings()
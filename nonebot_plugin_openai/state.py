@@ -0,0 +1,522 @@
+import asyncio
+import json
+import os
+import socket
+import time
+import uuid
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import unquote, urlparse
+
+from loguru import logger
+
+from .config import config
+from .types import Session
+
+if TYPE_CHECKING:
+    from .function import ToolsFunction
+    from .settings import Settings
+
+# 只有持有者一致时才续期或释放，避免释放已经被其他实例获得的锁
+RENEW_SCRIPT = (
+    "if redis.call('get', KEYS[1]) == ARGV[1] then "
+    "return redis.call('pexpire', KEYS[1], ARGV[2]) else return 0 end"
+)
+RELEASE_SCRIPT = (
+    "if redis.call('get', KEYS[1]) == ARGV[1] then "
+    "return redis.call('del', KEYS[1]) else return 0 end"
+)
+
+
+class StateError(Exception):
+    pass
+
+
+def preset_name(session: Optional[Session]) -> Optional[str]:
+    return session.preset.name if session and session.preset else None
+
+
+class StateBackend:
+    """
+    StateBackend 是共享状态的存储接口，提供字符串、哈希表和带租约的锁。
+
+    租约锁在 ttl 秒后自动过期，持有者需要在过期前续期，进程崩溃时锁不会一直被占用。
+    """
+
+    async def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: str) -> None:
+        raise NotImplementedError
+
+    async def hget(self, key: str, field: str) -> Optional[str]:
+        raise NotImplementedError
+
+    async def hset(self, key: str, field: str, value: str) -> None:
+        raise NotImplementedError
+
+    async def hgetall(self, key: str) -> Dict[str, str]:
+        raise NotImplementedError
+
+    async def hdel(self, key: str, field: str) -> None:
+        raise NotImplementedError
+
+    async def get_and_hget(
+        self, key: str, hash_key: str, field: str
+    ) -> Tuple[Optional[str], Optional[str]]:
+        """同时读取一个字符串和一个哈希表字段，远程后端在一次往返中完成"""
+        return await self.get(key), await self.hget(hash_key, field)
+
+    async def acquire(self, key: str, owner: str, ttl: float) -> bool:
+        raise NotImplementedError
+
+    async def renew(self, key: str, owner: str, ttl: float) -> bool:
+        raise NotImplementedError
+
+    async def release(self, key: str, owner: str) -> None:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class LocalBackend(StateBackend):
+    """进程内的实现，单实例运行时使用，会话等数据仍由本地文件保存"""
+
+    def __init__(self):
+        self.values: Dict[str, str] = {}
+        self.hashes: Dict[str, Dict[str, str]] = {}
+        self.leases: Dict[str, Tuple[str, float]] = {}
+
+    async def get(self, key: str) -> Optional[str]:
+        return self.values.get(key)
+
+    async def set(self, key: str, value: str) -> None:
+        self.values[key] = value
+
+    async def hget(self, key: str, field: str) -> Optional[str]:
+        return self.hashes.get(key, {}).get(field)
+
+    async def hset(self, key: str, field: str, value: str) -> None:
+        self.hashes.setdefault(key, {})[field] = value
+
+    async def hgetall(self, key: str) -> Dict[str, str]:
+        return dict(self.hashes.get(key, {}))
+
+    async def hdel(self, key: str, field: str) -> None:
+        self.hashes.get(key, {}).pop(field, None)
+
+    def holder(self, key: str) -> Optional[str]:
+        lease = self.leases.get(key)
+        if lease and lease[1] > time.monotonic():
+            return lease[0]
+        return None
+
+    async def acquire(self, key: str, owner: str, ttl: float) -> bool:
+        if self.holder(key) is not None:
+            return False
+        self.leases[key] = (owner, time.monotonic() + ttl)
+        return True
+
+    async def renew(self, key: str, owner: str, ttl: float) -> bool:
+        if self.holder(key) != owner:
+            return False
+        self.leases[key] = (owner, time.monotonic() + ttl)
+        return True
+
+    async def release(self, key: str, owner: str) -> None:
+        if self.holder(key) == owner:
+            del self.leases[key]
+
+
+class RedisBackend(StateBackend):
+    """
+    RedisBackend 通过 RESP 协议访问 Redis（或兼容的服务），不依赖额外的库。
+
+    使用单个连接，命令按顺序发送，断开后下一次调用时重新连接。
+
+    Attributes:
+        url (str): 形如 redis://[:password@]host:port/db 的地址。
+
+        timeout (float): 连接和单次请求的超时（秒）。
+    """
+
+    def __init__(self, url: str, timeout: float = 5.0):
+        self.url = url
+        self.timeout = timeout
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    @staticmethod
+    def encode(args: Sequence[Any]) -> bytes:
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            parts.append(f"${len(data)}\r\n".encode())
+            parts.append(data)
+            parts.append(b"\r\n")
+        return b"".join(parts)
+
+    async def read_reply(self) -> Any:
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionError("连接已关闭")
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body.decode("utf-8")
+        if kind == b"-":
+            return StateError(body.decode("utf-8"))
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            size = int(body)
+            if size < 0:
+                return None
+            data = await self.reader.readexactly(size + 2)
+            return data[:-2].decode("utf-8")
+        if kind == b"*":
+            size = int(body)
+            if size < 0:
+                return None
+            return [await self.read_reply() for _ in range(size)]
+        raise StateError(f"无法解析的回复: {line!r}")
+
+    async def connect(self) -> None:
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout
+        )
+        setup: List[Sequence[Any]] = []
+        if self.password:
+            setup.append(("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        for reply in await self.send(setup):
+            if isinstance(reply, StateError):
+                raise reply
+
+    async def send(self, commands: List[Sequence[Any]]) -> List[Any]:
+        self.writer.write(b"".join(self.encode(command) for command in commands))
+        await self.writer.drain()
+        return [
+            await asyncio.wait_for(self.read_reply(), self.timeout) for _ in commands
+        ]
+
+    async def execute(self, *commands: Sequence[Any]) -> List[Any]:
+        """一次发送多条命令并按顺序返回结果，出错的命令对应的结果为 StateError"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            try:
+                if self.writer is None or self.writer.is_closing():
+                    await self.connect()
+                return await self.send(list(commands))
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                # 回复可能已经错位，丢弃连接
+                await self.close()
+                raise StateError(f"Redis 请求失败: {e}") from e
+            except BaseException:
+                # 调用方被取消时命令可能已经发出，未读取的回复会被之后的命令读到
+                await self.close()
+                raise
+
+    async def command(self, *args: Any) -> Any:
+        reply = (await self.execute(args))[0]
+        if isinstance(reply, StateError):
+            raise reply
+        return reply
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self.command("GET", key)
+
+    async def set(self, key: str, value: str) -> None:
+        await self.command("SET", key, value)
+
+    async def hget(self, key: str, field: str) -> Optional[str]:
+        return await self.command("HGET", key, field)
+
+    async def hset(self, key: str, field: str, value: str) -> None:
+        await self.command("HSET", key, field, value)
+
+    async def hgetall(self, key: str) -> Dict[str, str]:
+        values = await self.command("HGETALL", key) or []
+        return dict(zip(values[::2], values[1::2]))
+
+    async def hdel(self, key: str, field: str) -> None:
+        await self.command("HDEL", key, field)
+
+    async def get_and_hget(
+        self, key: str, hash_key: str, field: str
+    ) -> Tuple[Optional[str], Optional[str]]:
+        replies = await self.execute(("GET", key), ("HGET", hash_key, field))
+        for reply in replies:
+            if isinstance(reply, StateError):
+                raise reply
+        return replies[0], replies[1]
+
+    async def acquire(self, key: str, owner: str, ttl: float) -> bool:
+        reply = await self.command("SET", key, owner, "NX", "PX", int(ttl * 1000))
+        return reply == "OK"
+
+    async def renew(self, key: str, owner: str, ttl: float) -> bool:
+        reply = await self.command("EVAL", RENEW_SCRIPT, 1, key, owner, int(ttl * 1000))
+        return reply == 1
+
+    async def release(self, key: str, owner: str) -> None:
+        await self.command("EVAL", RELEASE_SCRIPT, 1, key, owner)
+
+    async def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class Lease:
+    """
+    持有中的会话锁，每 ttl / 3 秒续期一次，直到 release。
+
+    续期失败（例如 Redis 不可用）时，按最后一次成功续期的时间判断租约是否已经过期，
+    过期后锁可能已被其他实例获得，lost 为 True。
+
+    Attributes:
+        expires_at (float): 租约最晚的过期时间（time.monotonic），从发出请求前开始计算。
+    """
+
+    def __init__(
+        self,
+        backend: StateBackend,
+        key: str,
+        owner: str,
+        ttl: float,
+        expires_at: float,
+    ):
+        self.backend = backend
+        self.key = key
+        self.owner = owner
+        self.ttl = ttl
+        self.expires_at = expires_at
+        self.revoked = False
+        self.task = asyncio.ensure_future(self.keep_alive())
+
+    @property
+    def lost(self) -> bool:
+        return self.revoked or time.monotonic() >= self.expires_at
+
+    async def keep_alive(self) -> None:
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            start = time.monotonic()
+            try:
+                renewed = await self.backend.renew(self.key, self.owner, self.ttl)
+            except StateError as e:
+                logger.warning(f"[State] 续期 {self.key} 失败: {e}")
+                continue
+            if not renewed:
+                self.revoked = True
+                logger.warning(f"[State] {self.key} 的租约已失效")
+                return
+            self.expires_at = start + self.ttl
+
+    async def release(self) -> None:
+        self.task.cancel()
+        # 等待进行中的续期结束，再发送释放的命令
+        await asyncio.gather(self.task, return_exceptions=True)
+        try:
+            await self.backend.release(self.key, self.owner)
+        except StateError as e:
+            # 释放失败时等待租约自然过期
+            logger.warning(f"[State] 释放 {self.key} 失败: {e}")
+
+
+class SharedState:
+    """
+    SharedState 让多个机器人实例共享会话、预设、渠道和函数配置，并提供按会话的租约锁。
+
+    使用本地后端时会话等数据仍保存在本地文件，这里只提供进程内的锁；
+    使用 Redis 时数据保存在 Redis 中，本地文件不再写入：
+    每轮对话获得会话锁后读取最新的会话和设置，结束时写回，同一会话同时只有一个实例在处理。
+
+    Attributes:
+        backend (StateBackend): 存储后端。
+
+        prefix (str): 键名前缀。
+
+        lock_ttl (float): 会话锁的租约时间（秒）。
+
+        owner (str): 当前实例的标识，作为锁的持有者。
+    """
+
+    def __init__(
+        self,
+        backend: StateBackend,
+        prefix: str = "nonebot_openai",
+        lock_ttl: float = 60.0,
+        owner: Optional[str] = None,
+    ):
+        self.backend = backend
+        self.prefix = prefix
+        self.lock_ttl = lock_ttl
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._settings_doc: Optional[str] = None
+        self._tool_config_doc: Optional[str] = None
+        self._pending: Optional[asyncio.Future] = None
+        self.leases: Dict[str, Lease] = {}
+
+    @property
+    def remote(self) -> bool:
+        return not isinstance(self.backend, LocalBackend)
+
+    def key(self, *parts: str) -> str:
+        return ":".join((self.prefix,) + parts)
+
+    async def lock(self, session_id: str) -> Optional[Lease]:
+        """获取会话锁，已被占用时返回 None"""
+        key = self.key("lock", session_id)
+        start = time.monotonic()
+        if not await self.backend.acquire(key, self.owner, self.lock_ttl):
+            return None
+        lease = Lease(
+            self.backend, key, self.owner, self.lock_ttl, start + self.lock_ttl
+        )
+        self.leases[session_id] = lease
+        return lease
+
+    async def unlock(self, session_id: str, lease: Lease) -> None:
+        if self.leases.get(session_id) is lease:
+            del self.leases[session_id]
+        await lease.release()
+
+    def holds(self, session_id: str) -> bool:
+        """当前实例是否仍持有会话锁，没有通过 lock 获取过的会话视为持有"""
+        lease = self.leases.get(session_id)
+        return lease is None or not lease.lost
+
+    @staticmethod
+    def settings_doc(settings: "Settings") -> str:
+        return settings.json(
+            include={"channels", "presets", "default_preset"}, exclude_none=True
+        )
+
+    async def pull_settings(self, settings: "Settings") -> None:
+        """读取共享的设置和全部会话，共享状态为空时用本地文件的内容初始化"""
+        doc = await self.backend.get(self.key("settings"))
+        if doc is None:
+            logger.info("[State] 共享状态为空，使用本地的 settings.json 初始化")
+            await self.push_all(settings)
+            return
+        self._settings_doc = doc
+        settings.apply_data(json.loads(doc))
+        sessions = await self.backend.hgetall(self.key("sessions"))
+        settings.sessions.clear()
+        for session_id, value in sessions.items():
+            settings.sessions[session_id] = Session.parse_raw(value)
+        settings.refresh_trigger()
+
+    async def pull_session(self, settings: "Settings", session_id: str) -> None:
+        """获得会话锁后读取最新的会话，设置变化时一并应用"""
+        await self.flush()
+        doc, value = await self.backend.get_and_hget(
+            self.key("settings"), self.key("sessions"), session_id
+        )
+        if doc is not None and doc != self._settings_doc:
+            self._settings_doc = doc
+            settings.apply_data(json.loads(doc))
+        old = settings.sessions.get(session_id)
+        session = Session.parse_raw(value) if value is not None else None
+        if session is not None:
+            settings.sessions[session_id] = session
+        else:
+            settings.sessions.pop(session_id, None)
+        # 触发词索引由所有会话的预设名构建，其他实例切换了预设或删除了会话时需要重建
+        if preset_name(old) != preset_name(session):
+            settings.refresh_trigger()
+
+    async def push_all(self, settings: "Settings") -> None:
+        self._settings_doc = self.settings_doc(settings)
+        await self.backend.set(self.key("settings"), self._settings_doc)
+        for session_id, session in list(settings.sessions.items()):
+            await self.backend.hset(
+                self.key("sessions"), session_id, session.json(exclude_none=True)
+            )
+
+    def push_settings(
+        self, settings: "Settings", session: Optional[Session] = None
+    ) -> None:
+        """
+        在后台写回设置和会话，写入按调用顺序进行。
+
+        本地的其他会话可能已经过期，只写回持有锁的会话。
+
+        参数:
+            settings (Settings): 设置，渠道和预设没有变化时不写回。
+            session (Optional[Session]): 需要写回的会话。
+        """
+        doc = self.settings_doc(settings)
+        if doc != self._settings_doc:
+            self._settings_doc = doc
+            self.enqueue(self.backend.set(self.key("settings"), doc))
+        if session and not self.holds(session.id):
+            # 租约过期后锁可能已被其他实例获得，写回会覆盖对方的修改
+            logger.warning(
+                f"[State] 会话 {session.id} 的锁已失效，放弃写回本轮的修改"
+            )
+        elif session:
+            self.enqueue(
+                self.backend.hset(
+                    self.key("sessions"), session.id, session.json(exclude_none=True)
+                )
+            )
+
+    def delete_session(self, session_id: str) -> None:
+        self.enqueue(self.backend.hdel(self.key("sessions"), session_id))
+
+    async def pull_tool_config(self, tools_func: "ToolsFunction") -> None:
+        doc = await self.backend.get(self.key("tool_config"))
+        if doc is None:
+            self.push_tool_config(tools_func)
+            await self.flush()
+            return
+        self._tool_config_doc = doc
+        tools_func.apply_data(json.loads(doc))
+
+    def push_tool_config(self, tools_func: "ToolsFunction") -> None:
+        doc = tools_func.json(exclude_none=True)
+        if doc != self._tool_config_doc:
+            self._tool_config_doc = doc
+            self.enqueue(self.backend.set(self.key("tool_config"), doc))
+
+    def enqueue(self, write) -> None:
+        """串行执行写入，前一次写入完成后才开始下一次"""
+        previous = self._pending
+
+        async def run():
+            if previous is not None:
+                await asyncio.gather(previous, return_exceptions=True)
+            try:
+                await write
+            except StateError as e:
+                logger.error(f"[State] 写入共享状态失败: {e}")
+
+        self._pending = asyncio.ensure_future(run())
+
+    async def flush(self) -> None:
+        """等待已排队的写入完成"""
+        if self._pending is not None:
+            await asyncio.gather(self._pending, return_exceptions=True)
+
+    async def close(self) -> None:
+        await self.flush()
+        await self.backend.close()
+
+
+shared_state = SharedState(
+    backend=RedisBackend(config.openai_redis_url)
+    if config.openai_state_backend == "redis"
+    else LocalBackend(),
+    prefix=config.openai_state_prefix,
+    lock_ttl=config.openai_lock_ttl,
+)
@@ -0,0 +1,117 @@
+import heapq
+import time
+from typing import Dict, Iterable, List, Optional
+
+from .cache import ResponseCache
+from .channel import ChannelState
+from .memory import MemoryStore
+from .router import ModelRouter
+from .types import ChatMessage, Session
+from .utils import message_size, message_tokens
+
+
+def format_bytes(size: float) -> str:
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f}{unit}" if unit == "B" else f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}GB"
+
+
+def format_ago(timestamp: float) -> str:
+    if not timestamp:
+        return "未知"
+    seconds = max(0, time.time() - timestamp)
+    if seconds < 60:
+        return f"{seconds:.0f} 秒前"
+    if seconds < 3600:
+        return f"{seconds / 60:.0f} 分钟前"
+    if seconds < 86400:
+        return f"{seconds / 3600:.1f} 小时前"
+    return f"{seconds / 86400:.1f} 天前"
+
+
+def session_size(session: Session) -> int:
+    """会话消息序列化后的大小"""
+    return sum(message_size(ChatMessage.parse(message)) for message in session.messages)
+
+
+def session_status(session: Session, memory: Optional[MemoryStore] = None) -> str:
+    messages = [ChatMessage.parse(message) for message in session.messages]
+    window = session.get_window()
+    lines = [
+        f"会话 {session.id}",
+        f"    预设: {session.preset.name if session.preset else '无'}",
+        f"    消息数: {len(messages)}（窗口 {len(window)}）",
+        f"    估算 tokens: 全部 {sum(map(message_tokens, messages))}"
+        f"，窗口 {sum(map(message_tokens, window))}",
+        f"    上下文占用: {format_bytes(session_size(session))}",
+        f"    最后活跃: {format_ago(session.last_active)}",
+        f"    队列: {'1（进行中）' if session.running else '0'}",
+    ]
+    if memory:
+        stats = memory.stats(session.id)
+        entries = "未加载" if stats["entries"] < 0 else f"{stats['entries']} 条"
+        lines.append(f"    长期记忆: {entries}，{format_bytes(stats['bytes'])}")
+    return "\n".join(lines)
+
+
+def sessions_overview(sessions: Dict[str, Session], top: int = 5) -> str:
+    running = sum(1 for session in sessions.values() if session.running)
+    lines = [f"会话总数: {len(sessions)}，进行中: {running}"]
+    largest = heapq.nlargest(
+        top,
+        ((session_size(session), session) for session in sessions.values()),
+        key=lambda item: item[0],
+    )
+    if largest:
+        lines.append(f"最大的 {len(largest)} 个会话:")
+        lines.extend(
+            f"    {session.id}: {len(session.messages)} 条，{format_bytes(size)}"
+            for size, session in largest
+        )
+    return "\n".join(lines)
+
+
+def channel_status(states: Iterable[ChannelState]) -> str:
+    lines: List[str] = []
+    for state in states:
+        lines.append(
+            f"{state.name}: {state.breaker}，进行中 {state.in_flight}"
+            f"，请求 {state.requests}，错误率 {state.error_rate:.1%}"
+            f"\n    延迟 p50 {state.percentile(50):.2f}s"
+            f" p95 {state.percentile(95):.2f}s p99 {state.percentile(99):.2f}s"
+        )
+        if state.probe_ok is not None:
+            result = "正常" if state.probe_ok else f"失败（{state.probe_error}）"
+            lines.append(
+                f"    探测: {result}，{state.probe_latency:.2f}s"
+                f"，{format_ago(state.probed_at)}"
+            )
+    return "\n".join(lines) if lines else "还没有请求过任何渠道。"
+
+
+def cache_status(response_cache: Optional[ResponseCache]) -> str:
+    if not response_cache:
+        return "回复缓存: 未开启"
+    stats = response_cache.stats()
+    return (
+        f"回复缓存: {stats['size']} 条，命中率 {stats['hit_rate']:.1%}"
+        f"（精确 {stats['hits']}，近似 {stats['near_hits']}，未命中 {stats['misses']}）"
+    )
+
+
+def router_status(router: Optional[ModelRouter]) -> str:
+    if not router:
+        return "自动选择模型: 未开启"
+    lines = ["自动选择模型，按顺序命中任一规则时使用 strong 档位:"]
+    lines.extend(f"    {name}: {description}" for name, description, _ in router.rules)
+    for tier, stats in router.stats.items():
+        reasons = "，".join(f"{key} {value}" for key, value in stats.reasons.items())
+        lines.append(
+            f"{tier}（{router.models[tier]}）: {stats.turns} 轮"
+            f"，tokens {stats.prompt_tokens} + {stats.completion_tokens}"
+            f"\n    延迟 p50 {stats.percentile(50):.2f}s p95 {stats.percentile(95):.2f}s"
+            + (f"\n    原因: {reasons}" if reasons else "")
+        )
+    return "\n".join(lines)
@@ -0,0 +1,185 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Union
+
+
+class Trace:
+    """一轮对话的追踪记录"""
+
+    def __init__(self, session_id: str, message_id: Union[int, str]):
+        self.trace_id = f"{message_id}-{uuid.uuid4().hex[:8]}"
+        self.session_id = session_id
+        self.message_id = message_id
+        self.timestamp = time.time()
+        self.start = time.perf_counter()
+        self.spans: List["Span"] = []
+        self.open = 0
+        self.duration = 0.0
+        self.finished = False
+
+    def stages(self) -> Dict[str, float]:
+        """按名称汇总各阶段的耗时（秒），不包括根节点"""
+        stages: Dict[str, float] = {}
+        for span in self.spans[1:]:
+            stages[span.name] = stages.get(span.name, 0.0) + span.duration
+        return stages
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "session_id": self.session_id,
+            "message_id": self.message_id,
+            "timestamp": self.timestamp,
+            "duration_ms": round(self.duration * 1000, 2),
+            "spans": [span.to_dict() for span in self.spans],
+        }
+
+
+class Span:
+    __slots__ = ("trace", "name", "parent", "start", "duration", "attrs", "error")
+
+    def __init__(
+        self, trace: Trace, name: str, parent: Optional["Span"], attrs: Dict[str, Any]
+    ):
+        self.trace = trace
+        self.name = name
+        self.parent = parent
+        self.start = time.perf_counter()
+        self.duration = 0.0
+        self.attrs = attrs
+        self.error: Optional[str] = None
+        trace.spans.append(self)
+        trace.open += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {
+            "name": self.name,
+            "parent": self.parent.name if self.parent else None,
+            "start_ms": round((self.start - self.trace.start) * 1000, 2),
+            "duration_ms": round(self.duration * 1000, 2),
+        }
+        if self.attrs:
+            data["attrs"] = self.attrs
+        if self.error:
+            data["error"] = self.error
+        return data
+
+
+current_span: ContextVar[Optional[Span]] = ContextVar("openai_span", default=None)
+
+
+class Tracer:
+    """
+    Tracer 记录每轮对话各阶段的耗时，通过 contextvars 在 handle_chat、上游请求、工具调用和消息发送之间传递。
+
+    一轮对话的所有 span（包括 ensure_future 发出的消息发送）都结束后，
+    记录会写入按大小滚动的 JSON Lines 文件，并保留最近的若干条用于查询最慢的对话。
+    未开启时 turn 和 span 不做任何事。
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.recent: Deque[Trace] = deque(maxlen=200)
+        self.logger: Optional[logging.Logger] = None
+
+    def setup(
+        self,
+        path: Path,
+        max_bytes: int = 10 * 1024 * 1024,
+        backups: int = 3,
+        recent: int = 200,
+    ) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        handler = RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8"
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        self.logger = logging.getLogger("nonebot_plugin_openai.tracing")
+        self.logger.handlers = [handler]
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        self.recent = deque(maxlen=recent)
+        self.enabled = True
+
+    @contextmanager
+    def turn(self, session_id: str, message_id: Union[int, str], **attrs: Any):
+        """开始一轮对话的追踪，已经处于追踪中时作为子 span"""
+        if not self.enabled:
+            yield None
+            return
+        if current_span.get():
+            with self.span("handle_chat") as span:
+                yield span
+            return
+        trace = Trace(session_id, message_id)
+        with self._span(trace, "turn", None, attrs) as span:
+            yield span
+
+    @contextmanager
+    def span(self, name: str, **attrs: Any):
+        parent = current_span.get()
+        if not self.enabled or parent is None:
+            yield None
+            return
+        with self._span(parent.trace, name, parent, attrs) as span:
+            yield span
+
+    @contextmanager
+    def _span(
+        self, trace: Trace, name: str, parent: Optional[Span], attrs: Dict[str, Any]
+    ):
+        span = Span(trace, name, parent, attrs)
+        token = current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = repr(e)
+            raise
+        finally:
+            span.duration = time.perf_counter() - span.start
+            current_span.reset(token)
+            trace.open -= 1
+            if parent is None:
+                trace.duration = span.duration
+            if trace.open == 0:
+                self.schedule_finish(trace)
+
+    def schedule_finish(self, trace: Trace) -> None:
+        # ensure_future 创建的任务此时可能还没开始运行，推迟到下一轮循环，让它们的 span 计入同一条记录
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.finish(trace)
+        else:
+            loop.call_soon(self.finish, trace)
+
+    def finish(self, trace: Trace) -> None:
+        if trace.finished or trace.open:
+            return
+        trace.finished = True
+        # 根节点结束后仍在运行的 span 结束时，总耗时以最晚结束的 span 为准
+        trace.duration = max(
+            trace.duration,
+            max(span.start + span.duration for span in trace.spans) - trace.start,
+        )
+        self.recent.append(trace)
+        if self.logger:
+            self.logger.info(
+                json.dumps(trace.to_dict(), ensure_ascii=False, separators=(",", ":"))
+            )
+
+    def slowest(self, count: int = 5) -> List[Trace]:
+        return sorted(self.recent, key=lambda trace: trace.duration, reverse=True)[
+            :count
+        ]
+
+
+tracer = Tracer()
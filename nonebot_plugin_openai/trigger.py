@@ -0,0 +1,83 @@
+from collections import deque
+from typing import Dict, Iterable, List, Set
+
+
+class TriggerMatcher:
+    """
+    TriggerMatcher 是基于 Aho-Corasick 自动机的多关键词匹配器，用于快速判断消息是否包含预设名。
+
+    一次扫描即可找出文本中出现的所有关键词，耗时只与文本长度有关，与关键词数量无关。
+
+    Attributes:
+        names (Set[str]): 当前参与匹配的关键词。
+    """
+
+    def __init__(self, names: Iterable[str] = ()):
+        self.names: Set[str] = set()
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Set[str]] = [set()]
+        self.build(names)
+
+    def build(self, names: Iterable[str]) -> None:
+        """
+        重新构建自动机。
+
+        参数:
+            names (Iterable[str]): 需要匹配的关键词，空字符串会被忽略。
+        """
+        names = set(name for name in names if name)
+        if names == self.names:
+            return
+        goto: List[Dict[str, int]] = [{}]
+        output: List[Set[str]] = [set()]
+        for name in names:
+            state = 0
+            for char in name:
+                if char not in goto[state]:
+                    goto.append({})
+                    output.append(set())
+                    goto[state][char] = len(goto) - 1
+                state = goto[state][char]
+            output[state].add(name)
+
+        # 广度优先计算失配指针，并把后缀状态的输出合并进来
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in goto[state].items():
+                queue.append(next_state)
+                fallback = fail[state]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[next_state] = goto[fallback].get(char, 0)
+                if fail[next_state] == next_state:
+                    fail[next_state] = 0
+                output[next_state] |= output[fail[next_state]]
+
+        self._goto, self._fail, self._output = goto, fail, output
+        self.names = names
+
+    def search(self, text: str) -> Set[str]:
+        """
+        找出文本中出现的所有关键词。
+
+        参数:
+            text (str): 需要匹配的文本。
+
+        返回:
+            Set[str]: 出现过的关键词，没有匹配时为空集合。
+        """
+        found: Set[str] = set()
+        if not self.names:
+            return found
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found |= output[state]
+        return found
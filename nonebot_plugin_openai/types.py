@@ -1,5 +1,8 @@
 from io import BytesIO
+import json
 from pathlib import Path
+import sys
+import time
 import httpx
 from openai import AsyncOpenAI
 from openai.types.chat import (
@@ -24,10 +27,24 @@ from typing import (
 from pydantic import BaseModel
 
 
+class ModelCapability(BaseModel):
+    """模型能力，为 None 的字段沿用内置的声明，max_context 和 max_output 的单位为 token"""
+
+    tools: Optional[bool] = None
+    vision: Optional[bool] = None
+    max_context: Optional[int] = None
+    max_output: Optional[int] = None
+    stream: Optional[bool] = None
+
+
 class Channel(BaseModel):
     api_key: str = ""
     base_url: Optional[str] = None
     organization: Optional[str] = None
+    # 日志和指标中显示的名称，为空时使用 base_url 的域名和序号
+    name: str = ""
+    # 渠道提供的模型及其能力，为空时视为提供所有模型
+    models: Dict[str, ModelCapability] = {}
 
 
 class ToolCallResponse:
@@ -106,20 +123,163 @@ class ToolCallRequest:
         self.config = config
 
 
+class ChatMessage:
+    """
+    ChatMessage 是会话历史中单条消息的紧凑表示，用于替代 pydantic 消息对象和 TypedDict 参数。
+
+    角色和名称会被 intern，发送格式和序列化后的 JSON 在第一次使用时缓存，之后每轮直接复用。
+
+    Attributes:
+        role (str): 消息角色。
+
+        content (Optional[Union[str, list]]): 消息内容。
+
+        name (Optional[str]): 函数或工具的名称。
+
+        tool_calls (Optional[list]): assistant 发起的工具调用。
+
+        tool_call_id (Optional[str]): 工具调用结果对应的调用 ID。
+
+        function_call (Optional[dict]): assistant 发起的函数调用（旧接口）。
+    """
+
+    __slots__ = (
+        "role",
+        "content",
+        "name",
+        "tool_calls",
+        "tool_call_id",
+        "function_call",
+        "_param",
+        "_json",
+    )
+
+    def __init__(
+        self,
+        role: str,
+        content: Optional[Union[str, list]] = None,
+        name: Optional[str] = None,
+        tool_calls: Optional[list] = None,
+        tool_call_id: Optional[str] = None,
+        function_call: Optional[dict] = None,
+    ):
+        self.role = sys.intern(role or "assistant")
+        self.content = content
+        self.name = sys.intern(name) if name else None
+        self.tool_calls = tool_calls or None
+        self.tool_call_id = tool_call_id
+        self.function_call = function_call
+        self._param: Optional[Dict[str, Any]] = None
+        self._json: Optional[str] = None
+
+    @classmethod
+    def parse(
+        cls,
+        message: Union["ChatMessage", ChatCompletionMessage, ChatCompletionMessageParam],
+    ) -> "ChatMessage":
+        if isinstance(message, cls):
+            return message
+        if isinstance(message, BaseModel):
+            message = message.dict(exclude_none=True)
+        if not isinstance(message, dict):
+            raise TypeError(f"无法解析的消息类型: {type(message)}")
+        return cls(
+            role=message.get("role"),
+            content=message.get("content"),
+            name=message.get("name"),
+            tool_calls=message.get("tool_calls"),
+            tool_call_id=message.get("tool_call_id"),
+            function_call=message.get("function_call"),
+        )
+
+    @property
+    def param(self) -> Dict[str, Any]:
+        """OpenAI 接口格式的消息，调用方不应修改"""
+        if self._param is None:
+            param = {"role": self.role, "content": self.content}
+            if self.name:
+                param["name"] = self.name
+            if self.tool_calls:
+                param["tool_calls"] = self.tool_calls
+            if self.tool_call_id:
+                param["tool_call_id"] = self.tool_call_id
+            if self.function_call:
+                param["function_call"] = self.function_call
+            self._param = param
+        return self._param
+
+    @property
+    def serialized(self) -> str:
+        """序列化后的 param，用于拼接请求体和持久化"""
+        if self._json is None:
+            self._json = json.dumps(
+                self.param, ensure_ascii=False, separators=(",", ":")
+            )
+        return self._json
+
+    def dict(self) -> Dict[str, Any]:
+        return self.param
+
+    def __repr__(self) -> str:
+        return f"ChatMessage({self.param!r})"
+
+    @classmethod
+    def __get_validators__(cls):
+        yield cls.parse
+
+
 class Preset(BaseModel):
     name: str
     prompt: str
+    # 回复缓存的过期时间（秒），为 None 时使用全局配置，为 0 时不缓存
+    cache_ttl: Optional[int] = None
+    # 开启自动选择模型时固定使用的档位，为 None 时按规则选择
+    tier: Optional[Literal["fast", "strong"]] = None
+
+
+def memory_message(memories: List[str]) -> ChatCompletionSystemMessageParam:
+    """把检索到的长期记忆包装成 system 消息"""
+    return ChatCompletionSystemMessageParam(
+        content="以下是与当前对话相关的历史记录：\n" + "\n".join(memories),
+        role="system",
+    )
 
 
 class Session(BaseModel):
     id: str
-    messages: List[Union[ChatCompletionMessage, ChatCompletionMessageParam]] = []
+    messages: List[ChatMessage] = []
     user: str = ""
     preset: Optional[Preset] = None
     max_length: int = 8
     running: bool = False
+    # 已经归档进长期记忆的消息数量
+    archived: int = 0
+    # 最后一次添加消息的时间戳
+    last_active: float = 0.0
+
+    class Config:
+        json_encoders = {ChatMessage: ChatMessage.dict}
 
-    def get_messages(self, preset: Preset = None):
+    def add_message(
+        self,
+        message: Union[ChatMessage, ChatCompletionMessage, ChatCompletionMessageParam],
+    ) -> ChatMessage:
+        message = ChatMessage.parse(message)
+        self.messages.append(message)
+        self.last_active = time.time()
+        return message
+
+    def get_window(self) -> List[ChatMessage]:
+        """获取最近 max_length 条消息，不会从一组工具调用结果的中间截断"""
+        split_length = self.max_length
+        while (
+            split_length < len(self.messages)
+            and ChatMessage.parse(self.messages[-split_length]).role == "tool"
+        ):
+            split_length += 1
+        return [ChatMessage.parse(message) for message in self.messages[-split_length:]]
+
+    def get_messages(self, preset: Preset = None, memories: List[str] = None):
         if self.preset:
             preset = self.preset
         _preset = []
@@ -127,14 +287,9 @@ class Session(BaseModel):
             _preset = [
                 ChatCompletionSystemMessageParam(content=preset.prompt, role="system")
             ]
-        split_length = self.max_length
-        while (
-            split_length < len(self.messages)
-            and isinstance(self.messages[-split_length], dict)
-            and self.messages[-split_length]["role"] == "tool"
-        ):
-            split_length += 1
-        return _preset + self.messages[-split_length:]
+        if memories:
+            _preset.append(memory_message(memories))
+        return _preset + [message.param for message in self.get_window()]
 
 
 T = TypeVar("T", bound=ToolCallConfig)
@@ -1,10 +1,13 @@
 import inspect
 import json
+import re
 from typing import List, get_type_hints, Literal, get_args
 from nonebot.adapters.onebot.v11 import MessageEvent, Message, MessageSegment
 from docstring_parser import parse
 from pydantic import BaseModel, parse_file_as
 
+from .types import ChatMessage
+
 
 def function_to_json_schema(function):
     """
@@ -147,7 +150,7 @@ def get_message_img(event: MessageEvent) -> str:
 def reload(model: BaseModel):
     if model.file_path.is_file():
         new_self = parse_file_as(model.__class__, model.file_path)
-        for key in new_self.dict().keys():
+        for key in model.__fields__:
             self_value = getattr(model, key)
             if isinstance(self_value, dict):
                 self_value.clear()
@@ -159,6 +162,52 @@ def reload(model: BaseModel):
                 setattr(model, key, getattr(new_self, key))
 
 
+CJK_PATTERN = re.compile(r"[\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算文本的 token 数，中日韩字符按每字一个 token，其余按每 4 个字符一个 token。
+
+    参数:
+        text (str): 需要估算的文本。
+
+    返回:
+        int: 估算的 token 数。
+    """
+    cjk = len(CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def message_tokens(message: ChatMessage) -> int:
+    # 每条消息额外约 4 个 token 的格式开销
+    content = message.content
+    if isinstance(content, list):
+        content = "".join(
+            part.get("text", "") for part in content if isinstance(part, dict)
+        )
+    tokens = 4 + estimate_tokens(content or "")
+    if message.tool_calls:
+        tokens += estimate_tokens(str(message.tool_calls))
+    return tokens
+
+
+def message_size(message: ChatMessage) -> int:
+    """
+    消息序列化后的长度。
+
+    已经序列化过的消息直接使用缓存的 JSON，否则按内容粗略估算，不会为了查看状态而填充序列化缓存。
+    """
+    if message._json is not None:
+        return len(message._json)
+    content = message.content
+    # role 等字段和 JSON 格式约 32 个字符
+    size = 32 + len(content if isinstance(content, str) else str(content or ""))
+    if message.tool_calls:
+        size += len(str(message.tool_calls))
+    return size
+
+
 def test():
     async def gen_image(
         self,
@@ -0,0 +1,172 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from .metrics import LOOP_BLOCKS, LOOP_LAG
+
+STDLIB_DIR = os.path.dirname(os.path.abspath(os.__file__))
+
+
+class LoopWatchdog:
+    """
+    LoopWatchdog 用于发现阻塞事件循环的代码。
+
+    事件循环中的心跳任务每 interval 秒记录一次时间，并把实际多睡的时间记为循环延迟；
+    后台线程发现心跳超过 threshold 秒没有更新时，抓取事件循环线程当前的调用栈，
+    按文件路径归属到插件（func 文件归属到具体文件）和函数，计入指标并按来源限频输出日志。
+
+    Attributes:
+        interval (float): 心跳间隔（秒）。
+
+        threshold (float): 判定为阻塞的延迟（秒）。
+
+        log_interval (float): 同一来源两次输出日志的最小间隔（秒）。
+
+        cache_dir (str): 当前进程导入 func 文件的包目录，其中的栈帧归属到具体的 func 文件。
+    """
+
+    def __init__(
+        self,
+        interval: float = 0.1,
+        threshold: float = 0.5,
+        log_interval: float = 60.0,
+        cache_dir: str = "",
+    ):
+        self.interval = interval
+        self.threshold = threshold
+        self.log_interval = log_interval
+        self.cache_dir = os.path.abspath(cache_dir) if cache_dir else ""
+        self.beat = time.monotonic()
+        self.loop_thread_id: Optional[int] = None
+        self.task: Optional[asyncio.Task] = None
+        self.thread: Optional[threading.Thread] = None
+        self.stopped = threading.Event()
+        self.last_logged: Dict[str, float] = {}
+        self.suppressed: Dict[str, int] = {}
+        self.plugin_paths: List[Tuple[str, str]] = []
+
+    def start(self) -> None:
+        self.loop_thread_id = threading.get_ident()
+        self.beat = time.monotonic()
+        self.stopped.clear()
+        self.task = asyncio.ensure_future(self.heartbeat())
+        self.thread = threading.Thread(
+            target=self.watch, name="openai-loop-watchdog", daemon=True
+        )
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        if self.task:
+            self.task.cancel()
+
+    async def heartbeat(self) -> None:
+        while True:
+            start = time.monotonic()
+            self.beat = start
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - start - self.interval)
+            LOOP_LAG.observe(lag)
+
+    def watch(self) -> None:
+        captured = 0.0
+        while not self.stopped.wait(self.interval):
+            beat = self.beat
+            if time.monotonic() - beat < self.threshold or beat == captured:
+                continue
+            # 每次阻塞只抓取一次调用栈
+            captured = beat
+            try:
+                self.capture()
+            except Exception as e:
+                logger.warning(f"[Watchdog] 抓取调用栈失败: {e}")
+
+    def capture(self) -> None:
+        frame = sys._current_frames().get(self.loop_thread_id)
+        if frame is None:
+            return
+        stack = traceback.extract_stack(frame)
+        source, function = self.attribute(stack)
+        LOOP_BLOCKS.inc(source=source)
+        now = time.monotonic()
+        if now - self.last_logged.get(source, 0.0) < self.log_interval:
+            self.suppressed[source] = self.suppressed.get(source, 0) + 1
+            return
+        self.last_logged[source] = now
+        suppressed = self.suppressed.pop(source, 0)
+        logger.warning(
+            f"[Watchdog] 事件循环被 {source}:{function} 阻塞超过 {self.threshold}s"
+            + (f"（此前 {self.log_interval:.0f}s 内还有 {suppressed} 次）" if suppressed else "")
+            + "\n"
+            + "".join(traceback.format_list(stack[-8:]))
+        )
+
+    def attribute(self, stack: traceback.StackSummary) -> Tuple[str, str]:
+        """从最内层开始，找到第一个属于插件的栈帧；都不属于插件时返回最内层的非标准库栈帧"""
+        if not self.plugin_paths:
+            self.plugin_paths = self.load_plugin_paths()
+        fallback = None
+        for frame in reversed(stack):
+            filename = os.path.abspath(frame.filename)
+            if self.in_cache_dir(filename):
+                name = os.path.splitext(os.path.basename(filename))[0]
+                return f"func:{name}", frame.name
+            for path, plugin in self.plugin_paths:
+                if filename.startswith(path):
+                    return plugin, frame.name
+            if fallback is None and not filename.startswith(STDLIB_DIR):
+                fallback = (os.path.basename(filename), frame.name)
+        return fallback or ("unknown", stack[-1].name if stack else "")
+
+    def in_cache_dir(self, filename: str) -> bool:
+        # 按路径组成部分比较，cache_func_worker1 不会匹配到 cache_func_worker10
+        if not self.cache_dir:
+            return False
+        try:
+            return os.path.commonpath([filename, self.cache_dir]) == self.cache_dir
+        except ValueError:
+            return False
+
+    @staticmethod
+    def load_plugin_paths() -> List[Tuple[str, str]]:
+        from nonebot import get_loaded_plugins
+
+        paths = []
+        for plugin in get_loaded_plugins():
+            file = getattr(plugin.module, "__file__", None)
+            if not file:
+                continue
+            path = os.path.abspath(file)
+            if os.path.basename(path) == "__init__.py":
+                path = os.path.dirname(path) + os.sep
+            paths.append((path, plugin.name))
+        # 嵌套的子插件优先匹配
+        return sorted(paths, key=lambda item: len(item[0]), reverse=True)
+
+
+def setup_watchdog(
+    interval: float = 0.1,
+    threshold: float = 0.5,
+    log_interval: float = 60.0,
+    cache_dir: str = "",
+) -> LoopWatchdog:
+    from nonebot import get_driver
+
+    driver = get_driver()
+    watchdog = LoopWatchdog(interval, threshold, log_interval, cache_dir)
+
+    @driver.on_startup
+    async def _():
+        watchdog.start()
+
+    @driver.on_shutdown
+    async def _():
+        watchdog.stop()
+
+    return watchdog
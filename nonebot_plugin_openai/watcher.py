@@ -0,0 +1,125 @@
+import asyncio
+import inspect
+import time
+from fnmatch import fnmatch
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple, Union
+
+from loguru import logger
+
+Signature = Tuple[int, int]
+Callback = Callable[[Set[Path]], Union[Awaitable[Any], Any]]
+
+
+def scan(path: Path, pattern: str) -> Dict[Path, Signature]:
+    """文件或文件夹中匹配 pattern 的文件的 (mtime_ns, size)"""
+    files = path.iterdir() if path.is_dir() else [path]
+    result = {}
+    for file in files:
+        if not fnmatch(file.name, pattern):
+            continue
+        try:
+            stat = file.stat()
+        except OSError:
+            continue
+        result[file] = (stat.st_mtime_ns, stat.st_size)
+    return result
+
+
+class WatchTarget:
+    def __init__(
+        self,
+        path: Path,
+        callback: Callback,
+        pattern: str = "*",
+        ignore: Optional[Callable[[Path, Signature], bool]] = None,
+    ):
+        self.path = path
+        self.callback = callback
+        self.pattern = pattern
+        self.ignore = ignore
+        self.applied = scan(path, pattern)
+        self.pending: Optional[Dict[Path, Signature]] = None
+        self.changed_at = 0.0
+
+    def changed_files(self, current: Dict[Path, Signature]) -> Set[Path]:
+        files = set()
+        for file in set(current) | set(self.applied):
+            signature = current.get(file)
+            if signature == self.applied.get(file):
+                continue
+            if signature and self.ignore and self.ignore(file, signature):
+                continue
+            files.add(file)
+        return files
+
+
+class FileWatcher:
+    """
+    FileWatcher 通过轮询文件的修改时间和大小发现文件变化，不依赖额外的库。
+
+    变化后需要保持 debounce 秒不再变化才会触发回调，避免编辑器分多次写入时重复加载；
+    ignore 返回 True 的变化（例如插件自己保存的文件）不会触发回调。
+
+    Attributes:
+        interval (float): 轮询间隔（秒）。
+
+        debounce (float): 去抖时间（秒）。
+    """
+
+    def __init__(self, interval: float = 1.0, debounce: float = 0.5):
+        self.interval = interval
+        self.debounce = debounce
+        self.targets: List[WatchTarget] = []
+        self.task: Optional[asyncio.Task] = None
+
+    def watch(
+        self,
+        path: Path,
+        callback: Callback,
+        pattern: str = "*",
+        ignore: Optional[Callable[[Path, Signature], bool]] = None,
+    ) -> None:
+        """
+        监听文件或文件夹。
+
+        参数:
+            path (Path): 文件或文件夹。
+            callback (Callback): 回调，参数为变化的文件，可以是协程函数。
+            pattern (str): 文件夹中需要监听的文件名模式。
+            ignore (Optional[Callable[[Path, Signature], bool]]): 判断变化是否需要忽略。
+        """
+        self.targets.append(WatchTarget(path, callback, pattern, ignore))
+
+    def start(self) -> None:
+        self.task = asyncio.ensure_future(self.run())
+
+    def stop(self) -> None:
+        if self.task:
+            self.task.cancel()
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            for target in self.targets:
+                await self.check(target)
+
+    async def check(self, target: WatchTarget) -> None:
+        current = scan(target.path, target.pattern)
+        if current != target.pending:
+            # 仍在变化，重新计时
+            target.pending = current
+            target.changed_at = time.monotonic()
+            return
+        if time.monotonic() - target.changed_at < self.debounce:
+            return
+        files = target.changed_files(current)
+        target.applied = current
+        if not files:
+            return
+        try:
+            result = target.callback(files)
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            logger.opt(exception=e).error(f"[Watcher] 处理 {target.path} 的变化失败: {e}")
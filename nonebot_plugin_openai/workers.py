@@ -0,0 +1,297 @@
+import asyncio
+import json
+import os
+import secrets
+import struct
+import sys
+import zlib
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from loguru import logger
+from nonebot import get_bots
+from nonebot.adapters.onebot.v11 import Adapter, Bot, MessageEvent
+from nonebot.adapters.onebot.v11 import event as v11_event
+from nonebot.adapters.onebot.v11.exception import ActionFailed, NetworkError
+from nonebot.message import handle_event
+from nonebot.utils import DataclassEncoder
+
+HEADER = struct.Struct("!I")
+
+# worker 进程的入口，先初始化 NoneBot 再加载插件，插件的导入依赖驱动的配置
+WORKER_MAIN = """
+import json, os, nonebot
+from nonebot.adapters.onebot.v11 import Adapter
+
+nonebot.init(**json.loads(os.environ["OPENAI_WORKER_CONFIG"]))
+nonebot.get_driver().register_adapter(Adapter)
+nonebot.load_plugin(os.environ["OPENAI_WORKER_PLUGIN"])
+nonebot.run()
+"""
+
+
+def shard_of(session_id: str, shards: int) -> int:
+    """会话所属的 worker，使用 crc32 保证不同进程中的结果一致"""
+    return zlib.crc32(session_id.encode("utf-8")) % shards
+
+
+def encode_config(value: Any) -> Any:
+    """NoneBot 配置中的集合（例如 superusers）转为列表，其余类型转为字符串"""
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    return str(value)
+
+
+def write_frame(writer: asyncio.StreamWriter, obj: Dict[str, Any]) -> None:
+    body = json.dumps(
+        obj, cls=DataclassEncoder, ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+    # 整帧一次写入，多个协程同时发送时不会交错
+    writer.write(HEADER.pack(len(body)) + body)
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Optional[Dict[str, Any]]:
+    try:
+        header = await reader.readexactly(HEADER.size)
+        (size,) = HEADER.unpack(header)
+        return json.loads(await reader.readexactly(size))
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+
+
+class WorkerPool:
+    """
+    WorkerPool 在 NoneBot 主进程中把消息事件按会话分发给多个 worker 进程。
+
+    每个 worker 是加载了本插件的无驱动 NoneBot 进程，独占自己分片的会话和上游连接，
+    在本地回环的 TCP 连接上接收事件，并把 Bot API 调用（发送消息等）交回主进程执行。
+    worker 退出后会在 restart_delay 秒后重启，期间的事件最多缓存 queue_size 条。
+
+    Attributes:
+        workers (int): worker 进程数。
+
+        plugin (str): worker 中加载的插件模块名。
+
+        config (Dict[str, Any]): 传给 worker 的 NoneBot 配置。
+
+        restart_delay (float): worker 退出后重启前等待的秒数。
+
+        queue_size (int): 每个 worker 未连接时缓存的事件数。
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        plugin: str,
+        config: Dict[str, Any],
+        restart_delay: float = 1.0,
+        queue_size: int = 1000,
+    ):
+        self.workers = workers
+        self.plugin = plugin
+        self.config = config
+        self.restart_delay = restart_delay
+        self.token = secrets.token_hex(16)
+        self.writers: Dict[int, asyncio.StreamWriter] = {}
+        self.pending: List[Deque[Dict[str, Any]]] = [
+            deque(maxlen=queue_size) for _ in range(workers)
+        ]
+        self.processes: Dict[int, asyncio.subprocess.Process] = {}
+        self.tasks: List[asyncio.Task] = []
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.stopping = False
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_server(self.handle_connection, "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+        self.tasks = [
+            asyncio.ensure_future(self.supervise(index, port))
+            for index in range(self.workers)
+        ]
+        logger.info(f"[Worker] 已启动 {self.workers} 个 worker 进程")
+
+    async def stop(self) -> None:
+        self.stopping = True
+        for task in self.tasks:
+            task.cancel()
+        for process in self.processes.values():
+            if process.returncode is None:
+                process.terminate()
+        for process in self.processes.values():
+            try:
+                await asyncio.wait_for(process.wait(), 10)
+            except asyncio.TimeoutError:
+                process.kill()
+        if self.server:
+            self.server.close()
+
+    def worker_env(self, index: int, port: int) -> Dict[str, str]:
+        config = dict(self.config, openai_worker_index=index)
+        return dict(
+            os.environ,
+            PYTHONPATH=os.pathsep.join(path for path in sys.path if path),
+            OPENAI_WORKER_CONFIG=json.dumps(config, default=encode_config),
+            OPENAI_WORKER_PLUGIN=self.plugin,
+            OPENAI_WORKER_ADDRESS=f"127.0.0.1:{port}",
+            OPENAI_WORKER_TOKEN=self.token,
+        )
+
+    async def supervise(self, index: int, port: int) -> None:
+        while not self.stopping:
+            process = await asyncio.create_subprocess_exec(
+                sys.executable, "-c", WORKER_MAIN, env=self.worker_env(index, port)
+            )
+            self.processes[index] = process
+            code = await process.wait()
+            if self.stopping:
+                return
+            logger.warning(
+                f"[Worker] worker {index} 退出（{code}），{self.restart_delay} 秒后重启"
+            )
+            await asyncio.sleep(self.restart_delay)
+
+    async def handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        hello = await read_frame(reader)
+        if not hello or hello.get("token") != self.token:
+            writer.close()
+            return
+        index = hello["index"]
+        self.writers[index] = writer
+        pending = self.pending[index]
+        while pending:
+            write_frame(writer, pending.popleft())
+        logger.debug(f"[Worker] worker {index} 已连接")
+        try:
+            while True:
+                frame = await read_frame(reader)
+                if frame is None:
+                    break
+                if frame["type"] == "call":
+                    asyncio.ensure_future(self.call_api(writer, frame))
+        finally:
+            if self.writers.get(index) is writer:
+                del self.writers[index]
+            writer.close()
+
+    async def call_api(self, writer: asyncio.StreamWriter, frame: Dict[str, Any]):
+        reply: Dict[str, Any] = {"type": "result", "id": frame["id"]}
+        try:
+            bot = get_bots()[frame["self_id"]]
+            reply["result"] = await bot.call_api(frame["api"], **frame["data"])
+        except ActionFailed as e:
+            reply["error"] = {"kind": "ActionFailed", "info": e.info}
+        except Exception as e:
+            reply["error"] = {"kind": "NetworkError", "message": f"{type(e).__name__}: {e}"}
+        if not writer.is_closing():
+            write_frame(writer, reply)
+
+    def dispatch(self, bot: Bot, event: MessageEvent) -> None:
+        """把事件发送给会话所在的 worker，不等待处理结果"""
+        index = shard_of(event.get_session_id(), self.workers)
+        frame = {
+            "type": "event",
+            "self_id": bot.self_id,
+            "event_type": type(event).__name__,
+            "event": event.json(),
+        }
+        writer = self.writers.get(index)
+        if writer and not writer.is_closing():
+            write_frame(writer, frame)
+            return
+        pending = self.pending[index]
+        if len(pending) == pending.maxlen:
+            logger.warning(f"[Worker] worker {index} 未连接，丢弃最早的事件")
+        pending.append(frame)
+
+
+class RemoteBot(Bot):
+    """worker 中的 Bot，API 调用通过连接交给主进程中真正的 Bot 执行"""
+
+    def __init__(self, adapter: Adapter, self_id: str, connection: "WorkerConnection"):
+        super().__init__(adapter, self_id)
+        self.connection = connection
+
+    async def call_api(self, api: str, **data: Any) -> Any:
+        return await self.connection.call(self.self_id, api, data)
+
+
+class WorkerConnection:
+    """
+    WorkerConnection 是 worker 进程到主进程的连接，接收事件并交给 NoneBot 处理。
+
+    Attributes:
+        index (int): worker 序号。
+
+        timeout (float): Bot API 调用的超时（秒）。
+    """
+
+    def __init__(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        adapter: Adapter,
+        index: int,
+        timeout: float = 60.0,
+    ):
+        self.reader = reader
+        self.writer = writer
+        self.adapter = adapter
+        self.index = index
+        self.timeout = timeout
+        self.bots: Dict[str, RemoteBot] = {}
+        self.calls: Dict[int, asyncio.Future] = {}
+        self.call_id = 0
+
+    @classmethod
+    async def connect(cls, adapter: Adapter, index: int) -> "WorkerConnection":
+        host, port = os.environ["OPENAI_WORKER_ADDRESS"].rsplit(":", 1)
+        reader, writer = await asyncio.open_connection(host, int(port))
+        write_frame(
+            writer,
+            {"type": "hello", "index": index, "token": os.environ["OPENAI_WORKER_TOKEN"]},
+        )
+        return cls(reader, writer, adapter, index)
+
+    def bot(self, self_id: str) -> RemoteBot:
+        if self_id not in self.bots:
+            self.bots[self_id] = RemoteBot(self.adapter, self_id, self)
+        return self.bots[self_id]
+
+    async def call(self, self_id: str, api: str, data: Dict[str, Any]) -> Any:
+        self.call_id += 1
+        call_id = self.call_id
+        future = asyncio.get_running_loop().create_future()
+        self.calls[call_id] = future
+        write_frame(
+            self.writer,
+            {"type": "call", "id": call_id, "self_id": self_id, "api": api, "data": data},
+        )
+        try:
+            reply = await asyncio.wait_for(future, self.timeout)
+        finally:
+            self.calls.pop(call_id, None)
+        error = reply.get("error")
+        if not error:
+            return reply.get("result")
+        if error["kind"] == "ActionFailed":
+            raise ActionFailed(**error["info"])
+        raise NetworkError(error["message"])
+
+    async def serve(self) -> None:
+        while True:
+            frame = await read_frame(self.reader)
+            if frame is None:
+                break
+            if frame["type"] == "event":
+                event_class = getattr(v11_event, frame["event_type"])
+                event = event_class.parse_raw(frame["event"])
+                asyncio.ensure_future(handle_event(self.bot(frame["self_id"]), event))
+            elif frame["type"] == "result":
+                future = self.calls.get(frame["id"])
+                if future and not future.done():
+                    future.set_result(frame)
+        for future in self.calls.values():
+            if not future.done():
+                future.set_exception(NetworkError("与主进程的连接已断开"))
@@ -0,0 +1,153 @@
+"""
+端到端基准测试：用进程内的 OpenAI 桩和记录调用的 Bot 驱动 handle_chat，统计吞吐、延迟、CPU 和内存。
+
+用法:
+    python test/benchmark/bench_e2e.py --turns 500 --concurrency 20 --latency 0.05
+    python test/benchmark/bench_e2e.py --tool-call-rate 0.2 --error-rate 0.05 --json result.json
+"""
+import argparse
+import asyncio
+import json
+import resource
+import time
+import tracemalloc
+from typing import Any, Dict, List
+
+from stubs import (
+    StubOpenAI,
+    bot_context,
+    drain,
+    init_plugin,
+    install_stub,
+    make_bot,
+    make_event,
+    percentile,
+    register_bench_tool,
+)
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="handle_chat 端到端基准测试")
+    parser.add_argument("--turns", type=int, default=200, help="对话轮数")
+    parser.add_argument("--concurrency", type=int, default=10, help="并发会话数")
+    parser.add_argument("--latency", type=float, default=0.05, help="上游基础延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="上游随机延迟上限（秒）")
+    parser.add_argument("--completion-tokens", type=int, default=32, help="每次回复的 token 数")
+    parser.add_argument("--tool-call-rate", type=float, default=0.0, help="工具调用概率")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="429 概率")
+    parser.add_argument("--history", type=int, default=8, help="会话上下文长度")
+    parser.add_argument("--group", action="store_true", help="使用群消息而不是私聊消息")
+    parser.add_argument("--trace-memory", action="store_true", help="使用 tracemalloc 统计每轮分配的内存")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="把结果写入 JSON 文件")
+    return parser.parse_args(argv)
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    plugin = init_plugin()
+    stub = StubOpenAI(
+        latency=args.latency,
+        jitter=args.jitter,
+        completion_tokens=args.completion_tokens,
+        tool_call_rate=args.tool_call_rate,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    install_stub(plugin, stub)
+    register_bench_tool(plugin)
+    bot = make_bot()
+    latencies: List[float] = []
+    queue: "asyncio.Queue[int]" = asyncio.Queue()
+    for turn in range(args.turns):
+        queue.put_nowait(turn)
+
+    async def worker(index: int):
+        user_id = 20000 + index
+        group_id = 30000 if args.group else None
+        while not queue.empty():
+            turn = queue.get_nowait()
+            event = make_event(f"bench turn {turn}", user_id=user_id, group_id=group_id)
+            session = plugin.settings.get_session(event)
+            session.max_length = args.history
+            with bot_context(bot, event):
+                start = time.perf_counter()
+                await plugin.handle_chat(
+                    bot, event, plugin.openai, session, text=event.get_plaintext()
+                )
+                latencies.append(time.perf_counter() - start)
+
+    if args.trace_memory:
+        tracemalloc.start()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    cpu_before = time.process_time()
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(args.concurrency)))
+    await drain()
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_before
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    traced = None
+    if args.trace_memory:
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        traced = {"current_bytes": current, "peak_bytes": peak}
+
+    turns = len(latencies)
+    api_calls: Dict[str, int] = {}
+    for call in bot.calls:
+        api_calls[call["api"]] = api_calls.get(call["api"], 0) + 1
+    result = {
+        "turns": turns,
+        "elapsed_s": elapsed,
+        "turns_per_s": turns / elapsed if elapsed else 0.0,
+        "latency_ms": {
+            "p50": percentile(latencies, 50) * 1000,
+            "p95": percentile(latencies, 95) * 1000,
+            "p99": percentile(latencies, 99) * 1000,
+            "max": max(latencies, default=0.0) * 1000,
+        },
+        "cpu_ms_per_turn": cpu / turns * 1000 if turns else 0.0,
+        "max_rss_growth_kb_per_turn": (rss_after - rss_before) / turns if turns else 0.0,
+        "upstream": {
+            "requests": stub.requests,
+            "injected_429": stub.errors,
+            "tool_calls": stub.tool_calls,
+        },
+        "bot_api_calls": api_calls,
+    }
+    if traced:
+        result["tracemalloc"] = {
+            "bytes_per_turn": traced["current_bytes"] / turns if turns else 0.0,
+            "peak_bytes": traced["peak_bytes"],
+        }
+    return result
+
+
+def report(result: Dict[str, Any]) -> None:
+    latency = result["latency_ms"]
+    print(f"turns:        {result['turns']} in {result['elapsed_s']:.2f}s")
+    print(f"throughput:   {result['turns_per_s']:.1f} turns/s")
+    print(
+        f"latency:      p50 {latency['p50']:.1f}ms  p95 {latency['p95']:.1f}ms  "
+        f"p99 {latency['p99']:.1f}ms  max {latency['max']:.1f}ms"
+    )
+    print(f"cpu:          {result['cpu_ms_per_turn']:.2f}ms/turn")
+    print(f"rss growth:   {result['max_rss_growth_kb_per_turn']:.2f}KB/turn")
+    if "tracemalloc" in result:
+        print(f"allocated:    {result['tracemalloc']['bytes_per_turn']:.0f}B/turn")
+    print(f"upstream:     {result['upstream']}")
+    print(f"bot api:      {result['bot_api_calls']}")
+
+
+def main(argv=None) -> Dict[str, Any]:
+    args = parse_args(argv)
+    result = asyncio.run(run(args))
+    report(result)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=4)
+    return result
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""
+插件热点路径的微基准测试，支持保存基线并按阈值检查性能回退，全程离线。
+
+用法:
+    python test/benchmark/bench_micro.py                          # 运行并打印结果
+    python test/benchmark/bench_micro.py --save-baseline base.json
+    python test/benchmark/bench_micro.py --baseline base.json --threshold 0.25
+    python test/benchmark/bench_micro.py --history history.jsonl  # 追加一条记录，便于跟踪趋势
+    python test/benchmark/bench_micro.py -k session              # 只运行名称包含 session 的用例
+"""
+import argparse
+import asyncio
+import inspect
+import json
+import platform
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List, Literal
+
+from stubs import bot_context, init_plugin, make_bot, make_event
+
+BENCHMARKS: Dict[str, Callable[..., Any]] = {}
+
+
+def benchmark(name: str):
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+
+    return decorator
+
+
+class Fixtures:
+    """构造接近真实规模的测试数据"""
+
+    def __init__(self, plugin, args: argparse.Namespace):
+        from openai.types.chat import ChatCompletionMessage
+        from openai.types.completion_usage import CompletionUsage
+        from nonebot_plugin_openai.types import (
+            Preset,
+            Session,
+            ToolCallConfig,
+            ToolCallResponse,
+        )
+
+        self.plugin = plugin
+        self.preset = Preset(name="bench", prompt="你是一个乐于助人的助手。" * 20)
+        self.session = Session(id="bench_long", preset=self.preset, max_length=16)
+        for i in range(args.messages):
+            self.session.add_message(
+                {"role": "user" if i % 2 == 0 else "assistant", "content": f"消息 {i} " * 20}
+            )
+
+        settings = plugin.settings
+        settings.sessions.clear()
+        for i in range(args.sessions):
+            session = Session(id=f"group_{i // 50}_{i}", preset=self.preset)
+            for j in range(4):
+                session.add_message(
+                    {"role": "user" if j % 2 == 0 else "assistant", "content": f"hi {j}"}
+                )
+            settings.sessions[session.id] = session
+        settings.save()
+
+        def make_tool(index: int):
+            async def tool(
+                ctx,
+                keyword: str,
+                max_results: int = 3,
+                mode: Literal["fast", "slow"] = "fast",
+            ):
+                """
+                A benchmark tool.
+
+                Args:
+                    keyword (str): The keyword to search.
+                    max_results (int, optional): The maximum number of results.
+                    mode (Literal["fast", "slow"], optional): Search mode.
+                """
+
+            tool.__name__ = f"bench_tool_{index}"
+            return tool
+
+        self.tools = [make_tool(i) for i in range(args.tools)]
+        for tool in self.tools:
+            plugin.tools_func.register(tool, ToolCallConfig(name=tool.__name__))
+
+        self.bot = make_bot()
+        self.event = make_event("bench", user_id=1, group_id=2, images=3)
+        self.results = []
+        for i in range(20):
+            self.results.append(
+                ChatCompletionMessage(role="assistant", content=f"回复 {i}")
+            )
+            self.results.append(
+                ToolCallResponse(name="t", content_type="str", content=f"结果 {i}")
+            )
+            self.results.append(object())
+        self.results.append(
+            CompletionUsage(prompt_tokens=10, completion_tokens=10, total_tokens=20)
+        )
+
+
+def register_benchmarks(fx: Fixtures) -> None:
+    from nonebot_plugin_openai.utils import function_to_json_schema, get_message_imgs
+
+    plugin = fx.plugin
+
+    @benchmark("session.get_messages")
+    def _():
+        fx.session.get_messages()
+
+    @benchmark("settings.save")
+    def _():
+        plugin.settings.save()
+
+    @benchmark("settings.reload")
+    def _():
+        plugin.settings.reload()
+
+    @benchmark("utils.function_to_json_schema")
+    def _():
+        for tool in fx.tools:
+            function_to_json_schema(tool)
+
+    @benchmark("tools_func.tools_info")
+    def _():
+        plugin.tools_func.tools_info()
+
+    @benchmark("send_msg.partition")
+    async def _():
+        fx.bot.calls.clear()
+        with bot_context(fx.bot, fx.event):
+            await plugin.send_msg(fx.bot, fx.event, plugin.openai, list(fx.results))
+
+    @benchmark("utils.get_message_imgs")
+    def _():
+        get_message_imgs(fx.event)
+
+
+async def measure(func: Callable[..., Any], min_time: float, repeat: int) -> Dict[str, float]:
+    """自动确定每组的调用次数，使每组耗时不少于 min_time，返回每次调用的耗时（秒）"""
+    is_async = inspect.iscoroutinefunction(func)
+
+    async def run(number: int) -> float:
+        start = time.perf_counter()
+        for _ in range(number):
+            if is_async:
+                await func()
+            else:
+                func()
+        return time.perf_counter() - start
+
+    number = 1
+    while True:
+        elapsed = await run(number)
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 2 if elapsed == 0 else max(2, min(10, int(min_time / elapsed) + 1))
+    timings = [await run(number) / number for _ in range(repeat)]
+    return {
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "number": number,
+    }
+
+
+def compare(
+    results: Dict[str, Dict[str, float]], baseline: Dict[str, Any], threshold: float
+) -> List[str]:
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            continue
+        ratio = result["min"] / base["min"] if base["min"] else 1.0
+        if ratio > 1 + threshold:
+            regressions.append(
+                f"{name}: {base['min'] * 1e6:.1f}us -> {result['min'] * 1e6:.1f}us ({ratio:.2f}x)"
+            )
+    return regressions
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="插件热点路径微基准测试")
+    parser.add_argument("-k", "--filter", default="", help="只运行名称包含该字符串的用例")
+    parser.add_argument("--messages", type=int, default=5000, help="长会话的消息数")
+    parser.add_argument("--sessions", type=int, default=20000, help="settings.json 中的会话数")
+    parser.add_argument("--tools", type=int, default=40, help="注册的工具数量")
+    parser.add_argument("--min-time", type=float, default=0.2, help="每组最短耗时（秒）")
+    parser.add_argument("--repeat", type=int, default=5, help="重复组数")
+    parser.add_argument("--baseline", help="用于比较的基线文件")
+    parser.add_argument("--threshold", type=float, default=0.25, help="允许的最大变慢比例")
+    parser.add_argument("--save-baseline", help="把本次结果保存为基线")
+    parser.add_argument("--history", help="把本次结果追加到 JSON Lines 历史文件")
+    return parser.parse_args(argv)
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Dict[str, float]]:
+    plugin = init_plugin()
+    fx = Fixtures(plugin, args)
+    register_benchmarks(fx)
+    results = {}
+    for name, func in BENCHMARKS.items():
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = await measure(func, args.min_time, args.repeat)
+        print(
+            f"{name:<32} min {results[name]['min'] * 1e6:>12.1f}us"
+            f"  median {results[name]['median'] * 1e6:>12.1f}us"
+            f"  x{results[name]['number']}"
+        )
+    return results
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    results = asyncio.run(run(args))
+    record = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "params": {
+            "messages": args.messages,
+            "sessions": args.sessions,
+            "tools": args.tools,
+        },
+        "results": results,
+    }
+    if args.history:
+        with open(args.history, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(record, f, indent=4)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("params") != record["params"]:
+            print("warning: 基线的测试参数与本次不同，结果可能不可比")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"性能回退（阈值 {args.threshold:.0%}）:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"与基线相比没有超过 {args.threshold:.0%} 的回退")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
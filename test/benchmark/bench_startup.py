@@ -0,0 +1,171 @@
+"""
+启动基准测试：在子进程中冷启动插件，分别统计导入插件和执行 on_startup 的耗时，
+并用 -X importtime 找出导入插件时最耗时的模块。
+
+用法:
+    python test/benchmark/bench_startup.py                         # 运行并打印结果
+    python test/benchmark/bench_startup.py --sessions 20000        # 使用包含大量会话的 settings.json
+    python test/benchmark/bench_startup.py --save-baseline base.json
+    python test/benchmark/bench_startup.py --baseline base.json --threshold 0.25
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+MARKER = "--- load plugin ---"
+
+CHILD = """
+import asyncio, json, sys, time
+
+t0 = time.perf_counter()
+import nonebot
+from nonebot.adapters.onebot.v11 import Adapter
+
+nonebot.init(driver="~none", openai_data_path=sys.argv[1], log_level="WARNING")
+nonebot.get_driver().register_adapter(Adapter)
+t1 = time.perf_counter()
+print({marker!r}, file=sys.stderr, flush=True)
+nonebot.load_plugin("nonebot_plugin_openai")
+t2 = time.perf_counter()
+print({marker!r}, file=sys.stderr, flush=True)
+asyncio.run(nonebot.get_driver()._lifespan.startup())
+t3 = time.perf_counter()
+print(json.dumps({{"nonebot": t1 - t0, "import": t2 - t1, "startup": t3 - t2}}))
+""".format(
+    marker=MARKER
+)
+
+
+def make_data(path: str, sessions: int, messages: int) -> None:
+    """生成包含 sessions 个会话、每个会话 messages 条消息的 settings.json"""
+    data: Dict[str, Any] = {
+        "channels": [{"api_key": "sk-bench", "base_url": "http://127.0.0.1:1/v1"}],
+        "sessions": {},
+        "presets": {},
+    }
+    for i in range(sessions):
+        session_id = f"group_{i // 50}_{i}"
+        data["sessions"][session_id] = {
+            "id": session_id,
+            "messages": [
+                {"role": "user" if j % 2 == 0 else "assistant", "content": f"消息 {j}"}
+                for j in range(messages)
+            ],
+        }
+    with open(os.path.join(path, "settings.json"), "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """返回导入插件期间第一层导入的 (模块, 累计耗时 us, 层级)"""
+    parts = stderr.split(MARKER)
+    section = parts[1] if len(parts) > 2 else stderr
+    rows = []
+    for line in section.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)", line)
+        if match:
+            level = (len(match.group(3)) - 1) // 2
+            rows.append((match.group(4), int(match.group(2)), level))
+    return rows
+
+
+def run_once(data_path: str) -> Tuple[Dict[str, float], List[Tuple[str, int, int]]]:
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD, data_path],
+        capture_output=True,
+        text=True,
+        cwd=ROOT,
+        env=env,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr[-2000:])
+    timings = json.loads(proc.stdout.strip().splitlines()[-1])
+    return timings, parse_importtime(proc.stderr)
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="插件冷启动基准测试")
+    parser.add_argument("--runs", type=int, default=5, help="冷启动次数")
+    parser.add_argument("--sessions", type=int, default=0, help="settings.json 中的会话数")
+    parser.add_argument("--messages", type=int, default=8, help="每个会话的消息数")
+    parser.add_argument("--top", type=int, default=15, help="显示最耗时的模块数")
+    parser.add_argument("--baseline", help="用于比较的基线文件")
+    parser.add_argument("--threshold", type=float, default=0.25, help="允许的最大变慢比例")
+    parser.add_argument("--save-baseline", help="把本次结果保存为基线")
+    parser.add_argument("--json", help="把结果写入 JSON 文件")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    data_path = os.path.join(tempfile.mkdtemp(prefix="openai_startup_"), "")
+    if args.sessions:
+        make_data(data_path, args.sessions, args.messages)
+    runs: List[Dict[str, float]] = []
+    modules: Dict[str, List[int]] = {}
+    for _ in range(args.runs):
+        timings, rows = run_once(data_path)
+        runs.append(timings)
+        for name, cumulative, level in rows:
+            # 插件本身在第 0 层，统计它直接导入的模块和插件的子模块
+            if level <= 1 or name.startswith("nonebot_plugin_openai"):
+                modules.setdefault(name, []).append(cumulative)
+    results = {
+        key: statistics.median(run[key] for run in runs)
+        for key in ("nonebot", "import", "startup")
+    }
+    print(f"runs:          {args.runs}  sessions: {args.sessions}")
+    print(f"nonebot.init:  {results['nonebot'] * 1000:8.1f}ms")
+    print(f"import plugin: {results['import'] * 1000:8.1f}ms")
+    print(f"on_startup:    {results['startup'] * 1000:8.1f}ms")
+    top = sorted(
+        ((statistics.median(values), name) for name, values in modules.items()),
+        reverse=True,
+    )[: args.top]
+    print("导入插件时最耗时的模块（累计，中位数）:")
+    for cumulative, name in top:
+        print(f"  {cumulative / 1000:8.1f}ms  {name}")
+    record = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "params": {"sessions": args.sessions, "messages": args.messages},
+        "results": results,
+        "modules": {name: cumulative for cumulative, name in top},
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(record, f, indent=4)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(record, f, indent=4)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("params") != record["params"]:
+            print("warning: 基线的测试参数与本次不同，结果可能不可比")
+        regressions = []
+        for key, value in results.items():
+            base = baseline.get("results", {}).get(key)
+            if base and value / base > 1 + args.threshold:
+                regressions.append(
+                    f"{key}: {base * 1000:.1f}ms -> {value * 1000:.1f}ms ({value / base:.2f}x)"
+                )
+        if regressions:
+            print(f"性能回退（阈值 {args.threshold:.0%}）:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"与基线相比没有超过 {args.threshold:.0%} 的回退")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+"""
+共享状态基准测试：比较本地后端和 Redis 后端（本地回环上的 StubRedis）每轮对话的加锁、读取和写回耗时，
+并用两个模拟实例检查会话锁的互斥和会话数据的同步，全程离线。
+
+用法:
+    python test/benchmark/bench_state.py                   # 运行并打印结果
+    python test/benchmark/bench_state.py --latency 0.001   # 模拟 1ms 的 Redis 往返延迟
+    python test/benchmark/bench_state.py --turns 2000 --sessions 200
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from typing import Any, Dict, List
+
+from stubs import StubRedis, init_plugin, percentile
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="共享状态基准测试")
+    parser.add_argument("--turns", type=int, default=1000, help="每个后端模拟的对话轮数")
+    parser.add_argument("--sessions", type=int, default=100, help="会话数")
+    parser.add_argument("--messages", type=int, default=20, help="每个会话的消息数")
+    parser.add_argument("--latency", type=float, default=0.0, help="StubRedis 每条命令的延迟（秒）")
+    parser.add_argument("--contenders", type=int, default=20, help="同时争抢同一会话锁的协程数")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    return parser.parse_args(argv)
+
+
+async def run_turns(state, settings, args: argparse.Namespace) -> List[float]:
+    """模拟每轮对话的共享状态操作：加锁、读取会话、追加两条消息、写回、释放"""
+    from nonebot_plugin_openai.types import Session
+
+    latencies = []
+    for turn in range(args.turns):
+        session_id = f"group_{turn % args.sessions}"
+        start = time.perf_counter()
+        lease = await state.lock(session_id)
+        assert lease is not None, f"{session_id} 的锁未释放"
+        if state.remote:
+            await state.pull_session(settings, session_id)
+        session = settings.sessions.get(session_id)
+        if session is None:
+            session = settings.sessions[session_id] = Session(id=session_id)
+        session.add_message({"role": "user", "content": f"消息 {turn}"})
+        session.add_message({"role": "assistant", "content": f"回复 {turn}"})
+        session.messages[:] = session.messages[-args.messages :]
+        if state.remote:
+            state.push_settings(settings, session)
+        await lease.release()
+        latencies.append(time.perf_counter() - start)
+    await state.flush()
+    return latencies
+
+
+async def check_exclusive(instances, args: argparse.Namespace) -> Dict[str, Any]:
+    """多个协程分别通过两个实例争抢同一会话的锁，同一时刻最多一个持有者"""
+    holders = 0
+    max_holders = 0
+    acquired = 0
+
+    async def contend(state):
+        nonlocal holders, max_holders, acquired
+        lease = await state.lock("contended")
+        if lease is None:
+            return
+        acquired += 1
+        holders += 1
+        max_holders = max(max_holders, holders)
+        await asyncio.sleep(0.001)
+        holders -= 1
+        await lease.release()
+
+    await asyncio.gather(
+        *(contend(instances[i % 2][0]) for i in range(args.contenders))
+    )
+    return {"acquired": acquired, "max_holders": max_holders}
+
+
+async def check_sync(instances) -> bool:
+    """实例 0 写入的会话和预设，实例 1 获得锁后可以读到"""
+    from nonebot_plugin_openai.types import Preset, Session
+
+    (state_a, settings_a), (state_b, settings_b) = instances
+    if not state_a.remote:
+        return True
+    lease = await state_a.lock("sync")
+    session = settings_a.sessions["sync"] = Session(id="sync")
+    session.add_message({"role": "user", "content": "来自实例 0"})
+    settings_a.presets["bench"] = Preset(name="bench", prompt="同步的预设")
+    state_a.push_settings(settings_a, session)
+    await lease.release()
+    await state_a.flush()
+    lease = await state_b.lock("sync")
+    await state_b.pull_session(settings_b, "sync")
+    await lease.release()
+    synced = settings_b.sessions.get("sync")
+    return bool(
+        synced
+        and synced.messages[-1].content == "来自实例 0"
+        and "bench" in settings_b.presets
+    )
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Dict[str, Any]]:
+    init_plugin()
+    from nonebot_plugin_openai.settings import Settings
+    from nonebot_plugin_openai.state import LocalBackend, RedisBackend, SharedState
+
+    redis = await StubRedis(latency=args.latency).start()
+    local = LocalBackend()
+    backends = {
+        "local": lambda: [local, local],
+        "redis": lambda: [RedisBackend(redis.url), RedisBackend(redis.url)],
+    }
+    results: Dict[str, Dict[str, Any]] = {}
+    try:
+        for name, factory in backends.items():
+            instances = [
+                (
+                    SharedState(
+                        backend, prefix=f"bench_{name}", lock_ttl=5, owner=f"bench-{i}"
+                    ),
+                    Settings(),
+                )
+                for i, backend in enumerate(factory())
+            ]
+            commands = redis.commands
+            start = time.perf_counter()
+            latencies = await run_turns(*instances[0], args)
+            elapsed = time.perf_counter() - start
+            results[name] = {
+                "turns_per_s": args.turns / elapsed,
+                "p50_ms": percentile(latencies, 50) * 1000,
+                "p99_ms": percentile(latencies, 99) * 1000,
+                "commands_per_turn": (redis.commands - commands) / args.turns,
+                **await check_exclusive(instances, args),
+                "synced": await check_sync(instances),
+            }
+            for state, _ in instances:
+                await state.close()
+    finally:
+        await redis.stop()
+    return results
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    results = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    else:
+        for name, result in results.items():
+            print(
+                f"{name:<6} {result['turns_per_s']:>9.0f} 轮/秒  "
+                f"p50 {result['p50_ms']:.3f}ms  p99 {result['p99_ms']:.3f}ms  "
+                f"命令 {result['commands_per_turn']:.1f}/轮  "
+                f"锁 {result['acquired']}/{args.contenders} 最多 {result['max_holders']} 个持有者  "
+                f"同步 {'正常' if result['synced'] else '失败'}"
+            )
+    failed = any(r["max_holders"] > 1 or not r["synced"] for r in results.values())
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
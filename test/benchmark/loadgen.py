@@ -0,0 +1,211 @@
+"""
+负载生成器：模拟 N 个群 × M 个用户的消息流，经过 NoneBot 真实的事件分发
+（on_message 的 pre_check 和 openai 指令），在逐级提高的消息速率下输出饱和曲线。
+
+用法:
+    python test/benchmark/loadgen.py --groups 50 --users 20 --rates 20,50,100,200 --duration 5
+    python test/benchmark/loadgen.py --trigger-rate 0.1 --command-rate 0.05 --image-rate 0.1 \\
+        --tool-call-rate 0.2 --latency 0.5 --csv curve.csv
+"""
+import argparse
+import asyncio
+import csv
+import random
+import time
+from typing import Any, Dict, List
+
+from stubs import (
+    StubOpenAI,
+    init_plugin,
+    install_stub,
+    make_bot,
+    make_event,
+    percentile,
+    register_bench_tool,
+)
+
+TRIGGER = "小助手"
+CHATTER = ["哈哈哈", "今天吃什么", "有人打游戏吗", "晚安", "+1", "草", "早上好", "这是什么"]
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="合成消息负载生成器")
+    parser.add_argument("--groups", type=int, default=20, help="群数量")
+    parser.add_argument("--users", type=int, default=10, help="每个群的用户数量")
+    parser.add_argument("--private-rate", type=float, default=0.1, help="私聊消息占比")
+    parser.add_argument("--trigger-rate", type=float, default=0.1, help="包含预设名的消息占比")
+    parser.add_argument("--command-rate", type=float, default=0.02, help="/openai 指令占比")
+    parser.add_argument("--image-rate", type=float, default=0.05, help="附带图片的消息占比")
+    parser.add_argument("--tool-call-rate", type=float, default=0.1, help="回复包含工具调用的概率")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="上游返回 429 的概率")
+    parser.add_argument("--latency", type=float, default=0.3, help="上游基础延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.2, help="上游随机延迟上限（秒）")
+    parser.add_argument(
+        "--rates", default="10,20,50,100,200,500", help="逐级测试的消息速率（条/秒），逗号分隔"
+    )
+    parser.add_argument("--duration", type=float, default=5.0, help="每级持续时间（秒）")
+    parser.add_argument("--drain-timeout", type=float, default=30.0, help="每级结束后等待的最长时间")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--csv", help="把饱和曲线写入 CSV 文件")
+    return parser.parse_args(argv)
+
+
+class EventFactory:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.random = random.Random(args.seed)
+        self.counts: Dict[str, int] = {"trigger": 0, "command": 0, "chatter": 0}
+
+    def next(self):
+        args, rnd = self.args, self.random
+        group_id = None
+        if rnd.random() >= args.private_rate:
+            group_id = 100000 + rnd.randrange(args.groups)
+        user_id = 200000 + rnd.randrange(args.groups * args.users)
+        roll = rnd.random()
+        if roll < args.command_rate:
+            kind, text = "command", f"/openai {rnd.choice(CHATTER)}"
+        elif roll < args.command_rate + args.trigger_rate:
+            kind, text = "trigger", f"{TRIGGER} {rnd.choice(CHATTER)}"
+        else:
+            kind, text = "chatter", rnd.choice(CHATTER)
+        self.counts[kind] += 1
+        images = 1 if rnd.random() < args.image_rate else 0
+        return kind, make_event(text, user_id=user_id, group_id=group_id, images=images)
+
+
+async def run_level(
+    args: argparse.Namespace, bot, factory: EventFactory, rate: float
+) -> Dict[str, Any]:
+    from nonebot.message import handle_event
+
+    latencies: Dict[str, List[float]] = {"trigger": [], "command": [], "chatter": []}
+    tasks = set()
+    calls_before = len(bot.calls)
+
+    async def dispatch(kind: str, event):
+        start = time.perf_counter()
+        await handle_event(bot, event)
+        latencies[kind].append(time.perf_counter() - start)
+
+    interval = 1.0 / rate
+    start = time.perf_counter()
+    cpu_before = time.process_time()
+    sent = 0
+    max_in_flight = 0
+    lag = 0.0
+    while time.perf_counter() - start < args.duration:
+        kind, event = factory.next()
+        task = asyncio.ensure_future(dispatch(kind, event))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        sent += 1
+        max_in_flight = max(max_in_flight, len(tasks))
+        delay = start + sent * interval - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        else:
+            lag = max(lag, -delay)
+            await asyncio.sleep(0)
+    dispatched_in = time.perf_counter() - start
+    if tasks:
+        await asyncio.wait(set(tasks), timeout=args.drain_timeout)
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_before
+    turns = latencies["trigger"] + latencies["command"]
+    return {
+        "offered_rate": rate,
+        "achieved_rate": sent / dispatched_in if dispatched_in else 0.0,
+        "events": sent,
+        "unfinished": len(tasks),
+        "turns": len(turns),
+        "turns_per_s": len(turns) / elapsed if elapsed else 0.0,
+        "turn_p50_ms": percentile(turns, 50) * 1000,
+        "turn_p95_ms": percentile(turns, 95) * 1000,
+        "turn_p99_ms": percentile(turns, 99) * 1000,
+        "chatter_p95_ms": percentile(latencies["chatter"], 95) * 1000,
+        "max_in_flight": max_in_flight,
+        "dispatch_lag_ms": lag * 1000,
+        "cpu_util": cpu / elapsed if elapsed else 0.0,
+        "bot_calls": len(bot.calls) - calls_before,
+    }
+
+
+async def run(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    plugin = init_plugin()
+    from nonebot_plugin_openai.types import Preset
+
+    stub = StubOpenAI(
+        latency=args.latency,
+        jitter=args.jitter,
+        tool_call_rate=args.tool_call_rate,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    install_stub(plugin, stub)
+    register_bench_tool(plugin)
+    preset = Preset(name=TRIGGER, prompt="你是一个乐于助人的群聊助手。")
+    plugin.settings.presets[preset.name] = preset
+    plugin.settings.default_preset = preset
+    plugin.settings.refresh_trigger()
+    bot = make_bot()
+    factory = EventFactory(args)
+    curve = []
+    for rate in (float(rate) for rate in args.rates.split(",")):
+        row = await run_level(args, bot, factory, rate)
+        row["sessions"] = len(plugin.settings.sessions)
+        row["upstream_requests"] = stub.requests
+        curve.append(row)
+        print_row(row, header=len(curve) == 1)
+    return curve
+
+
+COLUMNS = [
+    ("offered_rate", "offered/s", "{:>9.0f}"),
+    ("achieved_rate", "sent/s", "{:>8.1f}"),
+    ("turns_per_s", "turns/s", "{:>8.1f}"),
+    ("turn_p50_ms", "p50ms", "{:>8.0f}"),
+    ("turn_p95_ms", "p95ms", "{:>8.0f}"),
+    ("turn_p99_ms", "p99ms", "{:>8.0f}"),
+    ("chatter_p95_ms", "idle95ms", "{:>8.1f}"),
+    ("max_in_flight", "inflight", "{:>8d}"),
+    ("dispatch_lag_ms", "lagms", "{:>8.0f}"),
+    ("cpu_util", "cpu", "{:>6.0%}"),
+    ("unfinished", "stuck", "{:>6d}"),
+    ("sessions", "sessions", "{:>8d}"),
+]
+
+
+def print_row(row: Dict[str, Any], header: bool = False) -> None:
+    if header:
+        print(" ".join(f"{title:>{len(fmt.format(0))}}" for _, title, fmt in COLUMNS))
+    print(" ".join(fmt.format(row[key]) for key, _, fmt in COLUMNS))
+
+
+def saturation_point(curve: List[Dict[str, Any]]) -> Any:
+    """消息发送速率跟不上、有未完成的轮次或 CPU 接近满载时视为饱和"""
+    for row in curve:
+        if (
+            row["achieved_rate"] < row["offered_rate"] * 0.9
+            or row["unfinished"]
+            or row["cpu_util"] > 0.9
+        ):
+            return row["offered_rate"]
+    return None
+
+
+def main(argv=None) -> List[Dict[str, Any]]:
+    args = parse_args(argv)
+    curve = asyncio.run(run(args))
+    point = saturation_point(curve)
+    print(f"saturation: {f'{point:.0f} msg/s' if point else 'not reached'}")
+    if args.csv:
+        with open(args.csv, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=list(curve[0].keys()))
+            writer.writeheader()
+            writer.writerows(curve)
+    return curve
+
+
+if __name__ == "__main__":
+    main()
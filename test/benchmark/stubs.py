@@ -0,0 +1,433 @@
+"""
+基准测试使用的本地桩：进程内的 OpenAI 接口、Redis 服务、记录调用的 OneBot Bot 和事件构造函数。
+
+不会访问网络，也不会使用真实的 OneBot 实现端，所有数据写入临时文件夹。
+"""
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT))
+
+
+def init_plugin(data_path: Optional[str] = None, **config: Any):
+    """
+    以 none 驱动初始化 NoneBot 并加载插件。
+
+    参数:
+        data_path (Optional[str]): 插件数据文件夹，默认为新的临时文件夹。
+        **config: 其他 NoneBot 配置项。
+
+    返回:
+        module: 加载后的 nonebot_plugin_openai 模块。
+    """
+    import nonebot
+    from nonebot.adapters.onebot.v11 import Adapter
+
+    data_path = data_path or tempfile.mkdtemp(prefix="openai_bench_")
+    nonebot.init(
+        driver="~none",
+        openai_data_path=os.path.join(data_path, ""),
+        log_level=config.pop("log_level", "WARNING"),
+        **config,
+    )
+    nonebot.get_driver().register_adapter(Adapter)
+    nonebot.load_plugin("nonebot_plugin_openai")
+    import nonebot_plugin_openai
+
+    return nonebot_plugin_openai
+
+
+class StubOpenAI:
+    """
+    StubOpenAI 是进程内的 chat/completions 桩，通过 httpx.MockTransport 挂到插件的 http_client 上。
+
+    Attributes:
+        latency (float): 每次请求的基础延迟（秒）。
+
+        jitter (float): 在基础延迟上增加的随机延迟上限（秒）。
+
+        completion_tokens (int): 每次回复的 token 数，回复内容为同样数量的词。
+
+        tool_call_rate (float): 回复中包含工具调用的概率。
+
+        tool_name (str): 工具调用使用的函数名。
+
+        error_rate (float): 返回 429 的概率。
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.05,
+        jitter: float = 0.0,
+        completion_tokens: int = 32,
+        tool_call_rate: float = 0.0,
+        tool_name: str = "bench_echo",
+        error_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.completion_tokens = completion_tokens
+        self.tool_call_rate = tool_call_rate
+        self.tool_name = tool_name
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self.tool_calls = 0
+
+    @property
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        await asyncio.sleep(self.latency + self.random.random() * self.jitter)
+        if self.random.random() < self.error_rate:
+            self.errors += 1
+            return httpx.Response(
+                429, json={"error": {"message": "Rate limit reached", "type": "requests"}}
+            )
+        path = request.url.path
+        if path.endswith("/models"):
+            return httpx.Response(200, json={"object": "list", "data": []})
+        if path.endswith("/embeddings"):
+            body = json.loads(request.content)
+            inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+            return httpx.Response(
+                200,
+                json={
+                    "object": "list",
+                    "model": body["model"],
+                    "data": [
+                        {"object": "embedding", "index": i, "embedding": [1.0, 0.0]}
+                        for i in range(len(inputs))
+                    ],
+                    "usage": {"prompt_tokens": 1, "total_tokens": 1},
+                },
+            )
+        body = json.loads(request.content)
+        prompt_tokens = len(request.content) // 4
+        message: Dict[str, Any] = {"role": "assistant"}
+        last = body["messages"][-1]
+        if (
+            body.get("tools")
+            and last.get("role") != "tool"
+            and self.random.random() < self.tool_call_rate
+        ):
+            self.tool_calls += 1
+            message["content"] = None
+            message["tool_calls"] = [
+                {
+                    "id": f"call_{self.requests}",
+                    "type": "function",
+                    "function": {
+                        "name": self.tool_name,
+                        "arguments": json.dumps({"text": "ping"}),
+                    },
+                }
+            ]
+            finish_reason = "tool_calls"
+        else:
+            message["content"] = " ".join(["token"] * self.completion_tokens)
+            finish_reason = "stop"
+        return httpx.Response(
+            200,
+            json={
+                "id": f"chatcmpl-{self.requests}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", ""),
+                "choices": [
+                    {"index": 0, "finish_reason": finish_reason, "message": message}
+                ],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": self.completion_tokens,
+                    "total_tokens": prompt_tokens + self.completion_tokens,
+                },
+            },
+        )
+
+
+class StubRedis:
+    """
+    StubRedis 是本地回环上的 Redis 桩，只实现插件共享状态用到的命令，数据保存在内存中。
+
+    EVAL 只识别插件续期和释放会话锁的两个脚本。
+
+    Attributes:
+        latency (float): 每条命令的延迟（秒），用于模拟网络往返。
+
+        url (str): 启动后的连接地址。
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.values: Dict[str, Any] = {}
+        self.expires: Dict[str, float] = {}
+        self.commands = 0
+        self.writers: List[asyncio.StreamWriter] = []
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.url = ""
+
+    async def start(self) -> "StubRedis":
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        self.url = f"redis://127.0.0.1:{self.server.sockets[0].getsockname()[1]}/0"
+        return self
+
+    async def stop(self) -> None:
+        if self.server:
+            self.server.close()
+            # 关闭客户端连接，让连接处理协程正常退出
+            for writer in self.writers:
+                writer.close()
+            while self.writers:
+                await asyncio.sleep(0.01)
+            await self.server.wait_closed()
+
+    def alive(self, key: str) -> bool:
+        expires = self.expires.get(key)
+        if expires is not None and expires <= time.monotonic():
+            self.values.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.values
+
+    @staticmethod
+    def encode(value: Any) -> bytes:
+        if value is None:
+            return b"$-1\r\n"
+        if isinstance(value, Exception):
+            return f"-ERR {value}\r\n".encode()
+        if isinstance(value, bool):
+            value = int(value)
+        if isinstance(value, int):
+            return f":{value}\r\n".encode()
+        if isinstance(value, list):
+            return f"*{len(value)}\r\n".encode() + b"".join(
+                StubRedis.encode(item) for item in value
+            )
+        if value == "OK":
+            return b"+OK\r\n"
+        data = value.encode("utf-8")
+        return f"${len(data)}\r\n".encode() + data + b"\r\n"
+
+    def execute(self, args: List[str]) -> Any:
+        from nonebot_plugin_openai.state import RELEASE_SCRIPT, RENEW_SCRIPT
+
+        self.commands += 1
+        name = args[0].upper()
+        if name in ("AUTH", "SELECT"):
+            return "OK"
+        if name == "PING":
+            return "PONG"
+        if name == "GET":
+            return self.values.get(args[1]) if self.alive(args[1]) else None
+        if name == "SET":
+            key, value, options = args[1], args[2], [a.upper() for a in args[3:]]
+            if "NX" in options and self.alive(key):
+                return None
+            self.values[key] = value
+            self.expires.pop(key, None)
+            if "PX" in options:
+                ttl = int(args[options.index("PX") + 4])
+                self.expires[key] = time.monotonic() + ttl / 1000
+            return "OK"
+        if name == "DEL":
+            deleted = [key for key in args[1:] if self.alive(key)]
+            for key in deleted:
+                self.values.pop(key)
+                self.expires.pop(key, None)
+            return len(deleted)
+        if name in ("HGET", "HSET", "HGETALL", "HDEL"):
+            table = self.values.setdefault(args[1], {})
+            if name == "HGET":
+                return table.get(args[2])
+            if name == "HSET":
+                created = args[2] not in table
+                table[args[2]] = args[3]
+                return int(created)
+            if name == "HDEL":
+                return 1 if table.pop(args[2], None) is not None else 0
+            return [item for pair in table.items() for item in pair]
+        if name == "EVAL":
+            script, key, owner = args[1], args[3], args[4]
+            if not self.alive(key) or self.values[key] != owner:
+                return 0
+            if script == RENEW_SCRIPT:
+                self.expires[key] = time.monotonic() + int(args[5]) / 1000
+                return 1
+            if script == RELEASE_SCRIPT:
+                self.values.pop(key)
+                self.expires.pop(key, None)
+                return 1
+        return Exception(f"unsupported command {name}")
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.writers.append(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                args = []
+                for _ in range(int(line[1:-2])):
+                    size = int((await reader.readline())[1:-2])
+                    args.append((await reader.readexactly(size + 2))[:-2].decode("utf-8"))
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                writer.write(self.encode(self.execute(args)))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.writers.remove(writer)
+            writer.close()
+
+
+def install_stub(plugin, stub: StubOpenAI) -> None:
+    """把插件的上游请求全部转到 stub"""
+    plugin.openai_client.http_client = httpx.AsyncClient(
+        transport=stub.transport, follow_redirects=True
+    )
+
+
+def register_bench_tool(plugin, name: str = "bench_echo") -> None:
+    from nonebot_plugin_openai.types import ToolCallConfig, ToolCallResponse
+
+    async def bench_echo(text: str, ctx=None):
+        """
+        Echo the text back.
+
+        Args:
+            text (str): The text to echo.
+        """
+        return ToolCallResponse(name=name, content_type="str", content=text, data=text)
+
+    bench_echo.__name__ = name
+    plugin.tools_func.register(bench_echo, ToolCallConfig(name="Bench"))
+
+
+def make_bot(self_id: str = "10000", superusers: Optional[List[str]] = None):
+    """创建记录所有 call_api 调用的 Bot"""
+    import nonebot
+    from nonebot.adapters.onebot.v11 import Adapter, Bot
+
+    class FakeBot(Bot):
+        def __init__(self, adapter: Adapter, self_id: str):
+            super().__init__(adapter, self_id)
+            self.calls: List[Dict[str, Any]] = []
+
+        async def call_api(self, api: str, **data: Any) -> Any:
+            self.calls.append({"api": api, "data": data, "time": time.perf_counter()})
+            return {"message_id": len(self.calls)}
+
+    adapter = nonebot.get_adapter(Adapter)
+    if superusers is not None:
+        adapter.config.superusers = set(superusers)
+    return FakeBot(adapter, self_id)
+
+
+_message_id = 0
+
+
+def next_message_id() -> int:
+    global _message_id
+    _message_id += 1
+    return _message_id
+
+
+def make_event(
+    text: str,
+    user_id: int = 20000,
+    group_id: Optional[int] = None,
+    images: int = 0,
+    self_id: int = 10000,
+    message_id: Optional[int] = None,
+):
+    """
+    构造 OneBot v11 消息事件。
+
+    参数:
+        text (str): 消息文本。
+        user_id (int): 发送者 QQ。
+        group_id (Optional[int]): 群号，为 None 时构造私聊消息。
+        images (int): 附带的图片数量。
+        self_id (int): 机器人 QQ。
+        message_id (Optional[int]): 消息 ID，默认自增。
+
+    返回:
+        MessageEvent: GroupMessageEvent 或 PrivateMessageEvent。
+    """
+    from nonebot.adapters.onebot.v11 import (
+        GroupMessageEvent,
+        Message,
+        MessageSegment,
+        PrivateMessageEvent,
+    )
+
+    message = Message(text)
+    for i in range(images):
+        url = f"https://example.invalid/{user_id}/{i}.png"
+        message += MessageSegment("image", {"file": url, "url": url})
+    data = {
+        "time": int(time.time()),
+        "self_id": self_id,
+        "post_type": "message",
+        "sub_type": "normal" if group_id else "friend",
+        "user_id": user_id,
+        "message_id": message_id or next_message_id(),
+        "message": message,
+        "original_message": message,
+        "raw_message": str(message),
+        "font": 0,
+        "sender": {"user_id": user_id, "nickname": f"user{user_id}"},
+    }
+    if group_id:
+        return GroupMessageEvent(message_type="group", group_id=group_id, **data)
+    return PrivateMessageEvent(message_type="private", **data)
+
+
+@contextmanager
+def bot_context(bot, event):
+    """设置 Matcher.send 依赖的上下文变量"""
+    from nonebot.internal.matcher import current_bot, current_event
+
+    bot_token = current_bot.set(bot)
+    event_token = current_event.set(event)
+    try:
+        yield
+    finally:
+        current_event.reset(event_token)
+        current_bot.reset(bot_token)
+
+
+async def drain() -> None:
+    """等待 handle_chat 中 ensure_future 创建的发送任务结束"""
+    current = asyncio.current_task()
+    while True:
+        pending = [
+            task for task in asyncio.all_tasks() if task is not current and not task.done()
+        ]
+        if not pending:
+            return
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(q / 100 * (len(values) - 1))))
+    return values[index]
@@ -0,0 +1,17 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import nonebot
+from nonebot.adapters.onebot.v11 import Adapter
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+# 插件在导入时读取配置，需要先以 none 驱动初始化 NoneBot，数据写入临时文件夹
+nonebot.init(
+    driver="~none",
+    openai_data_path=os.path.join(tempfile.mkdtemp(prefix="openai_test_"), ""),
+)
+nonebot.get_driver().register_adapter(Adapter)
+nonebot.load_plugin("nonebot_plugin_openai")
@@ -0,0 +1,59 @@
+from types import SimpleNamespace
+
+import pytest
+
+from nonebot_plugin_openai import cache
+from nonebot_plugin_openai.cache import ResponseCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(cache, "time", SimpleNamespace(time=lambda: now.value))
+    return now
+
+
+def test_ttl_expiry(clock):
+    response_cache = ResponseCache(ttl=60)
+    response_cache.put("", "gpt", "你好", "你好！")
+    clock.value += 59
+    assert response_cache.get("", "gpt", "你好") == "你好！"
+    clock.value += 2
+    assert response_cache.get("", "gpt", "你好") is None
+    assert response_cache.stats()["size"] == 0
+
+
+def test_preset_ttl_overrides_default(clock):
+    response_cache = ResponseCache(ttl=60)
+    response_cache.put("", "gpt", "a", "A", ttl=600)
+    response_cache.put("", "gpt", "b", "B", ttl=0)
+    clock.value += 300
+    assert response_cache.get("", "gpt", "a") == "A"
+    assert response_cache.get("", "gpt", "b") is None
+
+
+def test_keyed_by_preset_and_model(clock):
+    response_cache = ResponseCache()
+    response_cache.put("猫娘", "gpt", "你是谁", "我是猫娘")
+    response_cache.put("助手", "gpt", "你是谁", "我是助手")
+    assert response_cache.get("猫娘", "gpt", "你是谁") == "我是猫娘"
+    assert response_cache.get("助手", "gpt", "你是谁") == "我是助手"
+    assert response_cache.get("", "gpt", "你是谁") is None
+    assert response_cache.get("猫娘", "gpt-4", "你是谁") is None
+
+
+def test_normalize_keeps_punctuation(clock):
+    response_cache = ResponseCache()
+    response_cache.put("", "gpt", "  What is  C++? ", "A language")
+    assert response_cache.get("", "gpt", "what is c++?") == "A language"
+    assert response_cache.get("", "gpt", "what is c?") is None
+
+
+def test_lru_eviction(clock):
+    response_cache = ResponseCache(max_size=2)
+    response_cache.put("", "gpt", "a", "A")
+    response_cache.put("", "gpt", "b", "B")
+    assert response_cache.get("", "gpt", "a") == "A"
+    response_cache.put("", "gpt", "c", "C")
+    assert response_cache.get("", "gpt", "b") is None
+    assert response_cache.get("", "gpt", "a") == "A"
@@ -0,0 +1,77 @@
+from nonebot_plugin_openai.capability import (
+    VISION_CAPABILITY,
+    CapabilityRegistry,
+    fit_window,
+)
+from nonebot_plugin_openai.types import Channel, ChatMessage, ModelCapability
+from nonebot_plugin_openai.utils import message_tokens
+
+
+def test_builtin_prefix():
+    registry = CapabilityRegistry()
+    capability = registry.resolve(Channel(api_key="sk-"), "gpt-4-0613")
+    assert capability.tools and not capability.vision
+    assert capability.max_context == 8192
+
+
+def test_unknown_vision_model_falls_back_to_vision_preview():
+    registry = CapabilityRegistry()
+    for model in ("gpt-4-1106-vision-preview", "relay-vision-model"):
+        capability = registry.resolve(Channel(api_key="sk-"), model)
+        assert not capability.tools
+        assert capability.vision
+        assert capability.max_output == VISION_CAPABILITY.max_output
+
+
+def test_declared_capability_overrides_vision_fallback():
+    registry = CapabilityRegistry()
+    channel = Channel(
+        api_key="sk-",
+        models={"relay-vision-model": ModelCapability(tools=True, max_output=4096)},
+    )
+    capability = registry.resolve(channel, "relay-vision-model")
+    assert capability.tools
+    assert capability.vision
+    assert capability.max_output == 4096
+
+
+def make_messages(count: int, size: int = 40):
+    return [
+        ChatMessage(role="user" if i % 2 == 0 else "assistant", content="x" * size)
+        for i in range(count)
+    ]
+
+
+def test_fit_window_keeps_messages_within_budget():
+    messages = make_messages(4)
+    assert fit_window(messages, 10000) is messages
+
+
+def test_fit_window_drops_oldest_messages():
+    messages = make_messages(10)
+    tokens = [message_tokens(message) for message in messages]
+    budget = sum(tokens[-3:])
+    window = fit_window(messages, budget)
+    assert window == messages[-3:]
+    assert sum(map(message_tokens, window)) <= budget
+
+
+def test_fit_window_keeps_last_message():
+    messages = make_messages(3, size=4000)
+    assert fit_window(messages, 10) == messages[-1:]
+
+
+def test_fit_window_does_not_start_with_tool_result():
+    messages = [
+        ChatMessage(role="user", content="x" * 400),
+        ChatMessage(
+            role="assistant",
+            tool_calls=[{"id": "1", "type": "function", "function": {"name": "f"}}],
+        ),
+        ChatMessage(role="tool", tool_call_id="1", content="y" * 40),
+        ChatMessage(role="assistant", content="z" * 40),
+    ]
+    budget = sum(message_tokens(message) for message in messages[1:]) - 1
+    window = fit_window(messages, budget)
+    assert window[0].role != "tool"
+    assert window == messages[3:]
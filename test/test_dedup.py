@@ -0,0 +1,67 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from nonebot_plugin_openai import dedup
+from nonebot_plugin_openai.dedup import DEDUP_STATE_KEY, EventDeduplicator
+
+
+def make_event(message_id: int):
+    return SimpleNamespace(message_id=message_id)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(dedup, "time", SimpleNamespace(monotonic=lambda: now.value))
+    return now
+
+
+def test_same_event_accepted_once(clock):
+    deduplicator = EventDeduplicator()
+    assert deduplicator.check("10000", make_event(1))
+    assert not deduplicator.check("10000", make_event(1))
+    assert not deduplicator.check("10000", make_event(1))
+    assert deduplicator.duplicates == 2
+    assert deduplicator.check("10000", make_event(2))
+
+
+def test_keyed_by_bot(clock):
+    deduplicator = EventDeduplicator()
+    assert deduplicator.check("10000", make_event(1))
+    assert deduplicator.check("10001", make_event(1))
+
+
+def test_window_expiry(clock):
+    deduplicator = EventDeduplicator(window=300)
+    assert deduplicator.check("10000", make_event(1))
+    clock.value += 299
+    assert not deduplicator.check("10000", make_event(1))
+    clock.value += 2
+    assert deduplicator.check("10000", make_event(1))
+    assert len(deduplicator.entries) == 1
+
+
+def test_max_size(clock):
+    deduplicator = EventDeduplicator(max_size=2)
+    for message_id in (1, 2, 3):
+        assert deduplicator.check("10000", make_event(message_id))
+    assert len(deduplicator.entries) == 2
+    assert deduplicator.check("10000", make_event(1))
+
+
+def test_disabled(clock):
+    deduplicator = EventDeduplicator(window=0)
+    assert deduplicator.check("10000", make_event(1))
+    assert deduplicator.check("10000", make_event(1))
+    assert not deduplicator.entries
+
+
+def test_rule_reads_state():
+    from nonebot_plugin_openai import not_duplicate
+
+    assert asyncio.run(not_duplicate({DEDUP_STATE_KEY: True}))
+    assert not asyncio.run(not_duplicate({DEDUP_STATE_KEY: False}))
+    # 没有经过预处理的事件视为需要处理
+    assert asyncio.run(not_duplicate({}))
@@ -0,0 +1,163 @@
+import asyncio
+import sys
+from pathlib import Path
+
+from nonebot_plugin_openai.state import (
+    LocalBackend,
+    RedisBackend,
+    SharedState,
+    StateError,
+)
+
+sys.path.insert(0, str(Path(__file__).parent / "benchmark"))
+from stubs import StubRedis  # noqa: E402
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def with_redis(test, latency: float = 0.0):
+    redis = await StubRedis(latency=latency).start()
+    backend = RedisBackend(redis.url)
+    try:
+        return await test(redis, backend)
+    finally:
+        await backend.close()
+        await redis.stop()
+
+
+def test_encode():
+    assert RedisBackend.encode(("SET", "k", "值", 5)) == (
+        b"*4\r\n$3\r\nSET\r\n$1\r\nk\r\n$3\r\n\xe5\x80\xbc\r\n$1\r\n5\r\n"
+    )
+
+
+def test_read_reply():
+    async def test():
+        backend = RedisBackend("redis://127.0.0.1:6379/0")
+        backend.reader = asyncio.StreamReader()
+        backend.reader.feed_data(
+            b"+OK\r\n-ERR wrong\r\n:42\r\n$6\r\n\xe4\xbd\xa0\xe5\xa5\xbd\r\n"
+            b"$-1\r\n*3\r\n$1\r\na\r\n:1\r\n$-1\r\n*-1\r\n$0\r\n\r\n"
+        )
+        replies = [await backend.read_reply() for _ in range(7)]
+        assert replies[0] == "OK"
+        assert isinstance(replies[1], StateError) and str(replies[1]) == "ERR wrong"
+        assert replies[2:] == [42, "你好", None, ["a", 1, None], None]
+        assert await backend.read_reply() == ""
+        backend.reader.feed_data(b"?bad\r\n")
+        try:
+            await backend.read_reply()
+        except StateError:
+            pass
+        else:
+            raise AssertionError("未知的回复类型应当报错")
+
+    run(test())
+
+
+def test_url():
+    backend = RedisBackend("redis://:p%40ss@redis.local:6380/2")
+    assert (backend.host, backend.port, backend.password, backend.db) == (
+        "redis.local",
+        6380,
+        "p@ss",
+        2,
+    )
+
+
+def test_commands_round_trip():
+    async def test(redis, backend):
+        await backend.set("k", "值")
+        await backend.hset("h", "a", "1")
+        await backend.hset("h", "b", "2")
+        assert await backend.get("k") == "值"
+        assert await backend.get("missing") is None
+        assert await backend.hgetall("h") == {"a": "1", "b": "2"}
+        assert await backend.get_and_hget("k", "h", "b") == ("值", "2")
+        await backend.hdel("h", "a")
+        assert await backend.hget("h", "a") is None
+
+    run(with_redis(test))
+
+
+def test_cancelled_request_does_not_desync_replies():
+    async def test(redis, backend):
+        await backend.set("a", "A")
+        await backend.set("b", "B")
+        task = asyncio.ensure_future(backend.get("a"))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        assert await backend.get("b") == "B"
+        assert await backend.get("a") == "A"
+
+    run(with_redis(test, latency=0.05))
+
+
+def test_lease_is_exclusive_and_kept_alive():
+    async def test(redis, backend):
+        other_backend = RedisBackend(redis.url)
+        state = SharedState(backend, prefix="t", lock_ttl=0.3, owner="a")
+        other = SharedState(other_backend, prefix="t", lock_ttl=0.3, owner="b")
+        try:
+            lease = await state.lock("s")
+            assert lease is not None
+            # 超过 ttl 后仍由续期保持
+            await asyncio.sleep(0.8)
+            assert not lease.lost
+            assert state.holds("s")
+            assert await other.lock("s") is None
+            await state.unlock("s", lease)
+            other_lease = await other.lock("s")
+            assert other_lease is not None
+            await other_lease.release()
+        finally:
+            await other_backend.close()
+
+    run(with_redis(test))
+
+
+def test_lease_lost_when_renewal_fails():
+    async def test(redis, backend):
+        state = SharedState(backend, prefix="t", lock_ttl=0.3, owner="a")
+        lease = await state.lock("s")
+
+        async def renew(key, owner, ttl):
+            raise StateError("Redis 不可用")
+
+        backend.renew = renew
+        assert not lease.lost
+        await asyncio.sleep(0.4)
+        assert lease.lost
+        assert not state.holds("s")
+        await state.unlock("s", lease)
+
+    run(with_redis(test))
+
+
+def test_lease_revoked_when_taken_over():
+    async def test(redis, backend):
+        state = SharedState(backend, prefix="t", lock_ttl=0.3, owner="a")
+        lease = await state.lock("s")
+        redis.values[state.key("lock", "s")] = "b"
+        await asyncio.sleep(0.2)
+        assert lease.revoked and lease.lost
+        await lease.release()
+        # 释放时不会删除其他实例的锁
+        assert redis.values[state.key("lock", "s")] == "b"
+
+    run(with_redis(test))
+
+
+def test_local_backend_lease_expires():
+    async def test():
+        backend = LocalBackend()
+        assert await backend.acquire("k", "a", 0.05)
+        assert not await backend.acquire("k", "b", 0.05)
+        await asyncio.sleep(0.06)
+        assert not await backend.renew("k", "a", 0.05)
+        assert await backend.acquire("k", "b", 0.05)
+
+    run(test())
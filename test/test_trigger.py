@@ -0,0 +1,34 @@
+from nonebot_plugin_openai.settings import Settings
+from nonebot_plugin_openai.trigger import TriggerMatcher
+from nonebot_plugin_openai.types import Preset, Session
+
+
+def test_overlapping_names():
+    matcher = TriggerMatcher(["he", "she", "his", "hers"])
+    assert matcher.search("ushers") == {"she", "he", "hers"}
+    assert matcher.search("this") == {"his"}
+
+
+def test_prefix_names():
+    matcher = TriggerMatcher(["猫", "猫娘", "猫娘助手"])
+    assert matcher.search("你好猫娘") == {"猫", "猫娘"}
+    assert matcher.search("猫娘助手在吗") == {"猫", "猫娘", "猫娘助手"}
+    assert matcher.search("小狗") == set()
+
+
+def test_empty_and_rebuild():
+    matcher = TriggerMatcher(["", "a"])
+    assert matcher.names == {"a"}
+    matcher.build(["b"])
+    assert matcher.search("ab") == {"b"}
+    assert TriggerMatcher().search("anything") == set()
+
+
+def test_settings_refresh_trigger_on_preset_changes():
+    settings = Settings(sessions={}, presets={})
+    settings.sessions["s"] = Session(id="s", preset=Preset(name="猫娘", prompt="喵"))
+    assert settings.trigger.names == {"猫娘"}
+    settings.add_preset("助手", "你好")
+    settings.sessions["s"].preset = settings.get_preset("助手")
+    settings.del_preset("猫娘")
+    assert settings.trigger.names == {"助手"}
@@ -0,0 +1,51 @@
+from nonebot_plugin_openai.settings import Settings
+from nonebot_plugin_openai.types import ChatMessage, Preset, Session
+
+
+def make_session() -> Session:
+    session = Session(id="group_1_2", preset=Preset(name="猫娘", prompt="喵"))
+    session.add_message({"role": "user", "content": "你好"})
+    session.add_message(
+        {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [
+                {
+                    "id": "call_1",
+                    "type": "function",
+                    "function": {"name": "tts", "arguments": '{"input":"你好"}'},
+                }
+            ],
+        }
+    )
+    session.add_message(
+        {"role": "tool", "tool_call_id": "call_1", "name": "tts", "content": "ok"}
+    )
+    return session
+
+
+def test_chat_message_slots():
+    message = ChatMessage(role="user", content="hi")
+    assert not hasattr(message, "__dict__")
+    assert message.param == {"role": "user", "content": "hi"}
+    assert ChatMessage.parse(message) is message
+
+
+def test_session_json_round_trip():
+    session = make_session()
+    restored = Session.parse_raw(session.json(exclude_none=True))
+    assert all(isinstance(message, ChatMessage) for message in restored.messages)
+    assert [message.param for message in restored.messages] == [
+        ChatMessage.parse(message).param for message in session.messages
+    ]
+    assert restored.messages[1].tool_calls[0]["id"] == "call_1"
+    assert restored.messages[2].tool_call_id == "call_1"
+    assert restored.preset.name == "猫娘"
+
+
+def test_settings_json_round_trip():
+    settings = Settings(sessions={"group_1_2": make_session()})
+    restored = Settings.parse_raw(settings.json(exclude_none=True))
+    assert restored.sessions["group_1_2"].messages[0].serialized == (
+        '{"role":"user","content":"你好"}'
+    )